@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+
+from services.cache import balance_cache
+from storage.database import async_engine
+
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+
+@router.get("/balance-cache")
+async def get_balance_cache_stats() -> dict[str, int | float]:
+    """
+    Returns balance cache counters (hits, misses, hit rate, invalidations, size) of the worker process
+    which handled the request.
+    """
+    return balance_cache.get_stats()
+
+
+@router.get("/db-pool")
+async def get_db_pool_stats() -> dict[str, int | float]:
+    """
+    Returns database connection pool statistics (connections checked out, overflow, time spent waiting
+    for a connection) of the worker process which handled the request.
+    """
+    return async_engine.pool.get_stats()
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
-from models.information import UserAccountOut
+from models.information import AccountTransactionsPageOut, CompanyAccountOut, UserAccountOut, UserAccountsBalanceOut
 from models.transactions import (
     DepositTransactionOut,
     FundsTransferTransactionOut,
@@ -10,14 +10,36 @@ from models.transactions import (
     PaymentTransactionOut,
 )
 from services.information import InformationService
+from settings import settings
 
 
 router = APIRouter(prefix="/information", tags=["information"])
 
 
 @router.get("/account-balance/{user_id}", response_model=list[UserAccountOut])
-def get_account_balance_info(user_id: int, information_service: InformationService = Depends()) -> list[UserAccountOut]:
-    return information_service.get_account_balance_info(user_id)
+async def get_account_balance_info(
+    user_id: int, information_service: InformationService = Depends()
+) -> list[UserAccountOut]:
+    return await information_service.get_account_balance_info(user_id)
+
+
+@router.get("/account-balances", response_model=list[UserAccountsBalanceOut])
+async def get_accounts_balance_info(
+    user_ids: list[int] = Query(min_items=1, max_items=settings.MAX_USERS_PER_BALANCE_REQUEST),
+    information_service: InformationService = Depends(),
+) -> list[UserAccountsBalanceOut]:
+    """
+    Returns balances of many users at once (e.g. ?user_ids=1&user_ids=2).
+    Users whose accounts are not found are reported in their own entries (see 'detail') - the request doesn't fail.
+    """
+    return await information_service.get_accounts_balance_info(user_ids)
+
+
+@router.get("/company-account-balance/{company_account_id}", response_model=CompanyAccountOut)
+async def get_company_account_balance_info(
+    company_account_id: int, information_service: InformationService = Depends()
+) -> CompanyAccountOut:
+    return await information_service.get_company_account_balance_info(company_account_id)
 
 
 @router.get(
@@ -30,22 +52,37 @@ def get_account_balance_info(user_id: int, information_service: InformationServi
         PaymentTransactionOut,
     ],
 )
-def get_account_transactions_info(
+async def get_account_transactions_info(
     user_id: int,
     page: int | None = Query(default=None, ge=1),
     sort_by_amount: bool = False,
     sort_by_date: bool = False,
     information_service: InformationService = Depends(),
-) -> list[
-    DepositTransactionOut |
-    FundsTransferTransactionOut |
-    ReserveTransactionOut |
-    ReserveRefundTransactionOut |
-    PaymentTransactionOut
-] | JSONResponse:
-    return information_service.get_account_transactions_info(
+) -> ORJSONResponse | JSONResponse:
+    return await information_service.get_account_transactions_info(
         user_id,
         page=page,
         sort_by_amount=sort_by_amount,
         sort_by_date=sort_by_date,
     )
+
+
+@router.get("/account-transactions/{user_id}/cursor", response_model=AccountTransactionsPageOut)
+async def get_account_transactions_page(
+    user_id: int,
+    cursor: str | None = None,
+    limit: int = Query(default=settings.NUMBER_OF_RESULTS_PER_PAGE, ge=1, le=settings.MAX_RESULTS_PER_PAGE),
+    sort_by_amount: bool = False,
+    information_service: InformationService = Depends(),
+) -> ORJSONResponse:
+    """
+    Returns a page of account transactions sorted by date (or by amount) in descending order.
+    To get the next page, pass 'next_cursor' from the response as 'cursor' (with the same sorting).
+    'next_cursor' is not provided for the last page.
+    """
+    return await information_service.get_account_transactions_page(
+        user_id,
+        cursor=cursor,
+        limit=limit,
+        sort_by_amount=sort_by_amount,
+    )
@@ -3,6 +3,7 @@ import datetime
 from fastapi import APIRouter, Depends, Query
 from fastapi.responses import StreamingResponse
 
+from models.reports import ReportDetailLevel
 from services.reports import ReportsService
 from settings import settings
 
@@ -11,18 +12,24 @@ router = APIRouter(prefix="/reports", tags=["reports"])
 
 
 @router.get("/consolidated/monthly")
-def get_monthly_accounting_report(
+async def get_monthly_accounting_report(
         year: int = Query(gt=settings.YEAR_REPORTS_ARE_AVAILABLE_FROM, le=datetime.datetime.now().year),
         month: int = Query(ge=1, le=12),
+        detail: ReportDetailLevel = ReportDetailLevel.SERVICES,
         reports_service: ReportsService = Depends()
 ) -> StreamingResponse:
     """
     Returns csv report with total revenues for each service rendered in the requested period.
     Format: service name, total revenues in the reporting period.
+    Detailed reports are available as well:
+     orders - order id, user id, payment date, revenue from the order;
+     transactions - transaction id, payment date, order id, service name, quantity, price, revenue from the service.
+    Report is streamed to the client while it is being read from the database.
     """
-    report = reports_service.prepare_monthly_accounting_report_in_csv(year, month)
+    report = await reports_service.prepare_monthly_accounting_report_in_csv(year, month, detail)
+    report_name = "report" if detail == ReportDetailLevel.SERVICES else f"report_{detail.value}"
     return StreamingResponse(
         report,
         media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=report_{year}-{month}.csv"},
+        headers={"Content-Disposition": f"attachment; filename={report_name}_{year}-{month}.csv"},
     )
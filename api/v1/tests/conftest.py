@@ -0,0 +1,180 @@
+import uuid
+from decimal import Decimal
+from typing import Callable
+
+import pytest
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from starlette.routing import Match
+
+from main import app
+from storage import tables
+from storage.database import Session, async_engine, replica_engines
+
+
+# Maximum number of SQL statements each endpoint may execute to serve a successful request
+# (for the worst case, e.g. when recipient's accounts have to be created along with a deposit/transfer).
+# Budgets are deliberately tight: if a change adds queries to an endpoint, its tests fail
+# and the budget has to be raised explicitly.
+QUERY_BUDGETS = {
+    ("GET", "/v1/information/account-balance/{user_id}"): 1,
+    ("GET", "/v1/information/account-balances"): 1,
+    ("GET", "/v1/information/account-transactions/{user_id}"): 2,
+    ("GET", "/v1/information/account-transactions/{user_id}/cursor"): 2,
+    ("GET", "/v1/information/company-account-balance/{company_account_id}"): 1,
+    ("GET", "/v1/reports/consolidated/monthly"): 1,
+    ("PATCH", "/v1/transactions/deposit"): 8,
+    ("PATCH", "/v1/transactions/transfer"): 9,
+    ("PATCH", "/v1/transactions/reserve"): 6,
+    ("PATCH", "/v1/transactions/reserve-refund"): 7,
+    ("PATCH", "/v1/transactions/make-payment"): 9,
+    # transactions' ids are taken in advance; a batch of the maximum size inserts its transactions and ledger entries
+    # with two statements each (see _split_into_insert_chunks())
+    ("PATCH", "/v1/transactions/batch"): 9,
+}
+# claiming the key, looking it up and storing the response
+IDEMPOTENCY_KEY_QUERY_BUDGET = 3
+
+
+class QueryCounter:
+    """Counts SQL statements sent to the database by the application engines (the primary and the replicas)"""
+
+    def __init__(self) -> None:
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def reset(self) -> None:
+        self.statements.clear()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+
+class QueryBudgetTestClient(TestClient):
+    """Fails the test if a successful request to an endpoint executes more queries than its budget allows"""
+
+    def __init__(self, *args, query_counter: QueryCounter, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.query_counter = query_counter
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        self.query_counter.reset()
+        response = super().request(method, url, *args, **kwargs)
+
+        query_budget = self._get_query_budget(method, response.request.path_url.split("?")[0])
+        if query_budget is not None and response.status_code == 200:
+            if "idempotency-key" in {header.lower() for header in (kwargs.get("headers") or {})}:
+                query_budget += IDEMPOTENCY_KEY_QUERY_BUDGET
+            assert self.query_counter.count <= query_budget, (
+                f"{method.upper()} {url} executed {self.query_counter.count} queries (budget is {query_budget}):\n"
+                + "\n".join(self.query_counter.statements)
+            )
+
+        return response
+
+    @staticmethod
+    def _get_query_budget(method: str, path: str) -> int | None:
+        scope = {"type": "http", "method": method.upper(), "path": path}
+        for route in app.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return QUERY_BUDGETS.get((method.upper(), route.path))
+
+        return None
+
+
+@pytest.fixture
+def query_counter():
+    counter = QueryCounter()
+    counted_engines = [async_engine.sync_engine, *(replica_engine.sync_engine for replica_engine in replica_engines)]
+    for counted_engine in counted_engines:
+        event.listen(counted_engine, "before_cursor_execute", counter)
+    yield counter
+    for counted_engine in counted_engines:
+        event.remove(counted_engine, "before_cursor_execute", counter)
+
+
+@pytest.fixture
+def client(query_counter):
+    # engines' connections are disposed on app shutdown (they can't be reused by the event loop of the next client)
+    with QueryBudgetTestClient(app, query_counter=query_counter) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def deposit(client) -> Callable[[int, str], dict]:
+    """Deposits the amount to the user (creating user's accounts if needed) and returns the transaction"""
+
+    def deposit(user_id: int, amount: str) -> dict:
+        response = client.patch("/v1/transactions/deposit", json={"amount": amount, "to_user_id": user_id})
+        assert response.status_code == 200
+        return response.json()
+
+    return deposit
+
+
+# Test data is added to the existing rows (of the database configured in settings) - names are unique,
+# so that tests don't collide with each other and with the rows of previous runs.
+
+@pytest.fixture
+def create_user() -> Callable[[], int]:
+    """Creates a user without accounts (accounts are created by the first deposit) and returns user's id"""
+    users = tables.User.__table__
+
+    def create_user() -> int:
+        username = f"test_{uuid.uuid4().hex}"
+        with Session() as session:
+            user_id = session.scalar(
+                sa.insert(users)
+                .values(username=username, email=f"{username}@example.com", phone_number=username)
+                .returning(users.c.id)
+            )
+            session.commit()
+
+        return user_id
+
+    return create_user
+
+
+@pytest.fixture
+def create_order() -> Callable[[int, Decimal], int]:
+    """Creates a (not submitted) order of a single service with the given price and returns order's id"""
+    services = tables.Service.__table__
+    orders = tables.Order.__table__
+    order_items = tables.OrderItem.__table__
+
+    def create_order(user_id: int, price: Decimal) -> int:
+        with Session() as session:
+            service_id = session.scalar(
+                sa.insert(services)
+                .values(name=f"test_{uuid.uuid4().hex[:16]}", price=price, description="Test service")
+                .returning(services.c.id)
+            )
+            order_id = session.scalar(sa.insert(orders).values(user_id=user_id).returning(orders.c.id))
+            session.execute(sa.insert(order_items).values(order_id=order_id, service_id=service_id, quantity=1))
+            session.commit()
+
+        return order_id
+
+    return create_order
+
+
+@pytest.fixture
+def company_account_id() -> int:
+    company_accounts = tables.CompanyAccount.__table__
+
+    with Session() as session:
+        company_account_id = session.scalar(sa.select(sa.func.min(company_accounts.c.id)))
+        if company_account_id is None:
+            company_account_id = session.scalar(
+                sa.insert(company_accounts)
+                .values(balance=0, bank_account_number="00000000000000000", bank="Test Bank")
+                .returning(company_accounts.c.id)
+            )
+            session.commit()
+
+    return company_account_id
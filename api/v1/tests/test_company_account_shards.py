@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+
+from commands.compact_company_account_balance import compact_company_account_balance
+from settings import settings
+from storage import tables
+from storage.database import Session
+
+
+@pytest.fixture
+def pay_for_order(client, create_user, create_order, deposit, company_account_id):
+    def pay_for_order(price: Decimal) -> None:
+        user_id = create_user()
+        deposit(user_id, str(price))
+        order_id = create_order(user_id, price)
+        assert client.patch("/v1/transactions/reserve", json={"order_id": order_id}).status_code == 200
+        response = client.patch(
+            "/v1/transactions/make-payment", json={"order_id": order_id, "to_company_account": company_account_id}
+        )
+        assert response.status_code == 200
+
+    return pay_for_order
+
+
+def get_stored_balances(company_account_id: int) -> tuple[Decimal, Decimal]:
+    """Balance of the company account itself and the total balance of its shards"""
+    with Session() as session:
+        return (
+            session.scalar(
+                sa.select(tables.CompanyAccount.balance).where(tables.CompanyAccount.id == company_account_id)
+            ),
+            session.scalar(
+                sa.select(sa.func.coalesce(sa.func.sum(tables.CompanyAccountShard.balance), 0)).where(
+                    tables.CompanyAccountShard.company_account_id == company_account_id
+                )
+            ),
+        )
+
+
+def get_reported_balance(client, company_account_id: int) -> float:
+    response = client.get(f"/v1/information/company-account-balance/{company_account_id}")
+    assert response.status_code == 200
+    return response.json()["balance"]
+
+
+def test_payments_are_credited_to_shards(client, pay_for_order, company_account_id, monkeypatch):
+    monkeypatch.setattr(settings, "COMPANY_ACCOUNT_BALANCE_SHARDS", 4)
+    account_balance_before, shards_balance_before = get_stored_balances(company_account_id)
+    reported_balance_before = get_reported_balance(client, company_account_id)
+
+    pay_for_order(Decimal(30))
+    pay_for_order(Decimal(12))
+
+    assert get_stored_balances(company_account_id) == (account_balance_before, shards_balance_before + 42)
+    # shards' balances are included in the company account's balance
+    assert get_reported_balance(client, company_account_id) == reported_balance_before + 42
+
+
+def test_compact_company_account_balance(client, pay_for_order, company_account_id, monkeypatch):
+    monkeypatch.setattr(settings, "COMPANY_ACCOUNT_BALANCE_SHARDS", 4)
+    pay_for_order(Decimal(30))
+    account_balance_before, shards_balance_before = get_stored_balances(company_account_id)
+    reported_balance_before = get_reported_balance(client, company_account_id)
+
+    assert compact_company_account_balance() >= 1
+
+    assert get_stored_balances(company_account_id) == (account_balance_before + shards_balance_before, 0)
+    assert get_reported_balance(client, company_account_id) == reported_balance_before
+    assert compact_company_account_balance() == 0
@@ -0,0 +1,200 @@
+import itertools
+import re
+from collections import OrderedDict
+from decimal import Decimal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exceptions import ExceptionDescription
+from settings import settings
+from storage.database import ReadOnlyAsyncSessionLocal, replica_router
+
+
+def test_get_account_balance_info(client, create_user, deposit):
+    user_id = create_user()
+    deposit(user_id, "100")
+
+    response = client.get(f"/v1/information/account-balance/{user_id}")
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"user_id": user_id, "type": "regular", "balance": 100},
+        {"user_id": user_id, "type": "reserve", "balance": 0},
+    ]
+
+
+def test_get_account_balance_info_of_user_without_accounts(client, create_user):
+    response = client.get(f"/v1/information/account-balance/{create_user()}")
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value
+
+
+def test_get_accounts_balance_info(client, create_user, deposit):
+    user_id, user_without_accounts_id = create_user(), create_user()
+    deposit(user_id, "10")
+    unknown_user_id = 2 ** 31 - 1
+
+    response = client.get(
+        "/v1/information/account-balances",
+        params={"user_ids": [user_id, user_without_accounts_id, unknown_user_id]},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "user_id": user_id,
+            "accounts": [
+                {"user_id": user_id, "type": "regular", "balance": 10},
+                {"user_id": user_id, "type": "reserve", "balance": 0},
+            ],
+            "detail": None,
+        },
+        {
+            "user_id": user_without_accounts_id,
+            "accounts": None,
+            "detail": ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value,
+        },
+        {"user_id": unknown_user_id, "accounts": None, "detail": ExceptionDescription.USER_DOES_NOT_EXIST.value},
+    ]
+
+
+def test_get_accounts_balance_info_of_too_many_users(client):
+    user_ids = list(range(1, settings.MAX_USERS_PER_BALANCE_REQUEST + 2))
+
+    response = client.get("/v1/information/account-balances", params={"user_ids": user_ids})
+
+    assert response.status_code == 422
+
+
+def test_get_account_transactions_info(client, create_user, deposit):
+    user_id = create_user()
+    first_deposit, second_deposit = deposit(user_id, "10"), deposit(user_id, "20")
+
+    response = client.get(f"/v1/information/account-transactions/{user_id}", params={"sort_by_date": True})
+
+    assert response.status_code == 200
+    assert response.json() == [second_deposit, first_deposit]  # the latest ones first
+
+
+def test_get_account_transactions_info_of_order(client, create_user, create_order, deposit):
+    user_id = create_user()
+    deposit(user_id, "100")
+    order_id = create_order(user_id, Decimal(30))
+    assert client.patch("/v1/transactions/reserve", json={"order_id": order_id}).status_code == 200
+
+    response = client.get(f"/v1/information/account-transactions/{user_id}", params={"sort_by_date": True})
+
+    assert response.status_code == 200
+    reserve = response.json()[0]
+    assert reserve["order_id"] == order_id
+    # the user who made the order (not stored in the transaction's record) is mentioned in the description
+    assert f"reserved on user {user_id} reserve account as per the order {order_id}" in reserve["description"]
+
+
+def test_get_account_transactions_info_page(client, create_user, deposit):
+    user_id = create_user()
+    deposits = [deposit(user_id, str(amount)) for amount in range(1, settings.NUMBER_OF_RESULTS_PER_PAGE + 3)]
+
+    response = client.get(
+        f"/v1/information/account-transactions/{user_id}", params={"page": 2, "sort_by_amount": True}
+    )
+
+    assert response.status_code == 200
+    # the largest amounts first - the second page gets the two smallest ones
+    assert response.json() == [deposits[1], deposits[0]]
+
+
+def test_get_account_transactions_page(client, create_user, deposit):
+    user_id = create_user()
+    deposits = [deposit(user_id, "10") for _ in range(3)]
+
+    first_page = client.get(f"/v1/information/account-transactions/{user_id}/cursor", params={"limit": 2})
+    assert first_page.status_code == 200
+    second_page = client.get(
+        f"/v1/information/account-transactions/{user_id}/cursor",
+        params={"limit": 2, "cursor": first_page.json()["next_cursor"]},
+    )
+
+    assert second_page.status_code == 200
+    assert first_page.json()["transactions"] + second_page.json()["transactions"] == deposits[::-1]
+    assert second_page.json()["next_cursor"] is None
+
+
+def test_get_account_transactions_page_sorted_by_amount(client, create_user, deposit):
+    user_id = create_user()
+    deposits = [deposit(user_id, amount) for amount in ("20", "10", "30", "10")]
+    url = f"/v1/information/account-transactions/{user_id}/cursor"
+
+    first_page = client.get(url, params={"limit": 3, "sort_by_amount": True})
+    second_page = client.get(
+        url, params={"limit": 3, "sort_by_amount": True, "cursor": first_page.json()["next_cursor"]}
+    )
+
+    assert first_page.status_code == second_page.status_code == 200
+    # the largest amounts first, transactions of the same amount - the latest ones first
+    assert first_page.json()["transactions"] + second_page.json()["transactions"] == [
+        deposits[2], deposits[0], deposits[3], deposits[1]
+    ]
+
+
+def test_get_account_transactions_page_with_cursor_of_another_sorting(client, create_user, deposit):
+    user_id = create_user()
+    for _ in range(2):
+        deposit(user_id, "10")
+    url = f"/v1/information/account-transactions/{user_id}/cursor"
+    cursor_by_date = client.get(url, params={"limit": 1}).json()["next_cursor"]
+
+    response = client.get(url, params={"limit": 1, "sort_by_amount": True, "cursor": cursor_by_date})
+
+    assert response.status_code == 422
+    assert response.json()["message"] == ExceptionDescription.INVALID_PAGINATION_CURSOR.value
+
+
+def test_get_account_transactions_page_with_malformed_cursor(client, create_user):
+    response = client.get(f"/v1/information/account-transactions/{create_user()}/cursor", params={"cursor": "abc"})
+
+    assert response.status_code == 422
+    assert response.json()["message"] == ExceptionDescription.INVALID_PAGINATION_CURSOR.value
+
+
+def test_get_company_account_balance_info(client, company_account_id):
+    response = client.get(f"/v1/information/company-account-balance/{company_account_id}")
+
+    assert response.status_code == 200
+    assert response.json()["id"] == company_account_id
+
+
+def test_server_timing_header(client, create_user, deposit):
+    user_id = create_user()
+    deposit(user_id, "10")
+
+    response = client.get(f"/v1/information/account-transactions/{user_id}")
+
+    assert response.status_code == 200
+    # statements of the request (history reads aren't cached)
+    assert re.fullmatch(
+        r'db;dur=\d+\.\d{2};desc="[1-9]\d* queries", db-slowest;dur=\d+\.\d{2}', response.headers["Server-Timing"]
+    )
+
+
+def test_reads_of_users_who_have_written_recently_go_to_primary(client, create_user, deposit, monkeypatch):
+    writer_id, reader_id = create_user(), create_user()
+    deposit(writer_id, "10")
+    deposit(reader_id, "10")
+    replica_reads = []
+
+    def replica_sessionmaker() -> AsyncSession:
+        replica_reads.append(True)
+        return ReadOnlyAsyncSessionLocal()  # the same database stands for the replica
+
+    monkeypatch.setattr(replica_router, "replica_sessionmakers", [replica_sessionmaker])
+    monkeypatch.setattr(replica_router, "_next_replica_sessionmaker", itertools.cycle([replica_sessionmaker]))
+    monkeypatch.setattr(replica_router, "_written_at", OrderedDict())
+    deposit(writer_id, "10")
+
+    assert client.get(f"/v1/information/account-transactions/{reader_id}").status_code == 200
+    assert len(replica_reads) == 1
+    writer_response = client.get(f"/v1/information/account-transactions/{writer_id}")
+    assert len(replica_reads) == 1
+    assert len(writer_response.json()) == 2  # the latest deposit is read right away
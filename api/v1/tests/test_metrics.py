@@ -0,0 +1,11 @@
+def test_get_metrics(client, create_user, deposit):
+    deposit(create_user(), "10")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # requests are labeled by route templates (rather than by paths with ids)
+    assert 'route="/v1/transactions/deposit"' in response.text
+    assert 'account_transactions_total{type="deposit"}' in response.text
+    assert 'db_pool_size{engine="primary"}' in response.text
@@ -0,0 +1,81 @@
+import csv
+import datetime
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+
+from models.reports import ReportDetailLevel
+from storage import tables
+from storage.database import Session
+
+
+@pytest.fixture
+def payment(client, create_user, create_order, deposit, company_account_id) -> dict:
+    """Payment to company for an order (of a single service) made in the current month"""
+    user_id = create_user()
+    deposit(user_id, "100")
+    order_id = create_order(user_id, Decimal(25))
+    assert client.patch("/v1/transactions/reserve", json={"order_id": order_id}).status_code == 200
+
+    response = client.patch(
+        "/v1/transactions/make-payment", json={"order_id": order_id, "to_company_account": company_account_id}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def get_monthly_report(client, detail_level: ReportDetailLevel) -> list[list[str]]:
+    # payments' dates are in UTC
+    today = datetime.datetime.utcnow().date()
+    response = client.get(
+        "/v1/reports/consolidated/monthly",
+        params={"year": today.year, "month": today.month, "detail": detail_level.value},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    return list(csv.reader(response.text.splitlines()))
+
+
+def test_monthly_report_of_services(client, payment):
+    report_rows = get_monthly_report(client, ReportDetailLevel.SERVICES)
+
+    assert report_rows[0][0] == "Service Name"
+    assert len(report_rows) > 1
+
+
+def test_monthly_report_of_orders(client, payment):
+    report_rows = get_monthly_report(client, ReportDetailLevel.ORDERS)
+
+    paid_orders = {int(row[0]): Decimal(row[3]) for row in report_rows[1:]}
+    assert paid_orders[payment["order_id"]] == 25
+
+
+def test_monthly_report_of_transactions(client, payment):
+    report_rows = get_monthly_report(client, ReportDetailLevel.TRANSACTIONS)
+
+    paid_orders_revenues = {int(row[2]): Decimal(row[6]) for row in report_rows[1:]}
+    assert paid_orders_revenues[payment["order_id"]] == 25
+
+
+def test_monthly_report_of_transactions_with_price_changed_after_reserve(
+    client, create_user, create_order, deposit, company_account_id
+):
+    user_id = create_user()
+    deposit(user_id, "100")
+    order_id = create_order(user_id, Decimal(25))
+    assert client.patch("/v1/transactions/reserve", json={"order_id": order_id}).status_code == 200
+    with Session() as session:
+        service_id = session.scalar(sa.select(tables.OrderItem.service_id).where(tables.OrderItem.order_id == order_id))
+        session.execute(sa.update(tables.Service).where(tables.Service.id == service_id).values(price=40))
+        session.commit()
+
+    response = client.patch(
+        "/v1/transactions/make-payment", json={"order_id": order_id, "to_company_account": company_account_id}
+    )
+    assert response.status_code == 200
+
+    report_rows = get_monthly_report(client, ReportDetailLevel.TRANSACTIONS)
+    # the revenue is the amount paid - at the price the order was submitted with
+    paid_orders_revenues = {int(row[2]): Decimal(row[6]) for row in report_rows[1:]}
+    assert paid_orders_revenues[order_id] == response.json()["amount"] == 25
@@ -0,0 +1,232 @@
+import datetime
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from exceptions import ExceptionDescription
+from services.idempotency import recent_responses
+from settings import settings
+from storage import tables
+from storage.database import Session, replica_router
+
+
+def get_balances(client, user_id: int) -> dict[str, float]:
+    response = client.get(f"/v1/information/account-balance/{user_id}")
+    assert response.status_code == 200
+    return {account["type"]: account["balance"] for account in response.json()}
+
+
+def test_deposit_funds_to_account(client, create_user):
+    user_id = create_user()
+
+    response = client.patch("/v1/transactions/deposit", json={"amount": "100.50", "to_user_id": user_id})
+
+    assert response.status_code == 200
+    assert response.json()["type"] == "deposit"
+    assert response.json()["amount"] == 100.5
+    assert get_balances(client, user_id) == {"regular": 100.5, "reserve": 0}
+
+
+def test_deposit_funds_to_nonexistent_user(client):
+    response = client.patch("/v1/transactions/deposit", json={"amount": "10", "to_user_id": 2 ** 31 - 1})
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == ExceptionDescription.USER_DOES_NOT_EXIST.value
+
+
+def test_transfer_funds_between_user_accounts(client, create_user, deposit):
+    sender_id, recipient_id = create_user(), create_user()
+    deposit(sender_id, "100")
+
+    response = client.patch(
+        "/v1/transactions/transfer", json={"amount": "40", "from_user_id": sender_id, "to_user_id": recipient_id}
+    )
+
+    assert response.status_code == 200
+    assert get_balances(client, sender_id)["regular"] == 60
+    assert get_balances(client, recipient_id)["regular"] == 40
+
+
+def test_transfer_funds_exceeding_balance(client, create_user, deposit):
+    sender_id, recipient_id = create_user(), create_user()
+    deposit(sender_id, "10")
+
+    response = client.patch(
+        "/v1/transactions/transfer", json={"amount": "11", "from_user_id": sender_id, "to_user_id": recipient_id}
+    )
+
+    assert response.status_code == 422
+    assert get_balances(client, sender_id)["regular"] == 10
+
+
+def test_reserve_funds_and_make_payment(client, create_user, create_order, deposit, company_account_id):
+    user_id = create_user()
+    deposit(user_id, "100")
+    order_id = create_order(user_id, Decimal(30))
+
+    reserve_response = client.patch("/v1/transactions/reserve", json={"order_id": order_id})
+    assert reserve_response.status_code == 200
+    assert get_balances(client, user_id) == {"regular": 70, "reserve": 30}
+
+    payment_response = client.patch(
+        "/v1/transactions/make-payment", json={"order_id": order_id, "to_company_account": company_account_id}
+    )
+    assert payment_response.status_code == 200
+    assert payment_response.json()["amount"] == 30
+    assert get_balances(client, user_id) == {"regular": 70, "reserve": 0}
+
+
+def test_cancel_reserve(client, create_user, create_order, deposit):
+    user_id = create_user()
+    deposit(user_id, "100")
+    order_id = create_order(user_id, Decimal(30))
+    assert client.patch("/v1/transactions/reserve", json={"order_id": order_id}).status_code == 200
+
+    response = client.patch("/v1/transactions/reserve-refund", json={"order_id": order_id})
+
+    assert response.status_code == 200
+    assert get_balances(client, user_id) == {"regular": 100, "reserve": 0}
+
+
+def test_reserve_funds_for_order_in_wrong_status(client, create_user, create_order, deposit):
+    user_id = create_user()
+    deposit(user_id, "100")
+    order_id = create_order(user_id, Decimal(30))
+    assert client.patch("/v1/transactions/reserve", json={"order_id": order_id}).status_code == 200
+
+    response = client.patch("/v1/transactions/reserve", json={"order_id": order_id})
+
+    assert response.status_code == 422
+    assert get_balances(client, user_id) == {"regular": 70, "reserve": 30}
+
+
+def test_apply_transactions_batch(client, create_user, deposit):
+    sender_id, recipient_id = create_user(), create_user()
+    deposit(sender_id, "10")
+
+    response = client.patch(
+        "/v1/transactions/batch",
+        json={
+            "transactions": [
+                {"type": "funds transfer", "amount": "5", "from_user_id": sender_id, "to_user_id": recipient_id},
+                {"type": "funds transfer", "amount": "50", "from_user_id": sender_id, "to_user_id": recipient_id},
+                {"type": "deposit", "amount": "1", "to_user_id": recipient_id},
+            ],
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.json()["committed"] is True
+    results = response.json()["results"]
+    assert [result["status_code"] for result in results] == [200, 422, 200]
+    assert (results[0]["transaction"]["type"], results[0]["transaction"]["amount"]) == ("funds transfer", 5)
+    assert (results[2]["transaction"]["type"], results[2]["transaction"]["amount"]) == ("deposit", 1)
+    assert get_balances(client, sender_id)["regular"] == 5
+    assert get_balances(client, recipient_id)["regular"] == 6
+
+
+def test_apply_transactions_batch_marks_all_participants_written(client, create_user, deposit, monkeypatch):
+    first_user_id, second_user_id = create_user(), create_user()
+    deposit(first_user_id, "10")
+    deposit(second_user_id, "10")
+    written_user_ids = set()
+    monkeypatch.setattr(replica_router, "mark_written", written_user_ids.update)
+
+    response = client.patch(
+        "/v1/transactions/batch",
+        json={
+            "transactions": [
+                {"type": "funds transfer", "amount": "5", "from_user_id": first_user_id, "to_user_id": second_user_id},
+                {"type": "funds transfer", "amount": "5", "from_user_id": second_user_id, "to_user_id": first_user_id},
+            ],
+        },
+    )
+
+    assert response.status_code == 200
+    # balances haven't changed in total, but histories have - the users have to read their own writes
+    assert written_user_ids == {first_user_id, second_user_id}
+
+
+def test_apply_transactions_batch_of_maximum_size(client, create_user, deposit):
+    sender_id, recipient_id = create_user(), create_user()
+    deposit(sender_id, str(settings.MAX_TRANSACTIONS_PER_BATCH))
+    # each transfer has ledger entries of both users - more rows than a single insert's bind parameters allow
+    transfer = {"type": "funds transfer", "amount": "1", "from_user_id": sender_id, "to_user_id": recipient_id}
+
+    response = client.patch(
+        "/v1/transactions/batch", json={"transactions": [transfer] * settings.MAX_TRANSACTIONS_PER_BATCH}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["committed"] is True
+    assert get_balances(client, sender_id)["regular"] == 0
+    assert get_balances(client, recipient_id)["regular"] == settings.MAX_TRANSACTIONS_PER_BATCH
+
+
+def test_deposit_with_idempotency_key_is_performed_once(client, create_user):
+    user_id = create_user()
+    request = {"json": {"amount": "10", "to_user_id": user_id}, "headers": {"Idempotency-Key": f"test-{user_id}"}}
+
+    first_response = client.patch("/v1/transactions/deposit", **request)
+    repeated_response = client.patch("/v1/transactions/deposit", **request)
+
+    assert first_response.status_code == repeated_response.status_code == 200
+    assert repeated_response.json() == first_response.json()
+    assert get_balances(client, user_id)["regular"] == 10
+
+
+def test_deposit_with_expired_idempotency_key_is_performed_again(client, create_user):
+    user_id = create_user()
+    idempotency_key = f"test-{user_id}"
+    request = {"json": {"amount": "10", "to_user_id": user_id}, "headers": {"Idempotency-Key": idempotency_key}}
+    first_response = client.patch("/v1/transactions/deposit", **request)
+    assert first_response.status_code == 200
+    with Session() as session:
+        session.execute(
+            sa.update(tables.IdempotencyKey)
+            .where(tables.IdempotencyKey.key == idempotency_key)
+            .values(
+                created_at=datetime.datetime.utcnow()
+                - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_EXPIRATION_SECONDS + 1)
+            )
+        )
+        session.commit()
+    recent_responses.pop(idempotency_key)  # e.g. the retry is served by another worker process
+
+    repeated_response = client.patch("/v1/transactions/deposit", **request)
+    once_more_response = client.patch("/v1/transactions/deposit", **request)
+
+    assert repeated_response.status_code == once_more_response.status_code == 200
+    assert repeated_response.json()["id"] != first_response.json()["id"]
+    assert once_more_response.json() == repeated_response.json()
+    assert get_balances(client, user_id)["regular"] == 20
+
+
+def test_idempotency_key_reused_for_another_request(client, create_user):
+    user_id = create_user()
+    headers = {"Idempotency-Key": f"test-{user_id}"}
+    first_response = client.patch(
+        "/v1/transactions/deposit", json={"amount": "10", "to_user_id": user_id}, headers=headers
+    )
+    assert first_response.status_code == 200
+
+    response = client.patch("/v1/transactions/deposit", json={"amount": "20", "to_user_id": user_id}, headers=headers)
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == ExceptionDescription.IDEMPOTENCY_KEY_REUSED_FOR_ANOTHER_REQUEST.value
+    assert get_balances(client, user_id)["regular"] == 10
+
+
+def test_request_with_idempotency_key_in_progress(client, create_user):
+    user_id = create_user()
+    idempotency_key = f"test-{user_id}"
+    request = {"json": {"amount": "10", "to_user_id": user_id}, "headers": {"Idempotency-Key": idempotency_key}}
+    # the key claimed by a request which hasn't finished yet (e.g. by another worker process)
+    with Session() as session:
+        session.add(tables.IdempotencyKey(key=idempotency_key, request_hash="in progress"))
+        session.commit()
+
+    response = client.patch("/v1/transactions/deposit", **request)
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == ExceptionDescription.REQUEST_WITH_IDEMPOTENCY_KEY_IS_IN_PROGRESS.value
@@ -1,9 +1,14 @@
+import functools
+
 from fastapi import (
     APIRouter,
     Depends,
+    Header,
 )
 
 from models.transactions import (
+    BatchTransactionIn,
+    BatchTransactionOut,
     DepositTransactionIn,
     DepositTransactionOut,
     FundsTransferTransactionIn,
@@ -15,6 +20,8 @@ from models.transactions import (
     PaymentTransactionIn,
     PaymentTransactionOut,
 )
+from services.coalescer import write_coalescer
+from services.idempotency import IdempotencyService
 from services.transactions import TransactionsService
 
 
@@ -23,11 +30,19 @@ router = APIRouter(
     tags=["transactions"],
 )
 
+# All transactions can be sent with 'Idempotency-Key' header: if a request with the same key has already been processed,
+# the stored response is returned and the transaction is not performed again (e.g. when the request is retried after
+# a timeout).
+# Deposits/transfers are applied in batches with the transactions of concurrent requests (if the write coalescer is
+# enabled), unless they are sent with 'Idempotency-Key' header: the key has to be committed along with the transaction.
+
 
 @router.patch("/deposit", response_model=DepositTransactionOut)
-def deposit_funds_to_account(
+async def deposit_funds_to_account(
     transaction_data: DepositTransactionIn,
     transactions_service: TransactionsService = Depends(),
+    idempotency_service: IdempotencyService = Depends(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
 ) -> DepositTransactionOut:
     """
     Deposits a specified amount of money to a specific user (i.e. user account balance increases) via external services
@@ -35,13 +50,25 @@ def deposit_funds_to_account(
     If user doesn't have an account yet, account will be created (as per the project's requirements)
     and money will be deposited to the account.
     """
-    return transactions_service.deposit_funds_to_account(transaction_data)
+    return await idempotency_service.perform_once(
+        idempotency_key,
+        transaction_data,
+        DepositTransactionOut,
+        functools.partial(
+            write_coalescer.submit
+            if write_coalescer.is_running and not idempotency_key
+            else transactions_service.deposit_funds_to_account,
+            transaction_data,
+        ),
+    )
 
 
 @router.patch("/transfer", response_model=FundsTransferTransactionOut)
-def transfer_funds_between_user_accounts(
+async def transfer_funds_between_user_accounts(
     transaction_data: FundsTransferTransactionIn,
     transactions_service: TransactionsService = Depends(),
+    idempotency_service: IdempotencyService = Depends(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
 ) -> FundsTransferTransactionOut:
     """
     Transfers a specified amount of money from one user to another (i.e. sender account balance decreases while
@@ -49,13 +76,25 @@ def transfer_funds_between_user_accounts(
     If a recipient user doesn't have an account yet, account will be created (as per the project's requirements)
     and money will be transferred to the account.
     """
-    return transactions_service.transfer_funds_between_user_accounts(transaction_data)
+    return await idempotency_service.perform_once(
+        idempotency_key,
+        transaction_data,
+        FundsTransferTransactionOut,
+        functools.partial(
+            write_coalescer.submit
+            if write_coalescer.is_running and not idempotency_key
+            else transactions_service.transfer_funds_between_user_accounts,
+            transaction_data,
+        ),
+    )
 
 
 @router.patch("/reserve", response_model=ReserveTransactionOut)
-def reserve_funds(
+async def reserve_funds(
     transaction_data: ReserveTransactionIn,
     transactions_service: TransactionsService = Depends(),
+    idempotency_service: IdempotencyService = Depends(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
 ) -> ReserveTransactionOut:
     """
     Reserves money from account of a user which made a specific order (money is transferred from user's regular account
@@ -65,30 +104,72 @@ def reserve_funds(
     or paid to the company (if the order is fulfilled).
     The amount of money to be reserved is determined by the total price of the services in the order.
     """
-    return transactions_service.reserve_funds(transaction_data)
+    return await idempotency_service.perform_once(
+        idempotency_key,
+        transaction_data,
+        ReserveTransactionOut,
+        functools.partial(transactions_service.reserve_funds, transaction_data),
+    )
 
 
 @router.patch("/reserve-refund", response_model=ReserveRefundTransactionOut)
-def cancel_reserve(
+async def cancel_reserve(
     transaction_data: ReserveRefundTransactionIn,
     transactions_service: TransactionsService = Depends(),
+    idempotency_service: IdempotencyService = Depends(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
 ) -> ReserveRefundTransactionOut:
     """
     Refunds previously reserved money (money is transferred back from user's reserve account to regular one) as per
     specific order.
     Changes the order's status to "cancelled".
     """
-    return transactions_service.cancel_reserve(transaction_data)
+    return await idempotency_service.perform_once(
+        idempotency_key,
+        transaction_data,
+        ReserveRefundTransactionOut,
+        functools.partial(transactions_service.cancel_reserve, transaction_data),
+    )
 
 
 @router.patch("/make-payment", response_model=PaymentTransactionOut)
-def make_payment_to_company(
+async def make_payment_to_company(
     transaction_data: PaymentTransactionIn,
     transactions_service: TransactionsService = Depends(),
+    idempotency_service: IdempotencyService = Depends(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
 ) -> PaymentTransactionOut:
     """
     Transfers previously reserved money to company account (money is transferred from user's reserve account to
     company account).
     Changes the order's status to "completed".
     """
-    return transactions_service.make_payment_to_company(transaction_data)
+    return await idempotency_service.perform_once(
+        idempotency_key,
+        transaction_data,
+        PaymentTransactionOut,
+        functools.partial(transactions_service.make_payment_to_company, transaction_data),
+    )
+
+
+@router.patch("/batch", response_model=BatchTransactionOut)
+async def apply_transactions_batch(
+    batch_data: BatchTransactionIn,
+    transactions_service: TransactionsService = Depends(),
+    idempotency_service: IdempotencyService = Depends(),
+    idempotency_key: str | None = Header(default=None, max_length=255),
+) -> BatchTransactionOut:
+    """
+    Applies a batch of deposits and/or funds transfers (each transaction has to specify its type) within one
+    database transaction.
+    The result (status code and either the transaction or the error description) is reported for each transaction
+    in the batch.
+    If 'all_or_nothing' is set, no transactions are applied unless all of them succeed, otherwise successful
+    transactions are applied even if some other transactions in the batch fail.
+    """
+    return await idempotency_service.perform_once(
+        idempotency_key,
+        batch_data,
+        BatchTransactionOut,
+        functools.partial(transactions_service.apply_transactions_batch, batch_data),
+    )
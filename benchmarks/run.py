@@ -0,0 +1,129 @@
+"""
+Runs benchmark scenarios against the ASGI app in-process (no network, no web server) and the database configured
+in settings, then prints the results (throughput and latency percentiles of each operation) as JSON, so they can
+be compared between commits.
+Scenarios create their own rows (added to the existing ones) before they are measured - use a local database.
+
+Usage:
+    python -m benchmarks.run [--scenarios deposit_storm transfer_contention ...] [--steps 1000] [--concurrency 16]
+                             [--output results.json] [--seed 1]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import random
+import subprocess
+import time
+import uuid
+
+import httpx
+
+from benchmarks.scenarios import SCENARIOS, BenchmarkData, LatencyRecorder, Scenario
+from main import app
+
+
+async def run_scenario(scenario: Scenario, *, steps_count: int, concurrency: int) -> dict:
+    recorder = LatencyRecorder()
+    steps = iter(range(steps_count))
+
+    async def run_steps(client: httpx.AsyncClient) -> None:
+        # steps are shared by the workers - each worker takes the next one as soon as it's done with the previous one
+        for index in steps:
+            await scenario.step(client, recorder, index)
+
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark", timeout=None) as client:
+        scenario_started_at = time.perf_counter()
+        await asyncio.gather(*(run_steps(client) for _ in range(concurrency)))
+        duration_seconds = time.perf_counter() - scenario_started_at
+
+    requests_count = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "steps": steps_count,
+        "requests": requests_count,
+        "errors": sum(recorder.errors.values()),
+        "duration_seconds": round(duration_seconds, 3),
+        "throughput_rps": round(requests_count / duration_seconds, 2),
+        "operations": {
+            operation: {
+                "requests": len(latencies),
+                "errors": recorder.errors[operation],
+                "throughput_rps": round(len(latencies) / duration_seconds, 2),
+                **_get_latency_percentiles_ms(latencies),
+            }
+            for operation, latencies in recorder.latencies.items()
+        },
+    }
+
+
+def _get_latency_percentiles_ms(latencies: list[float]) -> dict[str, float]:
+    sorted_latencies = sorted(latencies)
+
+    def percentile(rank: float) -> float:
+        # nearest-rank method
+        latency = sorted_latencies[max(math.ceil(rank / 100 * len(sorted_latencies)) - 1, 0)]
+        return round(latency * 1000, 3)
+
+    return {
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": percentile(100),
+    }
+
+
+def _get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmarks(scenarios_names: list[str], *, steps_count: int, concurrency: int) -> dict:
+    data = BenchmarkData(run_id=uuid.uuid4().hex[:8])
+    results = {
+        "commit": _get_git_commit(),
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "steps": steps_count,
+        "concurrency": concurrency,
+        "scenarios": {},
+    }
+
+    await app.router.startup()
+    try:
+        for scenario_name in scenarios_names:
+            scenario = SCENARIOS[scenario_name]()
+            scenario.setup(data, steps_count)
+            results["scenarios"][scenario_name] = await run_scenario(
+                scenario, steps_count=steps_count, concurrency=concurrency
+            )
+    finally:
+        await app.router.shutdown()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs benchmark scenarios and prints the results as JSON.")
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="scenarios to run (in order)"
+    )
+    parser.add_argument("--steps", type=int, default=1000, help="number of steps of each scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of steps run concurrently")
+    parser.add_argument("--output", default=None, help="file to write the results to (instead of stdout)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed (for reproducible runs)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    benchmark_results = json.dumps(
+        asyncio.run(run_benchmarks(args.scenarios, steps_count=args.steps, concurrency=args.concurrency)),
+        indent=4,
+    )
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(benchmark_results)
+    else:
+        print(benchmark_results)
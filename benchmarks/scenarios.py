@@ -0,0 +1,321 @@
+import datetime
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+import httpx
+import sqlalchemy as sa
+
+from models.reports import ReportDetailLevel
+from services.information import TransactionsSortKey, encode_pagination_cursor
+from settings import settings
+from storage import tables
+from storage.database import Session
+from storage.tables import AccountType, TransactionType, render_transaction_description
+
+
+INSERT_CHUNK_SIZE = 10000
+
+
+class LatencyRecorder:
+    """Latencies (in seconds) and errors (non-200 responses) of the requests made by a scenario, by operation"""
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+
+    async def request(
+        self, client: httpx.AsyncClient, operation: str, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        request_started_at = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[operation].append(time.perf_counter() - request_started_at)
+        if response.status_code != 200:
+            self.errors[operation] += 1
+
+        return response
+
+
+class BenchmarkData:
+    """
+    Creates rows the scenarios work with. Rows are added to the existing ones (usernames are prefixed with the run id,
+    so runs don't collide), and balances are always backed by deposit transactions - just like the real ones.
+    """
+
+    def __init__(self, run_id: str) -> None:
+        self.run_id = run_id
+        self._users_count = 0
+
+    def create_users(self, count: int, balance: Decimal = Decimal(0)) -> list[int]:
+        users = tables.User.__table__
+        user_accounts = tables.UserAccount.__table__
+
+        with Session() as session:
+            user_ids = []
+            for chunk_start in range(0, count, INSERT_CHUNK_SIZE):
+                users_values = []
+                for _ in range(min(INSERT_CHUNK_SIZE, count - chunk_start)):
+                    self._users_count += 1
+                    username = f"benchmark_{self.run_id}_{self._users_count}"
+                    users_values.append(
+                        {"username": username, "email": f"{username}@example.com", "phone_number": username}
+                    )
+                user_ids.extend(session.scalars(sa.insert(users).values(users_values).returning(users.c.id)))
+
+            for chunk_start in range(0, count, INSERT_CHUNK_SIZE):
+                session.execute(
+                    sa.insert(user_accounts).values(
+                        [
+                            {"user_id": user_id, "type": account_type, "balance": 0}
+                            for user_id in user_ids[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+                            for account_type in (AccountType.REGULAR, AccountType.RESERVE)
+                        ]
+                    )
+                )
+
+            if balance:
+                for user_id in user_ids:
+                    self._deposit(session, user_id, [balance], [datetime.datetime.utcnow()])
+            session.commit()
+
+        return user_ids
+
+    def create_history(self, user_id: int, transactions_count: int) -> list[tuple[datetime.datetime, int]]:
+        """
+        Deposits spread over the last year. Returns the sort keys (date, transaction id) of the user's transactions.
+        """
+        history_start = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+        history_step = datetime.timedelta(days=365) / transactions_count
+        dates = [history_start + history_step * index for index in range(transactions_count)]
+
+        with Session() as session:
+            sort_keys = []
+            for chunk_start in range(0, transactions_count, INSERT_CHUNK_SIZE):
+                chunk_dates = dates[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+                amounts = [Decimal(random.randint(1, 100)) for _ in chunk_dates]
+                sort_keys.extend(self._deposit(session, user_id, amounts, chunk_dates))
+            session.commit()
+
+        return sort_keys
+
+    def create_orders(self, user_ids: list[int]) -> list[int]:
+        """Creates a (not submitted) order with a single service for each of the users"""
+        services = tables.Service.__table__
+        orders = tables.Order.__table__
+        order_items = tables.OrderItem.__table__
+
+        with Session() as session:
+            service_id = session.scalar(
+                sa.insert(services)
+                .values(name=f"benchmark {self.run_id}", price=100, description="Benchmark service")
+                .returning(services.c.id)
+            )
+            order_ids = []
+            for chunk_start in range(0, len(user_ids), INSERT_CHUNK_SIZE):
+                chunk_user_ids = user_ids[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+                order_ids.extend(
+                    session.scalars(
+                        sa.insert(orders).values([{"user_id": user_id} for user_id in chunk_user_ids])
+                        .returning(orders.c.id)
+                    )
+                )
+            for chunk_start in range(0, len(order_ids), INSERT_CHUNK_SIZE):
+                session.execute(
+                    sa.insert(order_items).values(
+                        [
+                            {"order_id": order_id, "service_id": service_id, "quantity": 1}
+                            for order_id in order_ids[chunk_start:chunk_start + INSERT_CHUNK_SIZE]
+                        ]
+                    )
+                )
+            session.commit()
+
+        return order_ids
+
+    @staticmethod
+    def get_or_create_company_account() -> int:
+        company_accounts = tables.CompanyAccount.__table__
+
+        with Session() as session:
+            company_account_id = session.scalar(sa.select(sa.func.min(company_accounts.c.id)))
+            if company_account_id is None:
+                company_account_id = session.scalar(
+                    sa.insert(company_accounts)
+                    .values(balance=0, bank_account_number="00000000000000000", bank="Benchmark Bank")
+                    .returning(company_accounts.c.id)
+                )
+                session.commit()
+
+        return company_account_id
+
+    @staticmethod
+    def _deposit(
+        session: sa.orm.Session, user_id: int, amounts: list[Decimal], dates: list[datetime.datetime]
+    ) -> list[tuple[datetime.datetime, int]]:
+        transactions = tables.Transaction.__table__
+        user_accounts = tables.UserAccount.__table__
+
+        transaction_ids = session.scalars(
+            sa.insert(transactions)
+            .values(
+                [
+                    {
+                        "type": TransactionType.DEPOSIT,
+                        "amount": amount,
+                        "date": date,
+                        "to_user_id": user_id,
+                        "description": (
+                            None
+                            if settings.COMPACT_TRANSACTION_DESCRIPTIONS
+                            else render_transaction_description(
+                                TransactionType.DEPOSIT, amount, date, to_user_id=user_id
+                            )
+                        ),
+                    }
+                    for amount, date in zip(amounts, dates)
+                ]
+            )
+            .returning(transactions.c.id)
+        ).all()
+        session.execute(
+            sa.insert(tables.LedgerEntry.__table__).values(
+                [
+                    {"user_id": user_id, "transaction_id": transaction_id, "date": date, "amount": amount}
+                    for transaction_id, amount, date in zip(transaction_ids, amounts, dates)
+                ]
+            )
+        )
+        session.execute(
+            sa.update(user_accounts)
+            .where(sa.and_(user_accounts.c.user_id == user_id, user_accounts.c.type == AccountType.REGULAR))
+            .values(balance=user_accounts.c.balance + sum(amounts))
+        )
+
+        return list(zip(dates, transaction_ids))
+
+
+class Scenario(ABC):
+    name: str
+
+    @abstractmethod
+    def setup(self, data: BenchmarkData, steps_count: int) -> None:
+        """Creates the rows needed for the given number of steps (not measured)"""
+
+    @abstractmethod
+    async def step(self, client: httpx.AsyncClient, recorder: LatencyRecorder, index: int) -> None:
+        """Makes the requests of a single step (steps are run concurrently)"""
+
+
+class DepositStorm(Scenario):
+    """Deposits to many different accounts - no contention, measures the cost of a write transaction itself"""
+
+    name = "deposit_storm"
+    USERS_COUNT = 1000
+
+    def setup(self, data: BenchmarkData, steps_count: int) -> None:
+        self.user_ids = data.create_users(min(self.USERS_COUNT, steps_count))
+
+    async def step(self, client: httpx.AsyncClient, recorder: LatencyRecorder, index: int) -> None:
+        await recorder.request(
+            client, "deposit", "PATCH", "/v1/transactions/deposit",
+            json={"amount": "100", "to_user_id": self.user_ids[index % len(self.user_ids)]},
+        )
+
+
+class TransferContention(Scenario):
+    """Transfers between a handful of hot accounts - measures row lock waits and serialization failures' retries"""
+
+    name = "transfer_contention"
+    HOT_USERS_COUNT = 4
+
+    def setup(self, data: BenchmarkData, steps_count: int) -> None:
+        self.user_ids = data.create_users(self.HOT_USERS_COUNT, balance=Decimal(steps_count))
+
+    async def step(self, client: httpx.AsyncClient, recorder: LatencyRecorder, index: int) -> None:
+        from_user_id, to_user_id = random.sample(self.user_ids, k=2)
+        await recorder.request(
+            client, "transfer", "PATCH", "/v1/transactions/transfer",
+            json={"amount": "1", "from_user_id": from_user_id, "to_user_id": to_user_id},
+        )
+
+
+class ReservePayLifecycle(Scenario):
+    """Each step reserves the funds for an order and then pays for it"""
+
+    name = "reserve_pay_lifecycle"
+
+    def setup(self, data: BenchmarkData, steps_count: int) -> None:
+        user_ids = data.create_users(steps_count, balance=Decimal(100))
+        self.order_ids = data.create_orders(user_ids)
+        self.company_account_id = data.get_or_create_company_account()
+
+    async def step(self, client: httpx.AsyncClient, recorder: LatencyRecorder, index: int) -> None:
+        order_id = self.order_ids[index]
+        response = await recorder.request(
+            client, "reserve", "PATCH", "/v1/transactions/reserve", json={"order_id": order_id}
+        )
+        if response.status_code == 200:
+            await recorder.request(
+                client, "make_payment", "PATCH", "/v1/transactions/make-payment",
+                json={"order_id": order_id, "to_company_account": self.company_account_id},
+            )
+
+
+class DeepHistoryPagination(Scenario):
+    """
+    Reads pages deep in a long transactions' history of a single user - both by page number (offset pagination)
+    and by cursor (keyset pagination) pointing to the same position, so the two can be compared.
+    """
+
+    name = "deep_history_pagination"
+    HISTORY_SIZE = 100000
+
+    def setup(self, data: BenchmarkData, steps_count: int) -> None:
+        (self.user_id,) = data.create_users(1)
+        # history is read in descending order of dates
+        self.sort_keys = data.create_history(self.user_id, self.HISTORY_SIZE)[::-1]
+
+    async def step(self, client: httpx.AsyncClient, recorder: LatencyRecorder, index: int) -> None:
+        page_size = settings.NUMBER_OF_RESULTS_PER_PAGE
+        # pages from the second half of the history
+        page = random.randint(len(self.sort_keys) // page_size // 2, len(self.sort_keys) // page_size)
+        await recorder.request(
+            client, "offset_page", "GET", f"/v1/information/account-transactions/{self.user_id}",
+            params={"page": page, "sort_by_date": True},
+        )
+
+        last_date, last_transaction_id = self.sort_keys[(page - 1) * page_size - 1]
+        cursor = encode_pagination_cursor(TransactionsSortKey.DATE, last_date, last_transaction_id)
+        await recorder.request(
+            client, "cursor_page", "GET", f"/v1/information/account-transactions/{self.user_id}/cursor",
+            params={"cursor": cursor, "limit": page_size},
+        )
+
+
+class MonthlyReport(Scenario):
+    """
+    Streams monthly reports of the current month (of each detail level in turn).
+    Should be run after the reserve/pay lifecycle scenario - otherwise there may be no payments to report.
+    """
+
+    name = "monthly_report"
+
+    def setup(self, data: BenchmarkData, steps_count: int) -> None:
+        pass
+
+    async def step(self, client: httpx.AsyncClient, recorder: LatencyRecorder, index: int) -> None:
+        today = datetime.date.today()
+        detail_levels = list(ReportDetailLevel)
+        detail_level = detail_levels[index % len(detail_levels)]
+        await recorder.request(
+            client, f"report_{detail_level.value}", "GET", "/v1/reports/consolidated/monthly",
+            params={"year": today.year, "month": today.month, "detail": detail_level.value},
+        )
+
+
+SCENARIOS: dict[str, type[Scenario]] = {
+    scenario.name: scenario
+    for scenario in (DepositStorm, TransferContention, ReservePayLifecycle, DeepHistoryPagination, MonthlyReport)
+}
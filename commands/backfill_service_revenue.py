@@ -0,0 +1,55 @@
+"""
+Recalculates the monthly services' revenue rollup (service_revenue_monthly table) from the whole history
+of payments to company.
+Should be run once after the rollup table is created (rollup is kept up to date by payment transactions afterwards)
+and can be rerun at any time since the rollup is recalculated from scratch.
+
+Usage:
+    python -m commands.backfill_service_revenue
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from storage import tables
+from storage.database import Session
+from storage.tables import TransactionType
+
+
+def backfill_service_revenue() -> int:
+    """Returns the number of rollup rows written."""
+    order_items = tables.OrderItem.__table__
+    services = tables.Service.__table__
+    transactions = tables.Transaction.__table__
+    service_revenue_monthly = tables.ServiceRevenueMonthly.__table__
+
+    period = sa.cast(sa.func.date_trunc("month", transactions.c.date), sa.Date)
+    services_revenue_by_month = (
+        sa.select(
+            period,
+            order_items.c.service_id,
+            # prices frozen when the orders were submitted (if there are any) - the ones actually paid
+            sa.func.sum(order_items.c.quantity * sa.func.coalesce(order_items.c.price, services.c.price)),
+        )
+        .select_from(transactions)
+        .join(order_items, order_items.c.order_id == transactions.c.order_id)
+        .join(services, services.c.id == order_items.c.service_id)
+        .where(transactions.c.type == TransactionType.PAYMENT_TO_COMPANY)
+        .group_by(period, order_items.c.service_id)
+    )
+
+    with Session() as session:
+        # payments in progress finish before the recalculation, new payments wait for it
+        session.execute(sa.text("LOCK TABLE service_revenue_monthly IN EXCLUSIVE MODE"))
+        session.execute(sa.delete(service_revenue_monthly))
+        rollup_rows = session.execute(
+            insert(service_revenue_monthly).from_select(
+                ["period", "service_id", "revenue"], services_revenue_by_month
+            )
+        )
+        session.commit()
+
+    return rollup_rows.rowcount
+
+
+if __name__ == "__main__":
+    print(f"Service revenue rollup rows written: {backfill_service_revenue()}")
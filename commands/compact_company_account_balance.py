@@ -0,0 +1,61 @@
+"""
+Moves the balances of company accounts' shards (payments credited since the last compaction) to the company accounts
+themselves. Company accounts' balances (as reported by the API) don't change - only the way they are stored does.
+Should be run periodically (e.g. by cron) when COMPANY_ACCOUNT_BALANCE_SHARDS is set.
+
+Usage:
+    python -m commands.compact_company_account_balance
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from storage import tables
+from storage.database import Session
+
+
+def compact_company_account_balance() -> int:
+    """Returns the number of shards compacted."""
+    company_accounts = tables.CompanyAccount.__table__
+    company_account_shards = tables.CompanyAccountShard.__table__
+
+    with Session() as session:
+        # shards are locked (in the same order each time) only until the end of this short transaction -
+        # payments credited to them meanwhile just wait for it
+        shards = session.execute(
+            sa.select(company_account_shards)
+            .where(company_account_shards.c.balance != 0)
+            .order_by(company_account_shards.c.company_account_id, company_account_shards.c.shard)
+            .with_for_update()
+        ).all()
+        if not shards:
+            return 0
+
+        compacted_balances = defaultdict(Decimal)
+        for shard in shards:
+            compacted_balances[shard.company_account_id] += shard.balance
+
+        # shards are zeroed (rather than deleted) - deleted shards would be recreated by the very next payments
+        session.execute(
+            sa.update(company_account_shards)
+            .where(
+                sa.tuple_(company_account_shards.c.company_account_id, company_account_shards.c.shard).in_(
+                    [(shard.company_account_id, shard.shard) for shard in shards]
+                )
+            )
+            .values(balance=0)
+        )
+        for company_account_id, compacted_balance in sorted(compacted_balances.items()):
+            session.execute(
+                sa.update(company_accounts)
+                .where(company_accounts.c.id == company_account_id)
+                .values(balance=company_accounts.c.balance + compacted_balance)
+            )
+        session.commit()
+
+    return len(shards)
+
+
+if __name__ == "__main__":
+    print(f"Company account shards compacted: {compact_company_account_balance()}")
@@ -0,0 +1,78 @@
+"""
+Clears the stored descriptions of deposits and funds transfers (see tables.COMPACT_DESCRIPTION_TRANSACTION_TYPES) -
+they are rendered from the other columns of the transactions' records when they're read, just like the descriptions
+of the transactions made since COMPACT_TRANSACTION_DESCRIPTIONS was set. Should be run once, when the setting is on.
+Order-based transactions (reserves, reserve refunds and payments to company) keep their stored descriptions.
+Transactions are updated in batches of consecutive ids (each in its own short transaction), so the command can be
+interrupted and rerun.
+Space freed by the old row versions is reused by new rows after (auto)vacuum - run VACUUM FULL (or pg_repack)
+afterwards to shrink the table right away.
+
+Usage:
+    python -m commands.compact_transaction_descriptions [--batch-size 10000]
+"""
+import argparse
+
+import sqlalchemy as sa
+
+from settings import settings
+from storage import tables
+from storage.database import Session
+from storage.tables import COMPACT_DESCRIPTION_TRANSACTION_TYPES
+
+
+def compact_transaction_descriptions(*, batch_size: int = 10000) -> int:
+    """Returns the number of transactions whose descriptions were cleared."""
+    transactions = tables.Transaction.__table__
+
+    compacted_transactions = 0
+    last_transaction_id = 0
+    with Session() as session:
+        while True:
+            # the table is walked by id (keyset) - each batch starts where the previous one has ended
+            transactions_batch = (
+                sa.select(transactions.c.id, transactions.c.date)
+                .where(transactions.c.id > last_transaction_id)
+                .order_by(transactions.c.id)
+                .limit(batch_size)
+                .cte("transactions_batch")
+            )
+            compacted_batch = (
+                sa.update(transactions)
+                .where(
+                    sa.and_(
+                        transactions.c.id == transactions_batch.c.id,
+                        transactions.c.date == transactions_batch.c.date,  # the partition key
+                        transactions.c.type.in_(COMPACT_DESCRIPTION_TRANSACTION_TYPES),
+                        transactions.c.description.is_not(None),
+                    )
+                )
+                .values(description=None)
+                .returning(transactions.c.id)
+                .cte("compacted_batch")
+            )
+            batch_last_transaction_id, batch_compacted_transactions = session.execute(
+                sa.select(
+                    sa.select(sa.func.max(transactions_batch.c.id)).scalar_subquery(),
+                    sa.select(sa.func.count()).select_from(compacted_batch).scalar_subquery(),
+                )
+            ).one()
+            session.commit()
+            if batch_last_transaction_id is None:
+                break
+
+            last_transaction_id = batch_last_transaction_id
+            compacted_transactions += batch_compacted_transactions
+
+    return compacted_transactions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clears the stored descriptions of deposits and funds transfers.")
+    parser.add_argument("--batch-size", type=int, default=10000, help="number of transactions updated at a time")
+    args = parser.parse_args()
+
+    if not settings.COMPACT_TRANSACTION_DESCRIPTIONS:
+        parser.error("COMPACT_TRANSACTION_DESCRIPTIONS is not set - new transactions' descriptions are still stored")
+
+    print(f"Transactions' descriptions cleared: {compact_transaction_descriptions(batch_size=args.batch_size)}")
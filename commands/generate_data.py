@@ -0,0 +1,399 @@
+"""
+Generates synthetic data at production scale (users with accounts, services, orders with items, transactions' history
+with ledger entries) and loads it with COPY, so that benchmarks and query plans can be checked on realistic sizes.
+Users' activity is skewed (a few users make most of the transactions) and account balances are kept consistent
+with the generated history (balances never go negative, company account gets all the payments).
+Generated rows are added to the existing ones, then the services' revenue rollup is recalculated.
+
+Usage:
+    python -m commands.generate_data --users 100000 --transactions 5000000 [--services 50] [--months 24] [--seed 1]
+"""
+import argparse
+import csv
+import datetime
+import itertools
+import random
+import tempfile
+from decimal import Decimal
+from typing import IO
+
+import sqlalchemy as sa
+
+from commands.backfill_service_revenue import backfill_service_revenue
+from commands.partitions import create_transactions_partitions
+from storage import tables
+from storage.database import Session
+from settings import settings
+from storage.tables import (
+    COMPACT_DESCRIPTION_TRANSACTION_TYPES,
+    AccountType,
+    OrderStatus,
+    TransactionType,
+    render_transaction_description,
+)
+
+
+ACTIVITY_SKEW = 1.2  # Pareto distribution shape of users' activity - the lower, the more skewed
+ACTORS_SAMPLE_SIZE = 10000  # transactions' participants are sampled in chunks (sampling one at a time is slow)
+ORDER_STATUSES = list(OrderStatus)
+
+
+class _CopyBuffer:
+    """Rows of a table written to a temporary file (in csv format) to be loaded with a single COPY"""
+
+    def __init__(self, table: sa.Table, columns: list[str]) -> None:
+        self.table = table
+        self.columns = columns
+        self.rows_count = 0
+        self.file: IO[str] = tempfile.TemporaryFile(mode="w+", newline="")
+        self._writer = csv.writer(self.file)
+
+    def write(self, *row) -> None:
+        self._writer.writerow(row)
+        self.rows_count += 1
+
+    def copy_to_database(self, cursor) -> None:
+        self.file.seek(0)
+        cursor.copy_expert(
+            f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)",
+            self.file,
+        )
+        self.file.close()
+
+
+class _DataGenerator:
+    def __init__(
+        self,
+        session: sa.orm.Session,
+        *,
+        users_count: int,
+        transactions_count: int,
+        services_count: int,
+        months: int,
+    ) -> None:
+        self.session = session
+        self.users_count = users_count
+        self.transactions_count = transactions_count
+        self.services_count = services_count
+        self.history_start = datetime.datetime.utcnow() - datetime.timedelta(days=30 * months)
+        self.history_end = datetime.datetime.utcnow()
+
+        # generated rows get ids following the existing ones
+        self.last_ids = {
+            table: session.scalar(sa.select(sa.func.coalesce(sa.func.max(table.c.id), 0)))
+            for table in (
+                tables.User.__table__,
+                tables.UserAccount.__table__,
+                tables.Service.__table__,
+                tables.Order.__table__,
+                tables.OrderItem.__table__,
+                tables.Transaction.__table__,
+            )
+        }
+        self.company_account_id = self._get_or_create_company_account()
+
+        self.services = _CopyBuffer(tables.Service.__table__, ["id", "name", "price", "description"])
+        self.users = _CopyBuffer(
+            tables.User.__table__, ["id", "first_name", "last_name", "username", "email", "phone_number"]
+        )
+        self.user_accounts = _CopyBuffer(tables.UserAccount.__table__, ["id", "type", "balance", "user_id"])
+        self.orders = _CopyBuffer(tables.Order.__table__, ["id", "status", "total_amount", "user_id"])
+        self.order_items = _CopyBuffer(
+            tables.OrderItem.__table__, ["id", "quantity", "price", "service_id", "order_id"]
+        )
+        self.transactions = _CopyBuffer(
+            tables.Transaction.__table__,
+            [
+                "id", "amount", "type", "description", "date", "order_id", "from_user_id", "to_user_id",
+                "to_company_account",
+            ],
+        )
+        self.ledger_entries = _CopyBuffer(
+            tables.LedgerEntry.__table__, ["user_id", "transaction_id", "date", "amount"]
+        )
+
+        self.services_prices: dict[int, Decimal] = {}
+        self.user_ids: list[int] = []
+        self.regular_balances: dict[int, Decimal] = {}
+        self.reserve_balances: dict[int, Decimal] = {}
+        self.company_account_revenue = Decimal(0)
+        # orders are written before their final status is known, so statuses are kept aside (one byte per order)
+        self.first_order_id = self.last_ids[tables.Order.__table__] + 1
+        self.orders_statuses = bytearray()
+        self.in_progress_orders: dict[int, list[tuple[int, Decimal]]] = {}
+
+    def generate(self) -> None:
+        self._generate_services()
+        self._generate_users()
+        self._generate_transactions_history()
+        self._generate_user_accounts()
+
+    def load(self) -> dict[str, int]:
+        """Loads generated rows (in the order of foreign keys) and returns the number of rows loaded to each table"""
+        orders_with_statuses = self._add_statuses_to_orders()
+        frozen_order_items = self._freeze_submitted_orders_items()
+        copy_buffers = [
+            self.services,
+            self.users,
+            self.user_accounts,
+            orders_with_statuses,
+            frozen_order_items,
+            self.transactions,
+            self.ledger_entries,
+        ]
+
+        cursor = self.session.connection().connection.cursor()
+        for copy_buffer in copy_buffers:
+            copy_buffer.copy_to_database(cursor)
+
+        company_accounts = tables.CompanyAccount.__table__
+        self.session.execute(
+            sa.update(company_accounts)
+            .where(company_accounts.c.id == self.company_account_id)
+            .values(balance=company_accounts.c.balance + self.company_account_revenue)
+        )
+        for table in self.last_ids:
+            self.session.execute(
+                sa.select(sa.func.setval(sa.func.pg_get_serial_sequence(table.name, "id"), sa.func.max(table.c.id)))
+            )
+
+        return {copy_buffer.table.name: copy_buffer.rows_count for copy_buffer in copy_buffers}
+
+    def _get_or_create_company_account(self) -> int:
+        company_accounts = tables.CompanyAccount.__table__
+        company_account_id = self.session.scalar(sa.select(sa.func.min(company_accounts.c.id)))
+        if company_account_id is None:
+            company_account_id = self.session.scalar(
+                sa.insert(company_accounts)
+                .values(balance=0, bank_account_number="00000000000000000", bank="Synthetic Bank")
+                .returning(company_accounts.c.id)
+            )
+
+        return company_account_id
+
+    def _next_id(self, table: sa.Table) -> int:
+        self.last_ids[table] += 1
+        return self.last_ids[table]
+
+    def _generate_services(self) -> None:
+        for _ in range(self.services_count):
+            service_id = self._next_id(tables.Service.__table__)
+            price = Decimal(random.randint(1, 100) * 1000)
+            self.services.write(service_id, f"Service {service_id}", price, f"Synthetic service {service_id}")
+            self.services_prices[service_id] = price
+
+    def _generate_users(self) -> None:
+        for _ in range(self.users_count):
+            user_id = self._next_id(tables.User.__table__)
+            self.users.write(
+                user_id, "First name", f"Last name {user_id}", f"user_{user_id}", f"user_{user_id}@example.com",
+                f"+{10 ** 10 + user_id}",
+            )
+            self.user_ids.append(user_id)
+            self.regular_balances[user_id] = Decimal(0)
+            self.reserve_balances[user_id] = Decimal(0)
+
+    def _generate_user_accounts(self) -> None:
+        for user_id in self.user_ids:
+            for account_type, balances in (
+                (AccountType.REGULAR, self.regular_balances),
+                (AccountType.RESERVE, self.reserve_balances),
+            ):
+                self.user_accounts.write(
+                    self._next_id(tables.UserAccount.__table__), account_type.name, balances[user_id], user_id
+                )
+
+    def _generate_transactions_history(self) -> None:
+        """
+        Transactions are generated in chronological order, each one is applied to the balances right away,
+        so a transaction is only generated if its sender can afford it (a deposit is generated otherwise).
+        """
+        activity_cum_weights = list(
+            itertools.accumulate(random.paretovariate(ACTIVITY_SKEW) for _ in self.user_ids)
+        )
+        history_step = (self.history_end - self.history_start) / max(self.transactions_count, 1)
+
+        for chunk_start in range(0, self.transactions_count, ACTORS_SAMPLE_SIZE):
+            chunk_size = min(ACTORS_SAMPLE_SIZE, self.transactions_count - chunk_start)
+            actors = random.choices(self.user_ids, cum_weights=activity_cum_weights, k=chunk_size * 2)
+            for index, (user_id, counterparty_id) in enumerate(zip(actors[::2], actors[1::2]), start=chunk_start):
+                date = self.history_start + history_step * (index + random.random())
+                self._generate_transaction(user_id, counterparty_id, date)
+
+    def _generate_transaction(self, user_id: int, counterparty_id: int, date: datetime.datetime) -> None:
+        regular_balance = int(self.regular_balances[user_id])
+        transaction_kind = random.random()
+
+        if transaction_kind < 0.3 or regular_balance < 1:
+            amount = Decimal(random.randint(1, 500) * 100)
+            self._write_transaction(TransactionType.DEPOSIT, amount, date, to_user_id=user_id)
+
+        elif transaction_kind < 0.55 and counterparty_id != user_id:
+            amount = Decimal(random.randint(1, regular_balance))
+            self._write_transaction(
+                TransactionType.FUNDS_TRANSFER, amount, date, from_user_id=user_id, to_user_id=counterparty_id
+            )
+
+        elif self.in_progress_orders.get(user_id) and random.random() < 0.6:
+            order_id, amount = self.in_progress_orders[user_id].pop(0)
+            transaction_type = (
+                TransactionType.PAYMENT_TO_COMPANY if random.random() < 0.8 else TransactionType.RESERVE_REFUND
+            )
+            self._write_transaction(transaction_type, amount, date, order_user_id=user_id, order_id=order_id)
+
+        else:
+            order_id, total_amount = self._write_order(user_id)
+            if total_amount <= regular_balance:
+                self._write_transaction(
+                    TransactionType.RESERVE, total_amount, date, order_user_id=user_id, order_id=order_id
+                )
+                self.in_progress_orders.setdefault(user_id, []).append((order_id, total_amount))
+            else:
+                # the order is left not submitted, user tops up the account instead
+                self._write_transaction(TransactionType.DEPOSIT, total_amount, date, to_user_id=user_id)
+
+    def _write_order(self, user_id: int) -> tuple[int, Decimal]:
+        order_id = self._next_id(tables.Order.__table__)
+        total_amount = Decimal(0)
+        for service_id in random.sample(list(self.services_prices), k=min(random.randint(1, 3), self.services_count)):
+            quantity = random.randint(1, 3)
+            self.order_items.write(
+                self._next_id(tables.OrderItem.__table__), quantity, self.services_prices[service_id], service_id,
+                order_id,
+            )
+            total_amount += quantity * self.services_prices[service_id]
+
+        self.orders.write(order_id, total_amount, user_id)
+        self.orders_statuses.append(ORDER_STATUSES.index(OrderStatus.NOT_SUBMITTED))
+        return order_id, total_amount
+
+    def _write_transaction(
+        self,
+        type_: TransactionType,
+        amount: Decimal,
+        date: datetime.datetime,
+        *,
+        from_user_id: int | None = None,
+        to_user_id: int | None = None,
+        order_user_id: int | None = None,
+        order_id: int | None = None,
+    ) -> None:
+        """Writes the transaction along with its ledger entries and applies it to the balances"""
+        transaction_id = self._next_id(tables.Transaction.__table__)
+        # just like in the service, order-based transactions' descriptions and ledger entries are of the user who made
+        # the order (the record's 'from_user_id' is the sender of a funds transfer only)
+        entry_from_user_id = from_user_id or order_user_id
+        description = (
+            None
+            if settings.COMPACT_TRANSACTION_DESCRIPTIONS and type_ in COMPACT_DESCRIPTION_TRANSACTION_TYPES
+            else render_transaction_description(type_, amount, date, entry_from_user_id, to_user_id, order_id)
+        )
+        to_company_account = self.company_account_id if type_ == TransactionType.PAYMENT_TO_COMPANY else None
+        self.transactions.write(
+            transaction_id, amount, type_.name, description, date, order_id, from_user_id, to_user_id,
+            to_company_account,
+        )
+        for user_id in (entry_from_user_id, to_user_id):
+            if user_id is not None:
+                self.ledger_entries.write(user_id, transaction_id, date, amount)
+
+        if type_ == TransactionType.DEPOSIT:
+            self.regular_balances[to_user_id] += amount
+        elif type_ == TransactionType.FUNDS_TRANSFER:
+            self.regular_balances[from_user_id] -= amount
+            self.regular_balances[to_user_id] += amount
+        elif type_ == TransactionType.RESERVE:
+            self.regular_balances[order_user_id] -= amount
+            self.reserve_balances[order_user_id] += amount
+            self._set_order_status(order_id, OrderStatus.IN_PROGRESS)
+        elif type_ == TransactionType.RESERVE_REFUND:
+            self.reserve_balances[order_user_id] -= amount
+            self.regular_balances[order_user_id] += amount
+            self._set_order_status(order_id, OrderStatus.CANCELLED)
+        elif type_ == TransactionType.PAYMENT_TO_COMPANY:
+            self.reserve_balances[order_user_id] -= amount
+            self.company_account_revenue += amount
+            self._set_order_status(order_id, OrderStatus.COMPLETED)
+
+    def _set_order_status(self, order_id: int, status: OrderStatus) -> None:
+        self.orders_statuses[order_id - self.first_order_id] = ORDER_STATUSES.index(status)
+
+    def _is_order_frozen(self, order_id: int) -> bool:
+        """Just like in the service, total amount (and items' prices) are only stored once the order is submitted"""
+        status = ORDER_STATUSES[self.orders_statuses[order_id - self.first_order_id]]
+        return settings.FREEZE_ORDERS_TOTAL_AMOUNT and status != OrderStatus.NOT_SUBMITTED
+
+    def _add_statuses_to_orders(self) -> _CopyBuffer:
+        orders_with_statuses = _CopyBuffer(self.orders.table, self.orders.columns)
+        self.orders.file.seek(0)
+        for (order_id, total_amount, user_id), status in zip(csv.reader(self.orders.file), self.orders_statuses):
+            orders_with_statuses.write(
+                order_id,
+                ORDER_STATUSES[status].name,
+                total_amount if self._is_order_frozen(int(order_id)) else None,
+                user_id,
+            )
+        self.orders.file.close()
+
+        return orders_with_statuses
+
+    def _freeze_submitted_orders_items(self) -> _CopyBuffer:
+        frozen_order_items = _CopyBuffer(self.order_items.table, self.order_items.columns)
+        self.order_items.file.seek(0)
+        for order_item_id, quantity, price, service_id, order_id in csv.reader(self.order_items.file):
+            frozen_order_items.write(
+                order_item_id, quantity, price if self._is_order_frozen(int(order_id)) else None, service_id, order_id
+            )
+        self.order_items.file.close()
+
+        return frozen_order_items
+
+
+def generate_data(
+    *,
+    users_count: int,
+    transactions_count: int,
+    services_count: int = 50,
+    months: int = 24,
+    seed: int | None = None,
+) -> dict[str, int]:
+    """Returns the number of rows loaded to each table."""
+    random.seed(seed)
+    # otherwise generated history would be loaded to the default partition of transactions
+    create_transactions_partitions(since=datetime.datetime.utcnow().date() - datetime.timedelta(days=30 * months))
+
+    with Session() as session:
+        data_generator = _DataGenerator(
+            session,
+            users_count=users_count,
+            transactions_count=transactions_count,
+            services_count=services_count,
+            months=months,
+        )
+        data_generator.generate()
+        loaded_rows = data_generator.load()
+        # fresh statistics - otherwise query plans are checked against the ones of the almost empty tables
+        session.execute(sa.text("ANALYZE"))
+        session.commit()
+
+    loaded_rows[tables.ServiceRevenueMonthly.__tablename__] = backfill_service_revenue()
+    return loaded_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic data and loads it to the database.")
+    parser.add_argument("--users", type=int, required=True, help="number of users to generate")
+    parser.add_argument("--transactions", type=int, required=True, help="number of transactions to generate")
+    parser.add_argument("--services", type=int, default=50, help="number of services to generate")
+    parser.add_argument("--months", type=int, default=24, help="transactions' history length")
+    parser.add_argument("--seed", type=int, default=None, help="random seed (for reproducible data)")
+    args = parser.parse_args()
+
+    for table_name, rows_count in generate_data(
+        users_count=args.users,
+        transactions_count=args.transactions,
+        services_count=args.services,
+        months=args.months,
+        seed=args.seed,
+    ).items():
+        print(f"{table_name}: {rows_count} rows loaded")
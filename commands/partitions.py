@@ -0,0 +1,155 @@
+"""
+Maintenance of the monthly partitions of the transactions table (partitioned by range of dates):
+ create - creates partitions of the months ahead (and of the past months since --since, e.g. before loading
+          a history); transactions of those months which have landed in the default partition are moved to them;
+ list - lists partitions with their bounds and sizes;
+ detach - detaches partitions of the months before --before, they become standalone tables which can be archived
+          (e.g. with pg_dump) and dropped. Detached months' transactions disappear from users' histories.
+Partitions of the months ahead should be created periodically (e.g. monthly by cron) - otherwise new transactions
+land in the default partition. Each partition can be vacuumed on its own, e.g. VACUUM (ANALYZE) transactions_y2023m01.
+
+Usage:
+    python -m commands.partitions create [--months-ahead 3] [--since 2023-01]
+    python -m commands.partitions list
+    python -m commands.partitions detach --before 2022-01
+"""
+import argparse
+import datetime
+import re
+
+import sqlalchemy as sa
+
+from settings import settings
+from storage.database import Session
+
+
+DEFAULT_PARTITION_NAME = "transactions_default"
+MONTHLY_PARTITION_NAME_PATTERN = re.compile(r"transactions_y(\d{4})m(\d{2})")
+
+
+def get_transactions_partition_name(month: datetime.date) -> str:
+    return f"transactions_y{month.year}m{month.month:02d}"
+
+
+def _get_next_month(month: datetime.date) -> datetime.date:
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _get_transactions_partitions(session: sa.orm.Session) -> list[sa.engine.Row]:
+    return session.execute(
+        sa.text(
+            """
+            SELECT partition_table.relname AS name,
+                   pg_get_expr(partition_table.relpartbound, partition_table.oid) AS bounds,
+                   pg_total_relation_size(partition_table.oid) AS size_bytes
+            FROM pg_inherits
+            JOIN pg_class partitioned_table ON partitioned_table.oid = pg_inherits.inhparent
+            JOIN pg_class partition_table ON partition_table.oid = pg_inherits.inhrelid
+            WHERE partitioned_table.relname = 'transactions'
+            ORDER BY partition_table.relname
+            """
+        )
+    ).all()
+
+
+def create_transactions_partitions(
+    *, months_ahead: int = settings.TRANSACTIONS_PARTITIONS_MONTHS_AHEAD, since: datetime.date | None = None
+) -> list[str]:
+    """Returns the names of the partitions created."""
+    current_month = datetime.datetime.utcnow().date().replace(day=1)
+    month = min(since.replace(day=1), current_month) if since else current_month
+    last_month = current_month
+    for _ in range(months_ahead):
+        last_month = _get_next_month(last_month)
+
+    created_partitions = []
+    with Session() as session:
+        existing_partitions = {partition.name for partition in _get_transactions_partitions(session)}
+        while month <= last_month:
+            partition_name = get_transactions_partition_name(month)
+            if partition_name not in existing_partitions:
+                _create_transactions_partition(session, partition_name, month, _get_next_month(month))
+                # each partition is created in its own (short) transaction - the default partition is locked by it
+                session.commit()
+                created_partitions.append(partition_name)
+            month = _get_next_month(month)
+
+    return created_partitions
+
+
+def _create_transactions_partition(
+    session: sa.orm.Session, partition_name: str, month: datetime.date, next_month: datetime.date
+) -> None:
+    """
+    A partition can't be created for the range of dates some of the default partition's rows fall into, so the table
+    is created on its own, gets the rows of its month from the default partition and then is attached.
+    """
+    session.execute(
+        sa.text(f"CREATE TABLE {partition_name} (LIKE transactions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    )
+    session.execute(
+        sa.text(
+            f"""
+            WITH moved_transactions AS (
+                DELETE FROM {DEFAULT_PARTITION_NAME} WHERE date >= :month AND date < :next_month RETURNING *
+            )
+            INSERT INTO {partition_name} SELECT * FROM moved_transactions
+            """
+        ),
+        {"month": month, "next_month": next_month},
+    )
+    # partition's indexes (the same ones as the partitioned table's) are created when it is attached
+    session.execute(
+        sa.text(
+            f"ALTER TABLE transactions ATTACH PARTITION {partition_name} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        )
+    )
+
+
+def detach_transactions_partitions(*, before: datetime.date) -> list[str]:
+    """Returns the names of the partitions detached."""
+    detached_partitions = []
+    with Session() as session:
+        for partition in _get_transactions_partitions(session):
+            partition_month = MONTHLY_PARTITION_NAME_PATTERN.fullmatch(partition.name)
+            if partition_month and datetime.date(*map(int, partition_month.groups()), 1) < before.replace(day=1):
+                session.execute(sa.text(f"ALTER TABLE transactions DETACH PARTITION {partition.name}"))
+                session.commit()
+                detached_partitions.append(partition.name)
+
+    return detached_partitions
+
+
+def _parse_month(month: str) -> datetime.date:
+    return datetime.datetime.strptime(month, "%Y-%m").date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintains monthly partitions of the transactions table.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    create_parser = subparsers.add_parser("create", help="create partitions of the months ahead")
+    create_parser.add_argument(
+        "--months-ahead", type=int, default=settings.TRANSACTIONS_PARTITIONS_MONTHS_AHEAD,
+        help="number of months after the current one to create partitions for",
+    )
+    create_parser.add_argument(
+        "--since", type=_parse_month, default=None, help="first month (YYYY-MM) to create a partition for"
+    )
+    subparsers.add_parser("list", help="list partitions")
+    detach_parser = subparsers.add_parser("detach", help="detach partitions of the old months")
+    detach_parser.add_argument(
+        "--before", type=_parse_month, required=True, help="partitions of the months before this one (YYYY-MM)"
+    )
+    args = parser.parse_args()
+
+    if args.action == "create":
+        created_partitions = create_transactions_partitions(months_ahead=args.months_ahead, since=args.since)
+        print(f"Partitions created: {', '.join(created_partitions) or 'none'}")
+    elif args.action == "list":
+        with Session() as session:
+            for partition in _get_transactions_partitions(session):
+                print(f"{partition.name}: {partition.bounds} ({partition.size_bytes} bytes)")
+    else:
+        detached_partitions = detach_transactions_partitions(before=args.before)
+        print(f"Partitions detached: {', '.join(detached_partitions) or 'none'}")
@@ -0,0 +1,41 @@
+import datetime
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from commands.compact_transaction_descriptions import compact_transaction_descriptions
+from storage import tables
+from storage.database import Session
+from storage.tables import TransactionType
+
+
+def test_compact_transaction_descriptions():
+    transactions = tables.Transaction.__table__
+    with Session() as session:
+        inserted_transactions = session.execute(
+            sa.insert(transactions)
+            .values(
+                [
+                    {"type": type_, "amount": Decimal(1), "date": datetime.datetime.utcnow(), "description": "Stored"}
+                    for type_ in (TransactionType.DEPOSIT, TransactionType.RESERVE)
+                ]
+            )
+            .returning(transactions.c.type, transactions.c.id)
+        ).all()
+        session.commit()
+    transactions_ids = dict(inserted_transactions)
+    deposit_id, reserve_id = transactions_ids[TransactionType.DEPOSIT], transactions_ids[TransactionType.RESERVE]
+
+    # batches smaller than the table - each one continues where the previous one has ended
+    assert compact_transaction_descriptions(batch_size=2) >= 1
+
+    with Session() as session:
+        stored_descriptions = dict(
+            session.execute(
+                sa.select(transactions.c.id, transactions.c.description).where(
+                    transactions.c.id.in_([deposit_id, reserve_id])
+                )
+            ).all()
+        )
+    # order-based transactions' descriptions are kept
+    assert stored_descriptions == {deposit_id: None, reserve_id: "Stored"}
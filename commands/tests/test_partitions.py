@@ -0,0 +1,87 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+
+from commands.partitions import (
+    DEFAULT_PARTITION_NAME,
+    _create_transactions_partition,
+    _get_transactions_partitions,
+    create_transactions_partitions,
+    detach_transactions_partitions,
+    get_transactions_partition_name,
+)
+from storage import tables
+from storage.database import Session
+from storage.tables import TransactionType
+
+
+# months far from the real transactions' ones, so that tests don't touch the real partitions
+FUTURE_MONTH = datetime.date(2999, 1, 1)
+PAST_MONTH = datetime.date(1900, 1, 1)
+
+
+def get_partitions_names() -> set[str]:
+    with Session() as session:
+        return {partition.name for partition in _get_transactions_partitions(session)}
+
+
+@pytest.fixture
+def drop_tables():
+    """Drops the (partitions') tables the test has created"""
+    table_names = []
+    yield table_names
+    with Session() as session:
+        for table_name in table_names:
+            session.execute(sa.text(f"DROP TABLE IF EXISTS {table_name}"))
+        session.commit()
+
+
+def test_create_transactions_partitions():
+    current_month = datetime.datetime.utcnow().date().replace(day=1)
+    next_month = (current_month + datetime.timedelta(days=31)).replace(day=1)
+
+    create_transactions_partitions(months_ahead=1)
+
+    expected_partitions = {get_transactions_partition_name(month) for month in (current_month, next_month)}
+    assert expected_partitions <= get_partitions_names()
+    assert create_transactions_partitions(months_ahead=1) == []
+
+
+def test_partition_gets_its_month_transactions_from_default_partition(drop_tables):
+    transactions = tables.Transaction.__table__
+    partition_name = get_transactions_partition_name(FUTURE_MONTH)
+    drop_tables.append(partition_name)
+    with Session() as session:
+        transaction_id = session.scalar(
+            sa.insert(transactions)
+            .values(type=TransactionType.DEPOSIT, amount=Decimal(1), date=datetime.datetime(2999, 1, 15))
+            .returning(transactions.c.id)
+        )
+        session.commit()
+        assert session.scalar(sa.text(f"SELECT count(*) FROM {DEFAULT_PARTITION_NAME} WHERE id = {transaction_id}"))
+
+        _create_transactions_partition(session, partition_name, FUTURE_MONTH, datetime.date(2999, 2, 1))
+        session.commit()
+
+        assert partition_name in get_partitions_names()
+        assert not session.scalar(sa.text(f"SELECT count(*) FROM {DEFAULT_PARTITION_NAME} WHERE id = {transaction_id}"))
+        assert session.scalar(sa.text(f"SELECT count(*) FROM {partition_name} WHERE id = {transaction_id}")) == 1
+        # still a transaction of the partitioned table
+        assert session.scalar(sa.select(transactions.c.amount).where(transactions.c.id == transaction_id)) == 1
+
+
+def test_detach_transactions_partitions(drop_tables):
+    partition_name = get_transactions_partition_name(PAST_MONTH)
+    drop_tables.append(partition_name)
+    with Session() as session:
+        _create_transactions_partition(session, partition_name, PAST_MONTH, datetime.date(1900, 2, 1))
+        session.commit()
+
+    assert detach_transactions_partitions(before=datetime.date(1900, 2, 1)) == [partition_name]
+
+    assert partition_name not in get_partitions_names()
+    with Session() as session:
+        # a standalone table, which can be archived
+        assert session.scalar(sa.text(f"SELECT count(*) FROM {partition_name}")) == 0
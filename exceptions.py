@@ -17,3 +17,9 @@ class ExceptionDescription(str, Enum):
     TRANSACTION_DOES_NOT_EXIST = "Transaction doesn't exist."
     ORDER_DOES_NOT_EXIST = "Specified order does not exist."
     COMPANY_ACCOUNT_DOES_NOT_EXIST = "Specified company account does not exist."
+    TRANSACTION_TYPE_CANNOT_BE_BATCHED = "Only 'deposit' and 'funds transfer' transactions can be applied in a batch."
+    TRANSACTION_NOT_APPLIED_DUE_TO_BATCH_FAILURE = "Transaction was not applied since other transactions in the " \
+                                                   "batch failed."
+    REQUEST_WITH_IDEMPOTENCY_KEY_IS_IN_PROGRESS = "Request with the same idempotency key is being processed."
+    IDEMPOTENCY_KEY_REUSED_FOR_ANOTHER_REQUEST = "Idempotency key has already been used for another request."
+    INVALID_PAGINATION_CURSOR = "Pagination cursor is invalid or doesn't match the requested sorting."
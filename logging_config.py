@@ -5,8 +5,10 @@ class LoggingConfig(BaseModel):
     LOGGER_NAME = "avito account balance microservice"
     LOGGING_FORMAT = "%(levelprefix)s | %(asctime)s | %(message)s"  # TODO: to look for a format config!
     LOGGING_LEVEL = "INFO"
+    SLOW_QUERIES_LOGGER_NAME = "slow queries"
 
     # Logging config - https://stackoverflow.com/questions/63510041/adding-python-logging-to-fastapi-endpoints-hosted-on-docker-doesnt-display-api
+    version = 1
     disable_existing_loggers = False
     formatters = {
         "default": {
@@ -15,5 +17,15 @@ class LoggingConfig(BaseModel):
             "datefmt": "%Y-%m-%d %H:%M:%S",
         }
     }
-    handlers = {}
-    loggers = {}
+    handlers = {
+        "default": {
+            "formatter": "default",
+            "class": "logging.StreamHandler",
+            "stream": "ext://sys.stderr",
+        },
+    }
+    loggers = {
+        LOGGER_NAME: {"handlers": ["default"], "level": LOGGING_LEVEL},
+        # slow queries are logged as json objects (one per line) - see storage/query_stats.py
+        SLOW_QUERIES_LOGGER_NAME: {"handlers": ["default"], "level": "WARNING", "propagate": False},
+    }
@@ -1,10 +1,21 @@
 import logging
+import logging.config
+import time
+
 import uvicorn
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
 
+from logging_config import LoggingConfig
 from settings import settings
+from api.internal import router as internal_router
 from api.v1 import router
+from services.coalescer import write_coalescer
+from services.metrics import http_request_duration_seconds, http_requests_in_flight
+from storage.database import async_engine, replica_engines
+from storage.query_stats import QueryStats, request_query_stats
 
 
 TAGS_METADATA = [
@@ -17,6 +28,7 @@ TAGS_METADATA = [
         "name": "information",
         "description": "Account balance/transactions information functionality",
     },
+    {"name": "internal", "description": "Service internals (caches, connection pools etc.) monitoring"},
 ]
 
 # logger = ...
@@ -29,18 +41,69 @@ app = FastAPI(
 )
 
 app.include_router(router)
+app.include_router(internal_router)
 
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
+    logging.config.dictConfig(LoggingConfig().dict())
+    if settings.WRITE_COALESCER_ENABLED:
+        await write_coalescer.start()
     # logger.info("Starting up...")
-    pass
 
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     # logger.info("Shutting down...")
-    pass
+    await write_coalescer.stop()
+    await async_engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
+
+
+@app.middleware("http")
+async def measure_request_duration(request: Request, call_next) -> Response:
+    """
+    Requests' latencies are labelled with route path templates (not with actual paths) to keep the number of
+    time series bounded.
+    """
+    request_started_at = time.perf_counter()
+    with http_requests_in_flight.track_inprogress():
+        response = await call_next(request)
+
+    http_request_duration_seconds.labels(
+        method=request.method,
+        route=_get_route_path(request),
+        status_code=response.status_code,
+    ).observe(time.perf_counter() - request_started_at)
+
+    return response
+
+
+@app.middleware("http")
+async def add_server_timing_header(request: Request, call_next) -> Response:
+    """
+    Adds number of SQL statements executed while handling the request, total time spent on them and the time of
+    the slowest one to 'Server-Timing' header (statements executed while streaming the response are not included).
+    """
+    query_stats = QueryStats(request=f"{request.method} {request.url.path}")
+    request_query_stats_token = request_query_stats.set(query_stats)
+    try:
+        response = await call_next(request)
+    finally:
+        request_query_stats.reset(request_query_stats_token)
+
+    response.headers["Server-Timing"] = query_stats.to_server_timing_header()
+    return response
+
+
+def _get_route_path(request: Request) -> str:
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+
+    return "unmatched"
 
 
 @app.exception_handler(ValueError)
@@ -60,6 +123,12 @@ def welcome_page(request: Request) -> JSONResponse:
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    """Metrics of the worker process which handled the request in Prometheus text exposition format"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
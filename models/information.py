@@ -3,6 +3,13 @@ from decimal import Decimal
 import pydantic
 from pydantic import BaseModel
 
+from models.transactions import (
+    DepositTransactionOut,
+    FundsTransferTransactionOut,
+    ReserveTransactionOut,
+    ReserveRefundTransactionOut,
+    PaymentTransactionOut,
+)
 from storage.tables import AccountType
 
 
@@ -13,3 +20,31 @@ class UserAccountOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class UserAccountsBalanceOut(BaseModel):
+    user_id: int
+    accounts: list[UserAccountOut] | None = None  # regular and reserve accounts, not provided if not found
+    detail: str | None = None  # why the accounts were not found
+
+
+class CompanyAccountOut(BaseModel):
+    id: int
+    balance: pydantic.condecimal(ge=Decimal(0))  # including the balances of company account's shards
+    bank_account_number: str
+    bank: str
+
+    class Config:
+        orm_mode = True
+
+
+class AccountTransactionsPageOut(BaseModel):
+    # models with more required fields go first, so that each transaction is validated against its own model
+    transactions: list[
+        FundsTransferTransactionOut |
+        PaymentTransactionOut |
+        DepositTransactionOut |
+        ReserveTransactionOut |
+        ReserveRefundTransactionOut
+    ]
+    next_cursor: str | None = None  # not provided for the last page
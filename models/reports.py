@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class ReportDetailLevel(str, Enum):
+    SERVICES = "services"  # total revenue from each service
+    ORDERS = "orders"  # revenue from each paid order
+    TRANSACTIONS = "transactions"  # revenue from each service in each payment transaction
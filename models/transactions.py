@@ -5,6 +5,7 @@ import pydantic
 from pydantic import BaseModel
 
 from exceptions import ExceptionDescription
+from settings import settings
 from storage.tables import TransactionType
 
 
@@ -84,3 +85,52 @@ class ReserveRefundTransactionOut(ReserveRefundTransactionIn, BaseTransactionOut
 
 class PaymentTransactionOut(PaymentTransactionIn, BaseTransactionOut):
     pass
+
+
+class BatchTransactionIn(BaseModel):
+    """
+    Deposits and funds transfers to be applied within one database transaction.
+    If 'all_or_nothing' is set, none of the transactions are applied unless all of them succeed; otherwise each
+    transaction succeeds or fails on its own.
+    """
+    transactions: pydantic.conlist(
+        FundsTransferTransactionIn | DepositTransactionIn,
+        min_items=1,
+        max_items=settings.MAX_TRANSACTIONS_PER_BATCH,
+    )
+    all_or_nothing: bool = False
+
+    class Config:
+        smart_union = True  # keeps transaction models chosen by the validator below
+
+    @pydantic.validator("transactions", pre=True)
+    @classmethod
+    def parse_transactions_by_type(cls, values):
+        """Transaction type has to be specified explicitly for each transaction in the batch."""
+        batch_transaction_models = {
+            TransactionType.DEPOSIT.value: DepositTransactionIn,
+            TransactionType.FUNDS_TRANSFER.value: FundsTransferTransactionIn,
+        }
+
+        parsed_transactions = []
+        for transaction in values:
+            if isinstance(transaction, dict):
+                transaction_model = batch_transaction_models.get(transaction.get("type"))
+                if not transaction_model:
+                    raise ValueError(ExceptionDescription.TRANSACTION_TYPE_CANNOT_BE_BATCHED.value)
+                transaction = transaction_model.parse_obj(transaction)
+            parsed_transactions.append(transaction)
+
+        return parsed_transactions
+
+
+class BatchTransactionResultOut(BaseModel):
+    index: int  # position of the transaction in the batch
+    status_code: int
+    detail: str | None = None
+    transaction: FundsTransferTransactionOut | DepositTransactionOut | None = None
+
+
+class BatchTransactionOut(BaseModel):
+    committed: bool
+    results: list[BatchTransactionResultOut]
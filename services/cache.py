@@ -0,0 +1,148 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+from models.information import UserAccountOut
+from settings import settings
+
+
+class LRUCache:
+    """
+    In-process LRU cache with entries' expiration (TTL).
+    Not shared between worker processes - each process keeps its own entries.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float | None = None) -> None:
+        """Entry expires after the cache's TTL, unless a shorter one is given (e.g. the rest of the value's lifetime)"""
+        self._entries[key] = (time.monotonic() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class BalanceCache(ABC):
+    """
+    Cache of users' accounts' balances.
+    Writers invalidate users' entries after each commit. Each invalidation gets a version stamp, so that a balance
+    read from the database before the invalidation can't be put into the cache after it (see set()).
+    """
+
+    def __init__(self) -> None:
+        self.invalidations = 0
+
+    @abstractmethod
+    def get(self, user_id: int) -> list[UserAccountOut] | None:
+        ...
+
+    def get_version(self) -> int:
+        """Version to be passed to set() - has to be taken before the balances are read from the database."""
+        return self.invalidations
+
+    @abstractmethod
+    def set(self, user_id: int, accounts: list[UserAccountOut], version: int) -> None:
+        """Balances are not cached if user's entry has been invalidated since the version was taken."""
+
+    @abstractmethod
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        ...
+
+    @abstractmethod
+    def get_stats(self) -> dict[str, int | float]:
+        ...
+
+
+class NoBalanceCache(BalanceCache):
+    """Balances are always read from the database."""
+
+    def get(self, user_id: int) -> list[UserAccountOut] | None:
+        return None
+
+    def set(self, user_id: int, accounts: list[UserAccountOut], version: int) -> None:
+        pass
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        pass
+
+    def get_stats(self) -> dict[str, int | float]:
+        return {}
+
+
+class InMemoryBalanceCache(BalanceCache):
+    """
+    Per-process LRU cache with entries' expiration.
+    Writes made by other worker processes invalidate nothing here, so entries are only kept for a short TTL.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        super().__init__()
+        self._balances = LRUCache(max_size, ttl_seconds)
+        # version stamp of the last invalidation of each user's entry (the oldest ones are dropped and only
+        # the latest dropped version stamp is kept - it is used for users whose version stamps were dropped)
+        self._invalidated_at: OrderedDict[int, int] = OrderedDict()
+        self._max_invalidated_versions = max_size
+        self._dropped_version = -1
+
+    def get(self, user_id: int) -> list[UserAccountOut] | None:
+        return self._balances.get(user_id)
+
+    def set(self, user_id: int, accounts: list[UserAccountOut], version: int) -> None:
+        if self._invalidated_at.get(user_id, self._dropped_version) > version:
+            return
+
+        self._balances.set(user_id, accounts)
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            self.invalidations += 1
+            self._balances.pop(user_id)
+            self._invalidated_at[user_id] = self.invalidations
+            self._invalidated_at.move_to_end(user_id)
+
+        while len(self._invalidated_at) > self._max_invalidated_versions:
+            _, self._dropped_version = self._invalidated_at.popitem(last=False)
+
+    def get_stats(self) -> dict[str, int | float]:
+        requests = self._balances.hits + self._balances.misses
+        return {
+            "hits": self._balances.hits,
+            "misses": self._balances.misses,
+            "hit_rate": self._balances.hits / requests if requests else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._balances),
+        }
+
+
+def create_balance_cache(backend: str) -> BalanceCache:
+    balance_cache_backends = {
+        "none": lambda: NoBalanceCache(),
+        "memory": lambda: InMemoryBalanceCache(settings.BALANCE_CACHE_SIZE, settings.BALANCE_CACHE_TTL_SECONDS),
+    }
+    return balance_cache_backends[backend]()
+
+
+balance_cache = create_balance_cache(settings.BALANCE_CACHE_BACKEND)
@@ -0,0 +1,151 @@
+import asyncio
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models.transactions import (
+    BatchTransactionIn,
+    DepositTransactionIn,
+    DepositTransactionOut,
+    FundsTransferTransactionIn,
+    FundsTransferTransactionOut,
+)
+from services.information import InformationService
+from services.transactions import TransactionsService
+from settings import settings
+from storage.database import AsyncSessionLocal
+from storage.tables import TransactionType
+
+
+class WriteCoalescer:
+    """
+    Group commit of deposits and funds transfers: transactions submitted by concurrent requests are queued
+    for a few milliseconds and applied as a batch (see TransactionsService.apply_transactions_batch()) within
+    a single database transaction, then each request gets the result of its own transaction.
+    If the batch as a whole fails before it is committed (e.g. runs out of retries), its transactions are applied
+    one by one.
+    """
+
+    def __init__(self, *, max_delay_seconds: float, max_batch_size: int) -> None:
+        self.max_delay_seconds = max_delay_seconds
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._apply_batches())
+
+    async def stop(self) -> None:
+        """Applies the transactions which are already queued and stops"""
+        if not self.is_running:
+            return
+
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def submit(
+        self, transaction_data: DepositTransactionIn | FundsTransferTransactionIn
+    ) -> DepositTransactionOut | FundsTransferTransactionOut:
+        """Queues the transaction and waits for it to be applied"""
+        transaction_result = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((transaction_data, transaction_result))
+        return await transaction_result
+
+    async def _apply_batches(self) -> None:
+        stopping = False
+        while not stopping:
+            queued_transaction = await self._queue.get()
+            if queued_transaction is None:
+                break
+
+            batch = [queued_transaction]
+            if self._queue.qsize() < self.max_batch_size - 1:
+                await asyncio.sleep(self.max_delay_seconds)  # waiting for the transactions of concurrent requests
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                queued_transaction = self._queue.get_nowait()
+                if queued_transaction is None:
+                    stopping = True
+                    break
+                batch.append(queued_transaction)
+
+            # requests keep being queued while the batch is applied - they make up the next batch
+            await self._apply_batch(batch)
+
+    async def _apply_batch(self, batch: list[tuple]) -> None:
+        batch_committed = False
+
+        def mark_batch_committed(_session: Session) -> None:
+            nonlocal batch_committed
+            batch_committed = True
+
+        try:
+            async with AsyncSessionLocal() as db_session:
+                event.listen(db_session.sync_session, "after_commit", mark_batch_committed)
+                transactions_service = TransactionsService(db_session, InformationService(db_session))
+                batch_result = await transactions_service.apply_transactions_batch(
+                    BatchTransactionIn(
+                        transactions=[transaction_data for transaction_data, _ in batch], all_or_nothing=False
+                    )
+                )
+        except Exception as err:
+            if batch_committed:
+                # the error happened after the commit (e.g. in metrics) - the batch's transactions have been applied
+                # and must not be applied again one by one, though their results are lost
+                for _, transaction_result in batch:
+                    if not transaction_result.done():
+                        transaction_result.set_exception(err)
+                return
+
+            await asyncio.gather(
+                *(
+                    self._apply_transaction(transaction_data, transaction_result)
+                    for transaction_data, transaction_result in batch
+                )
+            )
+            return
+
+        for (_, transaction_result), result in zip(batch, batch_result.results):
+            if transaction_result.done():  # the request has been cancelled (e.g. the client disconnected)
+                continue
+            if result.status_code == status.HTTP_200_OK:
+                transaction_result.set_result(result.transaction)
+            elif result.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY:
+                # the same error as the one raised by a single transaction
+                transaction_result.set_exception(ValueError(result.detail))
+            else:
+                transaction_result.set_exception(HTTPException(status_code=result.status_code, detail=result.detail))
+
+    @staticmethod
+    async def _apply_transaction(
+        transaction_data: DepositTransactionIn | FundsTransferTransactionIn,
+        transaction_result: asyncio.Future,
+    ) -> None:
+        try:
+            async with AsyncSessionLocal() as db_session:
+                transactions_service = TransactionsService(db_session, InformationService(db_session))
+                if transaction_data.type == TransactionType.FUNDS_TRANSFER:
+                    transaction = await transactions_service.transfer_funds_between_user_accounts(transaction_data)
+                    transaction = FundsTransferTransactionOut.from_orm(transaction)
+                else:
+                    transaction = await transactions_service.deposit_funds_to_account(transaction_data)
+                    transaction = DepositTransactionOut.from_orm(transaction)
+        except Exception as err:
+            if not transaction_result.done():
+                transaction_result.set_exception(err)
+            return
+
+        if not transaction_result.done():
+            transaction_result.set_result(transaction)
+
+
+write_coalescer = WriteCoalescer(
+    max_delay_seconds=settings.WRITE_COALESCER_MAX_DELAY_SECONDS,
+    max_batch_size=settings.WRITE_COALESCER_MAX_BATCH_SIZE,
+)
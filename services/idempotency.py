@@ -0,0 +1,186 @@
+import datetime
+import hashlib
+from typing import Any, Awaitable, Callable, Type
+
+import sqlalchemy as sa
+from fastapi import Depends, HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from exceptions import ExceptionDescription
+from services.cache import LRUCache
+from settings import settings
+from storage import tables
+from storage.database import get_async_db_session
+
+
+# recently stored responses - most retries happen shortly after the original request,
+# so they are replayed without touching the database at all
+recent_responses = LRUCache(
+    max_size=settings.IDEMPOTENCY_KEYS_CACHE_SIZE,
+    ttl_seconds=settings.IDEMPOTENCY_KEY_EXPIRATION_SECONDS,
+)
+
+# session.info entries: the key of the request being performed (key, request hash and response model)
+# and the response stored under it by store_response_within_transaction()
+PENDING_IDEMPOTENCY_KEY = "pending_idempotency_key"
+STORED_IDEMPOTENT_RESPONSE = "stored_idempotent_response"
+
+
+class IdempotencyService:
+    """Responsible for performing transactions sent with the same idempotency key only once"""
+
+    def __init__(self, db_session: AsyncSession = Depends(get_async_db_session)) -> None:
+        # the same session as TransactionsService's one (dependencies are cached within a request), so the key
+        # is committed together with the transaction itself (see store_response_within_transaction())
+        self.db_session = db_session
+
+    async def perform_once(
+        self,
+        idempotency_key: str | None,
+        transaction_data: BaseModel,
+        response_model: Type[BaseModel],
+        perform_transaction: Callable[[], Awaitable],
+    ) -> BaseModel:
+        """
+        Performs the transaction and stores its response under the idempotency key.
+        If the key has already been used (and hasn't expired yet), the stored response is returned instead
+        and the transaction is not performed again.
+        """
+        if not idempotency_key:
+            return await perform_transaction()
+
+        request_hash = self._get_request_hash(transaction_data, response_model)
+
+        stored_response = recent_responses.get(idempotency_key)
+        if stored_response:
+            return self._replay_response(stored_response, request_hash, response_model)
+
+        stored_key = await self.db_session.get(tables.IdempotencyKey, idempotency_key)
+        if stored_key and self._get_seconds_until_expiration(stored_key) > 0:
+            if stored_key.response is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=ExceptionDescription.REQUEST_WITH_IDEMPOTENCY_KEY_IS_IN_PROGRESS.value,
+                )
+            # the cached response expires along with the stored key
+            recent_responses.set(
+                idempotency_key,
+                (stored_key.request_hash, stored_key.response),
+                ttl_seconds=self._get_seconds_until_expiration(stored_key),
+            )
+            return self._replay_response((stored_key.request_hash, stored_key.response), request_hash, response_model)
+
+        await self._claim_idempotency_key(idempotency_key, request_hash)
+
+        self.db_session.info[PENDING_IDEMPOTENCY_KEY] = (idempotency_key, request_hash, response_model)
+        try:
+            response = await perform_transaction()
+        finally:
+            self.db_session.info.pop(PENDING_IDEMPOTENCY_KEY, None)
+            stored_response = self.db_session.info.pop(STORED_IDEMPOTENT_RESPONSE, None)
+
+        if stored_response is None:
+            # nothing has been committed (e.g. a batch which wasn't applied) - the response is stored on its own
+            if not isinstance(response, response_model):
+                response = response_model.from_orm(response)
+            await _upsert_response(self.db_session, idempotency_key, request_hash, response.json())
+            await self.db_session.commit()
+        else:
+            response = stored_response
+        recent_responses.set(idempotency_key, (request_hash, response.json()))
+
+        return response
+
+    async def _claim_idempotency_key(self, idempotency_key: str, request_hash: str) -> None:
+        """
+        Inserts the key (without the response) within the transaction to be performed: concurrent requests
+        with the same key wait for the transaction to finish and then find the key claimed.
+        An expired key is claimed anew - its row is reset by the same statement.
+        """
+        idempotency_keys = tables.IdempotencyKey.__table__
+        now = datetime.datetime.utcnow()
+        expired_before = now - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_EXPIRATION_SECONDS)
+        claimed_key = await self.db_session.execute(
+            insert(idempotency_keys)
+            .values(key=idempotency_key, request_hash=request_hash, response=None, created_at=now)
+            .on_conflict_do_update(
+                index_elements=[idempotency_keys.c.key],
+                set_={"request_hash": request_hash, "response": None, "created_at": now},
+                where=idempotency_keys.c.created_at < expired_before,
+            )
+        )
+        if not claimed_key.rowcount:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=ExceptionDescription.REQUEST_WITH_IDEMPOTENCY_KEY_IS_IN_PROGRESS.value,
+            )
+
+    @staticmethod
+    def _replay_response(
+        stored_response: tuple[str, str],
+        request_hash: str,
+        response_model: Type[BaseModel],
+    ) -> BaseModel:
+        stored_request_hash, response = stored_response
+        if stored_request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=ExceptionDescription.IDEMPOTENCY_KEY_REUSED_FOR_ANOTHER_REQUEST.value,
+            )
+
+        return response_model.parse_raw(response)
+
+    @staticmethod
+    def _get_request_hash(transaction_data: BaseModel, response_model: Type[BaseModel]) -> str:
+        return hashlib.sha256(f"{response_model.__name__}:{transaction_data.json()}".encode()).hexdigest()
+
+    @staticmethod
+    def _get_seconds_until_expiration(stored_key: tables.IdempotencyKey) -> float:
+        key_age = datetime.datetime.utcnow() - stored_key.created_at
+        return settings.IDEMPOTENCY_KEY_EXPIRATION_SECONDS - key_age.total_seconds()
+
+
+async def store_response_within_transaction(db_session: AsyncSession, result: Any) -> None:
+    """
+    Called by TransactionsService right before the commit: the response of the request being performed
+    (if it was sent with an idempotency key) is stored within the same database transaction, so that there is never
+    a committed transaction without its response (or a response without its transaction).
+    """
+    pending_idempotency_key = db_session.info.get(PENDING_IDEMPOTENCY_KEY)
+    if pending_idempotency_key is None:
+        return
+
+    idempotency_key, request_hash, response_model = pending_idempotency_key
+    response = result if isinstance(result, response_model) else response_model.from_orm(result)
+    await _upsert_response(db_session, idempotency_key, request_hash, response.json())
+    db_session.info[STORED_IDEMPOTENT_RESPONSE] = response
+
+
+async def _upsert_response(db_session: AsyncSession, idempotency_key: str, request_hash: str, response: str) -> None:
+    """
+    Upsert is used since the claimed key may have been rolled back along with the transaction (e.g. when it was
+    retried or when a batch wasn't applied). Only a claim of the same request is completed - if a concurrent request
+    has stored its response under the key meanwhile, the transaction fails (and is rolled back).
+    """
+    idempotency_keys = tables.IdempotencyKey.__table__
+    stored_response = await db_session.execute(
+        insert(idempotency_keys)
+        .values(
+            key=idempotency_key,
+            request_hash=request_hash,
+            response=response,
+            created_at=datetime.datetime.utcnow(),
+        )
+        .on_conflict_do_update(
+            index_elements=[idempotency_keys.c.key],
+            set_={"response": response},
+            where=sa.and_(idempotency_keys.c.request_hash == request_hash, idempotency_keys.c.response.is_(None)),
+        )
+    )
+    if not stored_response.rowcount:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=ExceptionDescription.REQUEST_WITH_IDEMPOTENCY_KEY_IS_IN_PROGRESS.value,
+        )
@@ -1,101 +1,290 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+
 import sqlalchemy as sa
 from fastapi import Depends, HTTPException, status
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Query, Session
+from fastapi.responses import JSONResponse, ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 from exceptions import ExceptionDescription
 from messages import MessageDescription
-from models.information import UserAccountOut
+from models.information import CompanyAccountOut, UserAccountOut, UserAccountsBalanceOut
+from models.transactions import (
+    DepositTransactionOut,
+    FundsTransferTransactionOut,
+    ReserveTransactionOut,
+    ReserveRefundTransactionOut,
+    PaymentTransactionOut,
+)
+from services.cache import balance_cache
 from settings import settings
 from storage import tables
-from storage.tables import AccountType
-from storage.database import get_db_session
+from storage.tables import AccountType, TransactionType, render_transaction_description
+from storage.database import get_async_db_session, get_async_read_session
 
 
 class InformationService:
-    """Responsible for working with user accounts' data"""
+    """
+    Responsible for working with user accounts' data.
+    Reads with a read-only session (possibly on a replica) unless it is used by the services which write
+    (see get_primary_information_service()).
+    """
 
-    def __init__(self, db_session: Session = Depends(get_db_session)):
+    def __init__(self, db_session: AsyncSession = Depends(get_async_read_session)):
         self.db_session = db_session
 
-    def get_account_balance_info(self, user_id: int) -> list[UserAccountOut]:
+    async def get_account_balance_info(self, user_id: int) -> list[UserAccountOut]:
         """
         Returns info on user's regular and reserve accounts.
+        Balances are read through the balance cache (entries are invalidated by TransactionsService after each commit).
         """
-        regular_account_balance_info = self._get_user_account_by_user_id(user_id, AccountType.REGULAR)
-        reserve_account_balance_info = self._get_user_account_by_user_id(user_id, AccountType.RESERVE)
+        cached_balance_info = balance_cache.get(user_id)
+        if cached_balance_info is not None:
+            return cached_balance_info
+
+        balance_cache_version = balance_cache.get_version()
+
+        regular_account_balance_info, reserve_account_balance_info = await self._get_user_accounts_by_user_id(user_id)
+
+        balance_info = [
+            UserAccountOut.from_orm(regular_account_balance_info),
+            UserAccountOut.from_orm(reserve_account_balance_info),
+        ]
+        balance_cache.set(user_id, balance_info, balance_cache_version)
+
+        return balance_info
+
+    async def get_accounts_balance_info(self, user_ids: list[int]) -> list[UserAccountsBalanceOut]:
+        """
+        Returns info on regular and reserve accounts of each of the users (in the order the users are requested).
+        Balances which are not in the balance cache are read with a single query - users are joined with their
+        accounts, so that users who don't exist and users who don't have accounts yet are told apart.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        balance_info = {user_id: balance_cache.get(user_id) for user_id in user_ids}
+        uncached_user_ids = [user_id for user_id, accounts in balance_info.items() if accounts is None]
+        found_accounts: dict[int, list[UserAccountOut]] = {}  # by user id (of the users who exist)
+
+        if uncached_user_ids:
+            balance_cache_version = balance_cache.get_version()
+            users = tables.User.__table__
+            user_accounts = tables.UserAccount.__table__
+
+            accounts_rows = (
+                await self.db_session.execute(
+                    sa.select(users.c.id.label("user_id"), user_accounts.c.type, user_accounts.c.balance)
+                    .outerjoin(user_accounts, user_accounts.c.user_id == users.c.id)
+                    .where(users.c.id.in_(uncached_user_ids))
+                    .order_by(users.c.id, user_accounts.c.type)
+                )
+            ).all()
+
+            for account in accounts_rows:
+                found_accounts.setdefault(account.user_id, [])
+                if account.type is not None:
+                    found_accounts[account.user_id].append(UserAccountOut.from_orm(account))
+
+            for user_id, accounts in found_accounts.items():
+                if len(accounts) == len(AccountType):
+                    balance_info[user_id] = accounts
+                    balance_cache.set(user_id, accounts, balance_cache_version)
+
+        accounts_balance_info = []
+        for user_id, accounts in balance_info.items():
+            if accounts is not None:
+                accounts_balance_info.append(UserAccountsBalanceOut(user_id=user_id, accounts=accounts))
+            elif user_id in found_accounts:
+                accounts_balance_info.append(
+                    UserAccountsBalanceOut(user_id=user_id, detail=ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value)
+                )
+            else:
+                accounts_balance_info.append(
+                    UserAccountsBalanceOut(user_id=user_id, detail=ExceptionDescription.USER_DOES_NOT_EXIST.value)
+                )
 
-        return [regular_account_balance_info, reserve_account_balance_info]
+        return accounts_balance_info
 
-    def get_account_transactions_info(
+    async def get_company_account_balance_info(self, company_account_id: int) -> CompanyAccountOut:
+        """
+        Returns company account info with its balance being the sum of the company account's own balance
+        and the balances of its shards (payments made since the last compaction).
+        """
+        company_accounts = tables.CompanyAccount.__table__
+        company_account_shards = tables.CompanyAccountShard.__table__
+
+        company_account = (
+            await self.db_session.execute(
+                sa.select(
+                    company_accounts.c.id,
+                    (
+                        company_accounts.c.balance + sa.func.coalesce(sa.func.sum(company_account_shards.c.balance), 0)
+                    ).label("balance"),
+                    company_accounts.c.bank_account_number,
+                    company_accounts.c.bank,
+                )
+                .outerjoin(
+                    company_account_shards, company_account_shards.c.company_account_id == company_accounts.c.id
+                )
+                .where(company_accounts.c.id == company_account_id)
+                .group_by(company_accounts.c.id)
+            )
+        ).one_or_none()
+
+        if not company_account:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=ExceptionDescription.COMPANY_ACCOUNT_DOES_NOT_EXIST.value
+            )
+
+        return CompanyAccountOut.from_orm(company_account)
+
+    async def get_account_transactions_info(
         self,
         user_id: int,
         *,
         page: int | None = None,
         sort_by_amount: bool = False,
         sort_by_date: bool = False
-    ) -> list[tables.Transaction] | JSONResponse:
+    ) -> ORJSONResponse | JSONResponse:
         """
         Returns a list of transactions with description on where and why the funds
         were credited/debited from the account balance.
         Sorting (by date and amount) and pagination of results are provided as an option.
+        Transactions are serialized straight from the selected rows (see _serialize_transaction_row()).
         """
-        user = self._get_user_by_user_id(user_id)
-        if not user.accounts:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value,
-            )
+        account_transactions = await self._select_account_transactions(user_id)
 
-        user_orders_ids = [order.id for order in user.orders]
+        # sorting is done by user's ledger entries' columns, so that the ledger index is used
+        if sort_by_date:
+            account_transactions = self._sort_rows_by_date_column(tables.LedgerEntry, account_transactions)
 
-        account_transactions = self.db_session.query(
-            tables.Transaction)\
-            .filter(
-            sa.or_(
-                tables.Transaction.from_user_id == user_id,
-                tables.Transaction.to_user_id == user_id,
-                tables.Transaction.order_id.in_(user_orders_ids)
-            )
-        )
+        if sort_by_amount:
+            account_transactions = self._sort_rows_by_amount_column(tables.LedgerEntry, account_transactions)
+
+        if page:
+            account_transactions = await self._get_table_pagination_results(account_transactions, page_number=page)
+        else:
+            account_transactions = (await self.db_session.execute(account_transactions)).all()
 
         if not account_transactions:
             return JSONResponse(
                 content={"message": MessageDescription.NO_TRANSACTIONS_AVAILABLE.value}
             )
 
-        if sort_by_date:
-            account_transactions = self._sort_rows_by_date_column(tables.Transaction, account_transactions)
+        return ORJSONResponse(content=[_serialize_transaction_row(transaction) for transaction in account_transactions])
 
-        if sort_by_amount:
-            account_transactions = self._sort_rows_by_amount_column(tables.Transaction, account_transactions)
+    async def get_account_transactions_page(
+        self,
+        user_id: int,
+        *,
+        cursor: str | None = None,
+        limit: int = settings.NUMBER_OF_RESULTS_PER_PAGE,
+        sort_by_amount: bool = False,
+    ) -> ORJSONResponse:
+        """
+        Returns a page of account transactions sorted by date (or amount) in descending order along with the cursor
+        to request the next page with.
+        Pages are selected by the sort key of the last row of the previous page (keyset pagination) rather than
+        by offset, so any page costs the same as the first one.
+        """
+        account_transactions = await self._select_account_transactions(user_id)
+
+        sort_by = TransactionsSortKey.AMOUNT if sort_by_amount else TransactionsSortKey.DATE
+        sort_column = getattr(tables.LedgerEntry, sort_by.value)
+        if cursor:
+            last_sort_value, last_transaction_id = _decode_pagination_cursor(cursor, sort_by)
+            account_transactions = account_transactions.where(
+                sa.tuple_(sort_column, tables.LedgerEntry.transaction_id)
+                < sa.tuple_(last_sort_value, last_transaction_id)
+            )
 
-        if page:
-            account_transactions = self._get_table_pagination_results(account_transactions, page_number=page)
+        transactions_page = (
+            await self.db_session.execute(
+                account_transactions
+                .order_by(sort_column.desc(), tables.LedgerEntry.transaction_id.desc())
+                .limit(limit + 1)  # one more row to find out whether there is a next page
+            )
+        ).all()
+
+        next_cursor = None
+        if len(transactions_page) > limit:
+            transactions_page = transactions_page[:limit]
+            last_transaction = transactions_page[-1]
+            next_cursor = encode_pagination_cursor(
+                sort_by, getattr(last_transaction, sort_by.value), last_transaction.id
+            )
+
+        return ORJSONResponse(
+            content={
+                "transactions": [_serialize_transaction_row(transaction) for transaction in transactions_page],
+                "next_cursor": next_cursor,
+            }
+        )
+
+    async def _select_account_transactions(self, user_id: int) -> Select:
+        """
+        Returns query selecting all transactions on user's accounts (provided that the user has accounts)
+        via user's ledger entries.
+        Only the columns needed for transactions' output are selected (as rows rather than ORM objects).
+        """
+        user_has_accounts = (
+            await self.db_session.execute(
+                sa.select(sa.exists().where(tables.UserAccount.user_id == tables.User.id))
+                .where(tables.User.id == user_id)
+            )
+        ).scalar_one_or_none()
+        if user_has_accounts is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,  # 422?
+                detail=ExceptionDescription.USER_DOES_NOT_EXIST.value
+            )
+        if not user_has_accounts:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value,
+            )
 
-        return account_transactions.all()
+        return (
+            sa.select(*TRANSACTION_ROW_COLUMNS)
+            .join(
+                tables.LedgerEntry,
+                # ledger entry's date (the same as transaction's one) lets only a single partition of transactions
+                # be looked up for each entry
+                sa.and_(
+                    tables.LedgerEntry.transaction_id == tables.Transaction.id,
+                    tables.LedgerEntry.date == tables.Transaction.date,
+                ),
+            )
+            .where(tables.LedgerEntry.user_id == user_id)
+        )
 
-    def _get_user_account_by_user_id(
+    async def _get_user_account_by_user_id(
         self,
         user_id: int,
         account_type: AccountType,
     ) -> tables.UserAccount:
         """
         Returns account of a specified type (regular/reserve) of a particular user.
+        User's existence is only checked if the account is not found.
         """
-        self._raise_error_if_user_does_not_exist(user_id)
-
-        account = (
-            self.db_session.query(tables.UserAccount)
-            .filter(
+        account = await self.db_session.scalar(
+            sa.select(tables.UserAccount)
+            .where(
                 sa.and_(
                     tables.UserAccount.user_id == user_id,
                     tables.UserAccount.type == account_type,
                 )
             )
-            .first()
+            .limit(1)
         )
         if not account:
+            await self._raise_error_if_user_does_not_exist(user_id)
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,  # 422?
                 detail=ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value,
@@ -103,24 +292,30 @@ class InformationService:
 
         return account
 
-    def _get_user_accounts_by_order_id(self, order_id: int) -> list[tables.UserAccount]:
+    async def _get_user_accounts_by_user_id(self, user_id: int) -> list[tables.UserAccount]:
         """
-        Returns both regular and reserve accounts of a particular user.
+        Returns both regular and reserve accounts (in this particular order) of a particular user.
+        User's existence is only checked if the accounts are not found.
         """
-        order = self.db_session.query(tables.Order).filter(tables.Order.id == order_id).first()
-        user_accounts = order.user.accounts
+        user_accounts = (
+            await self.db_session.scalars(
+                sa.select(tables.UserAccount)
+                .where(tables.UserAccount.user_id == user_id)
+                .order_by(tables.UserAccount.type)
+            )
+        ).all()
 
-        if not user_accounts:
+        if len(user_accounts) != len(AccountType):
+            await self._raise_error_if_user_does_not_exist(user_id)
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
+                status_code=status.HTTP_404_NOT_FOUND,  # 422?
                 detail=ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value,
             )
 
         return user_accounts
 
-    def _get_company_account_by_company_account_id(self, company_account_id: int) -> tables.CompanyAccount:
-        company_account = self.db_session.query(tables.CompanyAccount)\
-            .filter(tables.CompanyAccount.id == company_account_id).first()
+    async def _get_company_account_by_company_account_id(self, company_account_id: int) -> tables.CompanyAccount:
+        company_account = await self.db_session.get(tables.CompanyAccount, company_account_id)
 
         if not company_account:
             raise HTTPException(
@@ -130,31 +325,33 @@ class InformationService:
 
         return company_account
 
-    def _get_user_by_user_id(self, user_id: int) -> tables.User:
-        self._raise_error_if_user_does_not_exist(user_id)
+    async def _get_user_by_user_id(self, user_id: int) -> tables.User:
+        user = await self.db_session.get(tables.User, user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,  # 422?
+                detail=ExceptionDescription.USER_DOES_NOT_EXIST.value
+            )
 
-        user = self.db_session.query(tables.User).filter(tables.User.id == user_id).first()
         return user
 
-    def _raise_error_if_user_does_not_exist(
+    async def _raise_error_if_user_does_not_exist(
         self, user_id: int
     ) -> None:
-        user = self.db_session.query(tables.User).filter(tables.User.id == user_id).first()
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,  # 422?
-                detail=ExceptionDescription.USER_DOES_NOT_EXIST.value
+        await self._get_user_by_user_id(user_id)
+
+    async def _get_table_pagination_results(
+        self, selected_rows: Select, *, page_number: int
+    ) -> list:
+        pagination_results = (
+            await self.db_session.execute(
+                selected_rows
+                .limit(settings.NUMBER_OF_RESULTS_PER_PAGE)
+                .offset((page_number - 1) * settings.NUMBER_OF_RESULTS_PER_PAGE)
             )
+        ).all()
 
-    @staticmethod
-    def _get_table_pagination_results(
-        selected_rows: Query, *, page_number: int
-    ) -> Query:
-        pagination_results = selected_rows\
-            .limit(settings.NUMBER_OF_RESULTS_PER_PAGE)\
-            .offset((page_number - 1) * settings.NUMBER_OF_RESULTS_PER_PAGE)
-
-        if not pagination_results.all():
+        if not pagination_results:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=ExceptionDescription.RESULTS_NOT_AVAILABLE_FOR_THIS_PAGE.value,
@@ -163,7 +360,7 @@ class InformationService:
         return pagination_results
 
     @staticmethod
-    def _sort_rows_by_date_column(table: sa.Table, selected_rows: Query) -> Query:
+    def _sort_rows_by_date_column(table: sa.Table, selected_rows: Select) -> Select:
         """Only works with tables with 'date' field present"""
         if not hasattr(table, "date"):
             raise HTTPException(
@@ -175,7 +372,7 @@ class InformationService:
         return sorted_by_date
 
     @staticmethod
-    def _sort_rows_by_amount_column(table: sa.Table, selected_rows: Query) -> Query:
+    def _sort_rows_by_amount_column(table: sa.Table, selected_rows: Select) -> Select:
         """Only works with tables with 'amount' field present"""
         if not hasattr(table, "amount"):
             raise HTTPException(
@@ -185,3 +382,84 @@ class InformationService:
 
         sorted_by_amount = selected_rows.order_by(table.amount.desc())
         return sorted_by_amount
+
+
+class TransactionsSortKey(str, Enum):
+    DATE = "date"
+    AMOUNT = "amount"
+
+
+# Dependency to be injected (services which write and read accounts within the same database transaction)
+def get_primary_information_service(db_session: AsyncSession = Depends(get_async_db_session)) -> InformationService:
+    return InformationService(db_session)
+
+
+TRANSACTION_ROW_COLUMNS = (
+    tables.Transaction.id,
+    tables.Transaction.type,
+    tables.Transaction.amount,
+    tables.Transaction.date,
+    tables.Transaction.stored_description.label("description"),
+    tables.Transaction.from_user_id,
+    tables.Transaction.to_user_id,
+    tables.Transaction.order_id,
+    tables.Transaction.to_company_account,
+)
+
+# output fields of each transaction type - the same ones as of the corresponding output model
+TRANSACTION_OUT_FIELDS = {
+    transaction_type: tuple(transaction_out_model.__fields__)
+    for transaction_type, transaction_out_model in {
+        TransactionType.DEPOSIT: DepositTransactionOut,
+        TransactionType.FUNDS_TRANSFER: FundsTransferTransactionOut,
+        TransactionType.RESERVE: ReserveTransactionOut,
+        TransactionType.RESERVE_REFUND: ReserveRefundTransactionOut,
+        TransactionType.PAYMENT_TO_COMPANY: PaymentTransactionOut,
+    }.items()
+}
+
+
+def _serialize_transaction_row(transaction: sa.engine.Row) -> dict[str, Any]:
+    """
+    Picks the output fields by the transaction type instead of validating the row against each of the output models
+    in turn - values are encoded the same way as FastAPI encodes them (e.g. amounts as floats).
+    """
+    description = transaction.description
+    if description is None:
+        description = render_transaction_description(
+            transaction.type,
+            transaction.amount,
+            transaction.date,
+            transaction.from_user_id,
+            transaction.to_user_id,
+            transaction.order_id,
+        )
+
+    serialized_transaction = {
+        field: getattr(transaction, field) for field in TRANSACTION_OUT_FIELDS[transaction.type]
+    }
+    serialized_transaction["amount"] = float(transaction.amount)
+    serialized_transaction["description"] = description
+
+    return serialized_transaction
+
+
+def encode_pagination_cursor(sort_by: TransactionsSortKey, last_sort_value: Any, last_transaction_id: int) -> str:
+    """
+    Cursor is opaque for clients - it is an encoded sort key of the last transaction on the page.
+    Public, so that a cursor pointing to a known position can be built (e.g. by benchmarks).
+    """
+    cursor = json.dumps([sort_by.value, str(last_sort_value), last_transaction_id])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def _decode_pagination_cursor(cursor: str, sort_by: TransactionsSortKey) -> tuple[Any, int]:
+    try:
+        cursor_sort_by, last_sort_value, last_transaction_id = json.loads(base64.urlsafe_b64decode(cursor))
+        if cursor_sort_by != sort_by.value:
+            raise ValueError
+        if sort_by == TransactionsSortKey.DATE:
+            return datetime.datetime.fromisoformat(last_sort_value), int(last_transaction_id)
+        return Decimal(last_sort_value), int(last_transaction_id)
+    except (ValueError, TypeError, ArithmeticError, binascii.Error):
+        raise ValueError(ExceptionDescription.INVALID_PAGINATION_CURSOR.value)
@@ -0,0 +1,96 @@
+from decimal import Decimal
+from typing import Iterator
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from storage.database import async_engine, replica_engines
+from storage.tables import TransactionType
+
+
+# Metrics are kept in memory of each worker process, so each process has to be scraped separately
+# (or a multiprocess collector has to be set up)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time spent processing HTTP requests (until the response starts).",
+    ["method", "route", "status_code"],
+    buckets=LATENCY_BUCKETS,
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being processed at the moment.",
+)
+transactions_total = Counter(
+    "account_transactions",
+    "Committed transactions.",
+    ["type"],
+)
+transactions_amount_total = Counter(
+    "account_transactions_amount",
+    "Total amount of committed transactions.",
+    ["type"],
+)
+report_generation_duration_seconds = Histogram(
+    "report_generation_duration_seconds",
+    "Time spent generating (and streaming) reports - from the query start till the last row is sent.",
+    ["detail_level"],
+    buckets=LATENCY_BUCKETS + (30.0, 60.0, 120.0),
+)
+
+
+def record_committed_transaction(type_: TransactionType, amount: Decimal) -> None:
+    transactions_total.labels(type=type_.value).inc()
+    transactions_amount_total.labels(type=type_.value).inc(float(amount))
+
+
+class DatabasePoolCollector(Collector):
+    """Reads connection pool statistics of each engine (the primary's and the replicas' ones) at scrape time"""
+
+    def __init__(self, engines: dict[str, AsyncEngine]) -> None:
+        self.engines = engines
+
+    def collect(self) -> Iterator[GaugeMetricFamily | CounterMetricFamily]:
+        pools_stats = {engine_name: engine.pool.get_stats() for engine_name, engine in self.engines.items()}
+
+        for stat_name in ("size", "checked_in", "checked_out", "overflow", "max_overflow", "max_wait_seconds"):
+            gauge = GaugeMetricFamily(
+                f"db_pool_{stat_name}", f"Connection pool {stat_name.replace('_', ' ')}.", labels=["engine"]
+            )
+            for engine_name, pool_stats in pools_stats.items():
+                gauge.add_metric([engine_name], pool_stats[stat_name])
+            yield gauge
+
+        checkouts = CounterMetricFamily(
+            "db_pool_checkouts", "Connections checked out from the pool.", labels=["engine"]
+        )
+        checkout_timeouts = CounterMetricFamily(
+            "db_pool_checkout_timeouts",
+            "Connection checkouts which timed out waiting for a connection.",
+            labels=["engine"],
+        )
+        checkout_wait_seconds = CounterMetricFamily(
+            "db_pool_checkout_wait_seconds", "Total time spent waiting for connections.", labels=["engine"]
+        )
+        for engine_name, pool_stats in pools_stats.items():
+            checkouts.add_metric([engine_name], pool_stats["checkouts"])
+            checkout_timeouts.add_metric([engine_name], pool_stats["checkout_timeouts"])
+            checkout_wait_seconds.add_metric([engine_name], self.engines[engine_name].pool.total_wait_seconds)
+        yield checkouts
+        yield checkout_timeouts
+        yield checkout_wait_seconds
+
+
+# replicas are labeled by their position in DATABASE_REPLICA_URLS (URLs may contain credentials)
+REGISTRY.register(
+    DatabasePoolCollector(
+        {
+            "primary": async_engine,
+            **{f"replica_{index}": replica_engine for index, replica_engine in enumerate(replica_engines)},
+        }
+    )
+)
@@ -1,73 +1,170 @@
 import csv
-import calendar
 import datetime
-from collections import defaultdict
-from decimal import Decimal
+import time
 from io import StringIO
+from typing import AsyncIterator, Iterable, Sequence
 
+import sqlalchemy as sa
 from fastapi import status, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 from exceptions import ExceptionDescription
+from models.reports import ReportDetailLevel
+from services.metrics import report_generation_duration_seconds
+from settings import settings
 from storage import tables
-from storage.database import get_db_session
+from storage.database import get_async_read_session
 from storage.tables import TransactionType
 
 
 class ReportsService:
-    def __init__(self, db_session: Session = Depends(get_db_session)) -> None:
+    """Reports are read with a read-only session (on one of the replicas if there are any)"""
+
+    def __init__(self, db_session: AsyncSession = Depends(get_async_read_session)) -> None:
         self.db_session = db_session
 
-    def prepare_monthly_accounting_report_in_csv(
+    async def prepare_monthly_accounting_report_in_csv(
         self,
         year: int,
         month: int,
-    ) -> StringIO:
-        output = StringIO()  # to create a file-like object in memory
-        writer = csv.writer(
-            output,
-            lineterminator="\n",
-        )
-
-        field_names = ["Service Name", f"Total Revenue in the period (YYYY-MM) {year}-{month}"]
-        writer.writerow(field_names)
+        detail_level: ReportDetailLevel = ReportDetailLevel.SERVICES,
+    ) -> AsyncIterator[str]:
+        """
+        Returns csv report lines generator - report rows are read with a server-side cursor and sent to the client
+        chunk by chunk while the rest of them are still being read, so memory usage doesn't depend on the report size.
+        Report detail levels:
+         services - total revenue from each service rendered in the period;
+         orders - revenue from each order paid in the period;
+         transactions - revenue from each service in each payment transaction made in the period.
+        """
+        report_queries = {
+            ReportDetailLevel.SERVICES: self._prepare_revenue_from_services_query,
+            ReportDetailLevel.ORDERS: self._prepare_revenue_from_orders_query,
+            ReportDetailLevel.TRANSACTIONS: self._prepare_revenue_from_transactions_query,
+        }
+        field_names, report_query = report_queries[detail_level](year, month)
 
-        services_revenue_info = self._calculate_revenue_from_services(year, month)
-        writer.writerows(services_revenue_info.items())
+        report_started_at = time.perf_counter()
+        report_rows = await self.db_session.stream(report_query)
+        report_rows_chunks = report_rows.partitions(settings.REPORT_ROWS_PER_CHUNK)
 
-        output.seek(0)
+        # the first chunk is read in advance to find out whether there is anything to report at all
+        first_report_rows_chunk = await anext(report_rows_chunks, None)
+        if not first_report_rows_chunk:
+            await report_rows.close()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,  # or 422?
+                detail=ExceptionDescription.NO_SERVICES_RENDERED_IN_THE_PERIOD.value,
+            )
 
-        return output
+        csv_lines = self._generate_csv_lines(field_names, first_report_rows_chunk, report_rows_chunks)
+        return self._measure_report_generation(csv_lines, detail_level, report_started_at)
 
-    def _calculate_revenue_from_services(
-        self, year: int, month: int
-    ) -> defaultdict[str, Decimal]:
+    @staticmethod
+    def _prepare_revenue_from_services_query(year: int, month: int) -> tuple[list[str], Select]:
         """
-        Calculates revenue for each service rendered in the reporting period.
-        More detail.
-        Returns a dictionary which maps service name with total revenue from it in the period.
+        Revenues are read from the monthly rollup (updated along with each payment to company), so only the services
+        of the requested month are read regardless of the size of the transactions' history.
         """
-        number_of_days_in_the_reporting_period = calendar.monthrange(year, month)[1]
-        reporting_period_start = datetime.date(year, month, 1)
-        reporting_period_end = datetime.date(year, month, number_of_days_in_the_reporting_period)
+        field_names = ["Service Name", f"Total Revenue in the period (YYYY-MM) {year}-{month}"]
 
-        services_with_revenues_in_the_period = defaultdict(lambda: Decimal(0))
+        services_with_revenues_in_the_period = (
+            sa.select(tables.Service.name, sa.func.sum(tables.ServiceRevenueMonthly.revenue))
+            .join(tables.Service, tables.Service.id == tables.ServiceRevenueMonthly.service_id)
+            .where(tables.ServiceRevenueMonthly.period == datetime.date(year, month, 1))
+            .group_by(tables.Service.name)
+            .order_by(tables.Service.name)
+        )
 
-        payment_transactions_in_the_period = [transaction for transaction in
-                                              self.db_session.query(tables.Transaction).all()
-                                              if transaction.type == TransactionType.PAYMENT_TO_COMPANY
-                                              and reporting_period_start <= transaction.date.date()
-                                              <= reporting_period_end]
+        return field_names, services_with_revenues_in_the_period
 
-        for transaction in payment_transactions_in_the_period:
-            for ordered_service in transaction.order.items:
-                services_with_revenues_in_the_period[ordered_service.service.name] \
-                    += ordered_service.quantity * ordered_service.service.price
+    @staticmethod
+    def _prepare_revenue_from_orders_query(year: int, month: int) -> tuple[list[str], Select]:
+        field_names = ["Order ID", "User ID", "Payment Date", "Revenue"]
 
-        if not services_with_revenues_in_the_period:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,  # or 422?
-                detail=ExceptionDescription.NO_SERVICES_RENDERED_IN_THE_PERIOD.value,
+        orders_paid_in_the_period = (
+            sa.select(
+                tables.Transaction.order_id,
+                tables.Order.user_id,
+                tables.Transaction.date,
+                tables.Transaction.amount,
+            )
+            .join(tables.Order, tables.Order.id == tables.Transaction.order_id)
+            .where(_payments_made_in_the_period(year, month))
+            .order_by(tables.Transaction.date, tables.Transaction.id)
+        )
+
+        return field_names, orders_paid_in_the_period
+
+    @staticmethod
+    def _prepare_revenue_from_transactions_query(year: int, month: int) -> tuple[list[str], Select]:
+        field_names = ["Transaction ID", "Payment Date", "Order ID", "Service Name", "Quantity", "Price", "Revenue"]
+
+        services_paid_in_the_period = (
+            sa.select(
+                tables.Transaction.id,
+                tables.Transaction.date,
+                tables.Transaction.order_id,
+                tables.Service.name,
+                tables.OrderItem.quantity,
+                sa.func.coalesce(tables.OrderItem.price, tables.Service.price),
+                tables.OrderItem.quantity * sa.func.coalesce(tables.OrderItem.price, tables.Service.price),
             )
+            .join(tables.OrderItem, tables.OrderItem.order_id == tables.Transaction.order_id)
+            .join(tables.Service, tables.Service.id == tables.OrderItem.service_id)
+            .where(_payments_made_in_the_period(year, month))
+            .order_by(tables.Transaction.date, tables.Transaction.id, tables.Service.name)
+        )
+
+        return field_names, services_paid_in_the_period
+
+    @staticmethod
+    async def _generate_csv_lines(
+        field_names: list[str],
+        first_report_rows_chunk: Sequence[Row],
+        report_rows_chunks: AsyncIterator[Sequence[Row]],
+    ) -> AsyncIterator[str]:
+        yield _format_csv_lines([field_names])
+        yield _format_csv_lines(first_report_rows_chunk)
+
+        async for report_rows_chunk in report_rows_chunks:
+            yield _format_csv_lines(report_rows_chunk)
+
+    @staticmethod
+    async def _measure_report_generation(
+        csv_lines: AsyncIterator[str],
+        detail_level: ReportDetailLevel,
+        report_started_at: float,
+    ) -> AsyncIterator[str]:
+        """Report is generated while it is streamed, so the time is measured until the last line is sent"""
+        async for csv_line in csv_lines:
+            yield csv_line
+
+        report_generation_duration_seconds.labels(detail_level=detail_level.value).observe(
+            time.perf_counter() - report_started_at
+        )
+
+
+def _payments_made_in_the_period(year: int, month: int) -> sa.sql.ColumnElement:
+    """Payments are selected by the range of dates, so only the partitions of the period's transactions are read"""
+    reporting_period_start = datetime.datetime(year, month, 1)
+    next_reporting_period_start = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+
+    return sa.and_(
+        tables.Transaction.type == TransactionType.PAYMENT_TO_COMPANY,
+        tables.Transaction.date >= reporting_period_start,
+        tables.Transaction.date < next_reporting_period_start,
+    )
+
+
+def _format_csv_lines(rows: Iterable[Sequence]) -> str:
+    output = StringIO()  # only holds a single chunk of the report
+    writer = csv.writer(
+        output,
+        lineterminator="\n",
+    )
+    writer.writerows(rows)
 
-        return services_with_revenues_in_the_period
+    return output.getvalue()
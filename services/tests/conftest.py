@@ -0,0 +1,42 @@
+import uuid
+from decimal import Decimal
+from typing import Callable
+
+import pytest
+import sqlalchemy as sa
+
+from storage import tables
+from storage.database import Session
+from storage.tables import AccountType
+
+
+# Test data is added to the existing rows (of the database configured in settings) - names are unique,
+# so that tests don't collide with each other and with the rows of previous runs.
+
+@pytest.fixture
+def create_user() -> Callable[[], int]:
+    """Creates a user without accounts (accounts are created by the first deposit) and returns user's id"""
+    users = tables.User.__table__
+
+    def create_user() -> int:
+        username = f"test_{uuid.uuid4().hex}"
+        with Session() as session:
+            user_id = session.scalar(
+                sa.insert(users)
+                .values(username=username, email=f"{username}@example.com", phone_number=username)
+                .returning(users.c.id)
+            )
+            session.commit()
+
+        return user_id
+
+    return create_user
+
+
+def get_regular_balance(user_id: int) -> Decimal | None:
+    with Session() as session:
+        return session.scalar(
+            sa.select(tables.UserAccount.balance).where(
+                sa.and_(tables.UserAccount.user_id == user_id, tables.UserAccount.type == AccountType.REGULAR)
+            )
+        )
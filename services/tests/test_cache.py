@@ -0,0 +1,74 @@
+import time
+
+from models.information import UserAccountOut
+from services.cache import InMemoryBalanceCache, LRUCache
+from storage.tables import AccountType
+
+
+def get_accounts(user_id: int, balance: int) -> list[UserAccountOut]:
+    return [
+        UserAccountOut(user_id=user_id, type=AccountType.REGULAR, balance=balance),
+        UserAccountOut(user_id=user_id, type=AccountType.RESERVE, balance=0),
+    ]
+
+
+def test_lru_cache_evicts_least_recently_used_entry():
+    cache = LRUCache(max_size=2, ttl_seconds=60)
+    cache.set("first", 1)
+    cache.set("second", 2)
+    cache.get("first")
+
+    cache.set("third", 3)
+
+    assert cache.get("second") is None
+    assert (cache.get("first"), cache.get("third")) == (1, 3)
+
+
+def test_lru_cache_entry_expires_after_given_ttl():
+    cache = LRUCache(max_size=10, ttl_seconds=60)
+
+    cache.set("key", "value", ttl_seconds=0.01)
+    cache.set("other key", "other value")
+    time.sleep(0.02)
+
+    assert cache.get("key") is None
+    assert cache.get("other key") == "other value"
+
+
+def test_balance_cache_invalidation():
+    cache = InMemoryBalanceCache(max_size=10, ttl_seconds=60)
+    cache.set(1, get_accounts(1, 10), cache.get_version())
+    cache.set(2, get_accounts(2, 20), cache.get_version())
+
+    cache.invalidate([1])
+
+    assert cache.get(1) is None
+    assert cache.get(2) == get_accounts(2, 20)
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_balance_cache_skips_balances_read_before_invalidation():
+    cache = InMemoryBalanceCache(max_size=10, ttl_seconds=60)
+    version = cache.get_version()  # balances are read from the database after this...
+    cache.invalidate([1])  # ...while a concurrent write commits
+
+    cache.set(1, get_accounts(1, 10), version)
+    cache.set(2, get_accounts(2, 20), version)  # other users' balances are still cached
+
+    assert cache.get(1) is None
+    assert cache.get(2) == get_accounts(2, 20)
+    cache.set(1, get_accounts(1, 15), cache.get_version())
+    assert cache.get(1) == get_accounts(1, 15)
+
+
+def test_balance_cache_keeps_latest_dropped_version_stamp():
+    cache = InMemoryBalanceCache(max_size=2, ttl_seconds=60)
+    version = cache.get_version()
+    cache.invalidate([1, 2, 3])  # version stamp of user 1 is dropped
+
+    # user's own version stamp is gone, so the latest dropped one is checked instead
+    cache.set(1, get_accounts(1, 10), version)
+    cache.set(4, get_accounts(4, 40), version)
+
+    assert cache.get(1) is None
+    assert cache.get(4) is None
@@ -0,0 +1,99 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+from models.transactions import DepositTransactionIn, DepositTransactionOut, FundsTransferTransactionIn
+from services import transactions
+from services.coalescer import WriteCoalescer
+from services.tests.conftest import get_regular_balance
+from services.transactions import TransactionsService
+from storage.database import async_engine
+
+
+def submit_concurrently(transactions_data: list) -> list:
+    """Submits the transactions to a running coalescer at once and returns their results (or errors)"""
+
+    async def submit() -> list:
+        write_coalescer = WriteCoalescer(max_delay_seconds=0.05, max_batch_size=len(transactions_data))
+        await write_coalescer.start()
+        try:
+            return await asyncio.gather(
+                *(write_coalescer.submit(transaction_data) for transaction_data in transactions_data),
+                return_exceptions=True,
+            )
+        finally:
+            await write_coalescer.stop()
+            # connections can't be reused by the event loop of the next test
+            await async_engine.dispose()
+
+    return asyncio.run(submit())
+
+
+@pytest.fixture
+def applied_batches(monkeypatch) -> list[int]:
+    """Sizes of the batches applied by TransactionsService"""
+    applied_batches = []
+    apply_transactions_batch = TransactionsService.apply_transactions_batch
+
+    async def count_applied_batch(self, batch_data):
+        applied_batches.append(len(batch_data.transactions))
+        return await apply_transactions_batch(self, batch_data)
+
+    monkeypatch.setattr(TransactionsService, "apply_transactions_batch", count_applied_batch)
+    return applied_batches
+
+
+def test_concurrent_transactions_are_applied_as_one_batch(create_user, applied_batches):
+    sender_id, recipient_id = create_user(), create_user()
+
+    results = submit_concurrently(
+        [
+            DepositTransactionIn(amount=Decimal(10), to_user_id=sender_id),
+            DepositTransactionIn(amount=Decimal(5), to_user_id=recipient_id),
+            FundsTransferTransactionIn(amount=Decimal(100), from_user_id=sender_id, to_user_id=recipient_id),
+        ]
+    )
+
+    assert applied_batches == [3]
+    assert isinstance(results[0], DepositTransactionOut) and results[0].amount == 10
+    assert isinstance(results[1], DepositTransactionOut) and results[1].to_user_id == recipient_id
+    # the same error as the one of a single transfer
+    assert isinstance(results[2], ValueError)
+    assert (get_regular_balance(sender_id), get_regular_balance(recipient_id)) == (10, 5)
+
+
+def test_transactions_are_applied_one_by_one_if_batch_fails(create_user, monkeypatch):
+    first_user_id, second_user_id = create_user(), create_user()
+
+    async def fail_batch(self, batch_data):
+        raise RuntimeError("batch failed")
+
+    monkeypatch.setattr(TransactionsService, "apply_transactions_batch", fail_batch)
+
+    results = submit_concurrently(
+        [
+            DepositTransactionIn(amount=Decimal(1), to_user_id=first_user_id),
+            DepositTransactionIn(amount=Decimal(2), to_user_id=second_user_id),
+        ]
+    )
+
+    assert [result.amount for result in results] == [1, 2]
+    assert (get_regular_balance(first_user_id), get_regular_balance(second_user_id)) == (1, 2)
+
+
+def test_committed_batch_is_not_applied_again(create_user, applied_batches, monkeypatch):
+    user_id = create_user()
+
+    def fail_after_commit(type_, amount):
+        raise RuntimeError("metrics failed")
+
+    monkeypatch.setattr(transactions, "record_committed_transaction", fail_after_commit)
+
+    results = submit_concurrently(
+        [DepositTransactionIn(amount=Decimal(amount), to_user_id=user_id) for amount in (1, 2)]
+    )
+
+    assert applied_batches == [2]
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert get_regular_balance(user_id) == 3  # not 6
@@ -0,0 +1,31 @@
+from decimal import Decimal
+
+from prometheus_client import REGISTRY
+
+from services.metrics import DatabasePoolCollector, record_committed_transaction
+from storage.database import async_engine
+from storage.tables import TransactionType
+
+
+def test_record_committed_transaction():
+    def get_sample_value(name: str) -> float:
+        return REGISTRY.get_sample_value(name, {"type": TransactionType.DEPOSIT.value}) or 0.0
+
+    transactions_before = get_sample_value("account_transactions_total")
+    amount_before = get_sample_value("account_transactions_amount_total")
+
+    record_committed_transaction(TransactionType.DEPOSIT, Decimal("12.5"))
+
+    assert get_sample_value("account_transactions_total") == transactions_before + 1
+    assert get_sample_value("account_transactions_amount_total") == amount_before + 12.5
+
+
+def test_database_pool_collector_reports_each_engine():
+    collector = DatabasePoolCollector({"primary": async_engine, "replica_0": async_engine})
+
+    metrics = {metric.name: metric for metric in collector.collect()}
+
+    pool_size_samples = {sample.labels["engine"]: sample.value for sample in metrics["db_pool_size"].samples}
+    assert pool_size_samples == {"primary": async_engine.pool.size(), "replica_0": async_engine.pool.size()}
+    checkouts_engines = {sample.labels["engine"] for sample in metrics["db_pool_checkouts"].samples}
+    assert checkouts_engines == {"primary", "replica_0"}
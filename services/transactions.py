@@ -1,43 +1,76 @@
+import asyncio
+import functools
+import random
 from datetime import datetime
 from decimal import Decimal
-from enum import Enum
+from typing import Iterable, Iterator
 
 import sqlalchemy as sa
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm.attributes import set_committed_value
 
 from exceptions import ExceptionDescription
 from models.transactions import (
     BaseTransactionIn,
+    BatchTransactionIn,
+    BatchTransactionOut,
+    BatchTransactionResultOut,
     DepositTransactionIn,
+    DepositTransactionOut,
     FundsTransferTransactionIn,
+    FundsTransferTransactionOut,
     ReserveTransactionIn,
     ReserveRefundTransactionIn,
     PaymentTransactionIn,
 )
-from services.information import InformationService
+from services.cache import balance_cache
+from services.idempotency import store_response_within_transaction
+from services.information import InformationService, get_primary_information_service
+from services.metrics import record_committed_transaction
+from settings import settings
 from storage import tables
-from storage.database import get_db_session
-from storage.tables import AccountType, OrderStatus, TransactionType
-
-
-class TransactionDescription(str, Enum):
-    DEPOSIT = "Money in the amount of {amount}USD was deposited to user {to_user_id} from external services on {date}."
-    FUNDS_TRANSFER = (
-        "Money in the amount of {amount}USD was transferred from user {from_user_id} to user {to_user_id} on {date}."
-    )
-    RESERVE = (
-        "Money in the amount of {amount}USD was reserved on user {user_id} reserve account as per the order {order_id} "
-        "on {date}."
-    )
-    RESERVE_REFUND = (
-        "Money in the amount of {amount}USD was refunded to user {user_id} account from his/her reserve account as "
-        "per the order {order_id} on {date}."
-    )
-    PAYMENT_TO_COMPANY = (
-        "Money in the amount of {amount}USD was paid by user {user_id} to the company account as per the "
-        "order {order_id} on {date}."
-    )
+from storage.database import get_async_db_session, replica_router
+from storage.tables import (
+    COMPACT_DESCRIPTION_TRANSACTION_TYPES,
+    AccountType,
+    OrderStatus,
+    TransactionType,
+    render_transaction_description,
+)
+
+
+# serialization_failure and deadlock_detected - transaction can be safely retried from the beginning
+RETRYABLE_SQLSTATES = ("40001", "40P01")
+# bind parameters' limit of a single statement (PostgreSQL protocol) - multi-row inserts are split to stay under it
+MAX_STATEMENT_BIND_PARAMETERS = 32767
+
+
+def _is_retryable_db_error(db_err: DBAPIError) -> bool:
+    original_error = db_err.orig
+    sqlstate = getattr(original_error, "sqlstate", None) or getattr(original_error.__cause__, "sqlstate", None)
+    return sqlstate in RETRYABLE_SQLSTATES
+
+
+def _retry_on_serialization_failure(method):
+    """
+    Rolls back and reruns the whole transaction if it was aborted by the database due to a serialization failure
+    or a deadlock (with randomized exponential backoff between the attempts).
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        for attempt in range(settings.TRANSACTION_MAX_RETRIES + 1):
+            try:
+                return await method(self, *args, **kwargs)
+            except DBAPIError as db_err:
+                if attempt == settings.TRANSACTION_MAX_RETRIES or not _is_retryable_db_error(db_err):
+                    raise
+                await self.db_session.rollback()
+                await asyncio.sleep(settings.TRANSACTION_RETRY_BACKOFF_SECONDS * 2 ** attempt * random.random())
+
+    return wrapper
 
 
 class TransactionsService:
@@ -45,16 +78,17 @@ class TransactionsService:
 
     def __init__(
         self,
-        db_session: Session = Depends(get_db_session),
-        information_service: InformationService = Depends(),
+        db_session: AsyncSession = Depends(get_async_db_session),
+        information_service: InformationService = Depends(get_primary_information_service),
     ) -> None:
         self.db_session = db_session
         self.information_service = information_service
 
-    def deposit_funds_to_account(self, transaction_data: DepositTransactionIn) -> tables.Transaction:
-        recipient_account = self._get_or_create_recipient_account_by_user_id(transaction_data.to_user_id)
+    @_retry_on_serialization_failure
+    async def deposit_funds_to_account(self, transaction_data: DepositTransactionIn) -> tables.Transaction:
+        recipient_account = await self._get_or_create_recipient_account_by_user_id(transaction_data.to_user_id)
 
-        self._transfer_funds(
+        await self._transfer_funds(
             sender_account=None,
             recipient_account=recipient_account,
             transfer_amount=transaction_data.amount,
@@ -67,21 +101,26 @@ class TransactionsService:
             to_user_id=transaction_data.to_user_id,
         )
 
-        self.db_session.add_all([recipient_account, transaction])
-        self.db_session.commit()
+        self.db_session.add(transaction)
+        await self._commit(
+            affected_user_ids=[transaction_data.to_user_id], committed_transactions=[transaction], result=transaction
+        )
 
         return transaction
 
-    def transfer_funds_between_user_accounts(self, transaction_data: FundsTransferTransactionIn) -> tables.Transaction:
+    @_retry_on_serialization_failure
+    async def transfer_funds_between_user_accounts(
+        self, transaction_data: FundsTransferTransactionIn
+    ) -> tables.Transaction:
         """
         Transfers funds between regular(!) accounts of two users.
         """
-        sender_account = self.information_service._get_user_account_by_user_id(
+        sender_account = await self.information_service._get_user_account_by_user_id(
             transaction_data.from_user_id, AccountType.REGULAR
         )
-        recipient_account = self._get_or_create_recipient_account_by_user_id(transaction_data.to_user_id)
+        recipient_account = await self._get_or_create_recipient_account_by_user_id(transaction_data.to_user_id)
 
-        self._transfer_funds(sender_account, recipient_account, transaction_data.amount)
+        await self._transfer_funds(sender_account, recipient_account, transaction_data.amount)
 
         transaction = self._prepare_transaction_db_record(
             transaction_data,
@@ -91,25 +130,32 @@ class TransactionsService:
             transaction_data.to_user_id,
         )
 
-        self.db_session.add_all([sender_account, recipient_account, transaction])
-        self.db_session.commit()
+        self.db_session.add(transaction)
+        await self._commit(
+            affected_user_ids=[transaction_data.from_user_id, transaction_data.to_user_id],
+            committed_transactions=[transaction],
+            result=transaction,
+        )
 
         return transaction
 
-    def reserve_funds(self, transaction_data: ReserveTransactionIn) -> tables.Transaction:
-        self._raise_error_if_order_does_not_exist_or_has_irrelevant_status(
+    @_retry_on_serialization_failure
+    async def reserve_funds(self, transaction_data: ReserveTransactionIn) -> tables.Transaction:
+        order = await self._transition_order_status(
             transaction_data.order_id,
-            OrderStatus.NOT_SUBMITTED,
+            expected_status=OrderStatus.NOT_SUBMITTED,
+            new_status=OrderStatus.IN_PROGRESS,
+            calculate_total_amount=True,
         )
 
         (
             regular_account,
             reserve_account,
-        ) = self.information_service._get_user_accounts_by_order_id(transaction_data.order_id)
+        ) = await self.information_service._get_user_accounts_by_user_id(order.user_id)
 
-        transaction_amount = self._calculate_transaction_amount(transaction_data.order_id)
+        transaction_amount = order.total_amount
 
-        self._transfer_funds(
+        await self._transfer_funds(
             sender_account=regular_account,
             recipient_account=reserve_account,
             transfer_amount=transaction_amount,
@@ -123,23 +169,22 @@ class TransactionsService:
             order_id=transaction_data.order_id,
         )
 
-        self.db_session.add_all([regular_account, reserve_account, transaction])
-        _update_order_status(
-            order_id=transaction_data.order_id,
-            new_status=OrderStatus.IN_PROGRESS,
-            db_session=self.db_session,
+        self.db_session.add(transaction)
+        await self._commit(
+            affected_user_ids=[regular_account.user_id], committed_transactions=[transaction], result=transaction
         )
-        self.db_session.commit()
 
         return transaction
 
-    def cancel_reserve(self, transaction_data: ReserveRefundTransactionIn) -> tables.Transaction:
-        self._raise_error_if_order_does_not_exist_or_has_irrelevant_status(
+    @_retry_on_serialization_failure
+    async def cancel_reserve(self, transaction_data: ReserveRefundTransactionIn) -> tables.Transaction:
+        order = await self._transition_order_status(
             transaction_data.order_id,
-            OrderStatus.IN_PROGRESS,
+            expected_status=OrderStatus.IN_PROGRESS,
+            new_status=OrderStatus.CANCELLED,
         )
 
-        reserve_transaction_to_be_cancelled = self._get_transaction_by_order_id(
+        reserve_transaction_to_be_cancelled = await self._get_transaction_by_order_id(
             transaction_data.order_id, TransactionType.RESERVE
         )
 
@@ -147,9 +192,9 @@ class TransactionsService:
         (
             regular_account,
             reserve_account,
-        ) = self.information_service._get_user_accounts_by_order_id(transaction_data.order_id)
+        ) = await self.information_service._get_user_accounts_by_user_id(order.user_id)
 
-        self._transfer_funds(
+        await self._transfer_funds(
             sender_account=reserve_account,
             recipient_account=regular_account,
             transfer_amount=transaction_amount,
@@ -163,38 +208,39 @@ class TransactionsService:
             order_id=transaction_data.order_id,
         )
 
-        self.db_session.add_all([reserve_account, regular_account, transaction])
-        _update_order_status(
-            order_id=transaction_data.order_id,
-            new_status=OrderStatus.CANCELLED,
-            db_session=self.db_session,
+        self.db_session.add(transaction)
+        await self._commit(
+            affected_user_ids=[regular_account.user_id], committed_transactions=[transaction], result=transaction
         )
-        self.db_session.commit()
 
         return transaction
 
-    def make_payment_to_company(self, transaction_data: PaymentTransactionIn) -> tables.Transaction:
+    @_retry_on_serialization_failure
+    async def make_payment_to_company(self, transaction_data: PaymentTransactionIn) -> tables.Transaction:
         """
         Transfers reserved (as per specified order) money from user's reserve account to company account.
         While the company can potentially have multiple bank accounts, for the purposes of this project it only has one
         account and all payments are made to that account by default.
         """
-        self._raise_error_if_order_does_not_exist_or_has_irrelevant_status(
+        order = await self._transition_order_status(
             transaction_data.order_id,
-            OrderStatus.IN_PROGRESS,
+            expected_status=OrderStatus.IN_PROGRESS,
+            new_status=OrderStatus.COMPLETED,
         )
 
-        reserve_transaction_to_be_paid = self._get_transaction_by_order_id(
+        reserve_transaction_to_be_paid = await self._get_transaction_by_order_id(
             transaction_data.order_id, TransactionType.RESERVE
         )
         transaction_amount = reserve_transaction_to_be_paid.amount
         (
             _,
             reserve_account,
-        ) = self.information_service._get_user_accounts_by_order_id(transaction_data.order_id)
-        company_account = self.information_service._get_company_account_by_company_account_id(transaction_data.to_company_account)
+        ) = await self.information_service._get_user_accounts_by_user_id(order.user_id)
+        company_account = await self.information_service._get_company_account_by_company_account_id(
+            transaction_data.to_company_account
+        )
 
-        self._transfer_funds(
+        await self._transfer_funds(
             sender_account=reserve_account,
             recipient_account=company_account,
             transfer_amount=transaction_amount,  # TODO: why float here???
@@ -208,29 +254,201 @@ class TransactionsService:
             order_id=transaction_data.order_id,
         )
 
-        self.db_session.add_all([reserve_account, company_account, transaction])
-        _update_order_status(
-            order_id=transaction_data.order_id,
-            new_status=OrderStatus.COMPLETED,
-            db_session=self.db_session,
+        self.db_session.add(transaction)
+        await self._add_order_revenue_to_monthly_rollup(transaction_data.order_id, transaction.date)
+        await self._commit(
+            affected_user_ids=[reserve_account.user_id], committed_transactions=[transaction], result=transaction
         )
-        self.db_session.commit()
 
         return transaction
 
-    def _calculate_transaction_amount(self, order_id: int) -> Decimal:
-        order = self.db_session.query(tables.Order).filter(tables.Order.id == order_id).first()
-        transaction_amount = Decimal(0)
+    @_retry_on_serialization_failure
+    async def apply_transactions_batch(self, batch_data: BatchTransactionIn) -> BatchTransactionOut:
+        """
+        Applies a batch of deposits/funds transfers within one database transaction, using a constant number of
+        queries regardless of the batch size: users and their regular accounts are looked up (and locked) in bulk,
+        missing recipient accounts are created in bulk, transactions are validated against locked balances in Python,
+        then new balances are written and transactions' records are inserted in bulk.
+        """
+        user_ids = set()
+        for transaction_data in batch_data.transactions:
+            user_ids.add(transaction_data.to_user_id)
+            if transaction_data.type == TransactionType.FUNDS_TRANSFER:
+                user_ids.add(transaction_data.from_user_id)
+
+        existing_user_ids = set(
+            await self.db_session.scalars(sa.select(tables.User.id).where(tables.User.id.in_(user_ids)))
+        )
+        regular_accounts = await self._get_or_create_regular_accounts_for_batch(batch_data, existing_user_ids)
+        balances = {user_id: account.balance for user_id, account in regular_accounts.items()}
+
+        results = []
+        transactions_values = []
+        for index, transaction_data in enumerate(batch_data.transactions):
+            try:
+                self._apply_batch_transaction_to_balances(transaction_data, existing_user_ids, balances)
+            except HTTPException as http_err:
+                results.append(
+                    BatchTransactionResultOut(index=index, status_code=http_err.status_code, detail=http_err.detail)
+                )
+                continue
+            except ValueError as value_err:
+                results.append(
+                    BatchTransactionResultOut(
+                        index=index, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(value_err)
+                    )
+                )
+                continue
+
+            results.append(BatchTransactionResultOut(index=index, status_code=status.HTTP_200_OK))
+            transactions_values.append(
+                self._prepare_transaction_db_values(
+                    transaction_data,
+                    transaction_data.type,
+                    transaction_data.amount,
+                    getattr(transaction_data, "from_user_id", None),
+                    transaction_data.to_user_id,
+                )
+            )
 
-        for ordered_service in order.items:
-            transaction_amount += ordered_service.quantity * ordered_service.service.price
+        batch_failed = len(transactions_values) < len(results)
+        if batch_data.all_or_nothing and batch_failed:
+            await self.db_session.rollback()
+            for result in results:
+                if result.status_code == status.HTTP_200_OK:
+                    result.status_code = status.HTTP_424_FAILED_DEPENDENCY
+                    result.detail = ExceptionDescription.TRANSACTION_NOT_APPLIED_DUE_TO_BATCH_FAILURE.value
+
+            return BatchTransactionOut(committed=False, results=results)
+
+        changed_balances = [
+            {"account_id": account.id, "new_balance": balances[user_id]}
+            for user_id, account in regular_accounts.items()
+            if balances[user_id] != account.balance
+        ]
+        if changed_balances:
+            user_accounts = tables.UserAccount.__table__
+            await self.db_session.execute(
+                sa.update(user_accounts)
+                .where(user_accounts.c.id == sa.bindparam("account_id"))
+                .values(balance=sa.bindparam("new_balance")),
+                changed_balances,
+            )
 
-        return transaction_amount
+        inserted_transactions = []
+        if transactions_values:
+            transactions = tables.Transaction.__table__
+            # ids are taken from the sequence in advance - rows returned by a multi-row insert are matched
+            # to the results by their ids (the order of the returned rows is not guaranteed)
+            transactions_ids = await self.db_session.scalars(
+                sa.select(sa.func.nextval(sa.func.pg_get_serial_sequence(transactions.name, "id"))).select_from(
+                    sa.func.generate_series(1, len(transactions_values))
+                )
+            )
+            for transaction_values, transaction_id in zip(transactions_values, transactions_ids):
+                transaction_values["id"] = transaction_id
+            for transactions_values_chunk in _split_into_insert_chunks(transactions_values):
+                inserted_transactions.extend(
+                    await self.db_session.execute(
+                        sa.insert(transactions).values(transactions_values_chunk).returning(transactions)
+                    )
+                )
+            inserted_transactions_by_id = {
+                inserted_transaction.id: inserted_transaction for inserted_transaction in inserted_transactions
+            }
+            transactions_ids_iterator = iter(transaction_values["id"] for transaction_values in transactions_values)
+            ledger_entries_values = []
+            for result in results:
+                if result.status_code == status.HTTP_200_OK:
+                    inserted_transaction = inserted_transactions_by_id[next(transactions_ids_iterator)]
+                    ledger_entries_values.extend(
+                        self._prepare_ledger_entries_db_values(
+                            inserted_transaction.id,
+                            inserted_transaction.date,
+                            inserted_transaction.amount,
+                            inserted_transaction.from_user_id,
+                            inserted_transaction.to_user_id,
+                        )
+                    )
+                    transaction_out_model = (
+                        FundsTransferTransactionOut
+                        if inserted_transaction.type == TransactionType.FUNDS_TRANSFER
+                        else DepositTransactionOut
+                    )
+                    # (transient) record renders the description, if it is not stored
+                    result.transaction = transaction_out_model.from_orm(
+                        tables.Transaction(**inserted_transaction._mapping)
+                    )
+
+            for ledger_entries_values_chunk in _split_into_insert_chunks(ledger_entries_values):
+                await self.db_session.execute(
+                    sa.insert(tables.LedgerEntry.__table__).values(ledger_entries_values_chunk)
+                )
+
+        # all participants of the applied transactions (even if their balances haven't changed in total) -
+        # their histories have changed
+        affected_user_ids = {
+            user_id
+            for transaction_values in transactions_values
+            for user_id in (transaction_values["from_user_id"], transaction_values["to_user_id"])
+            if user_id is not None
+        }
+        batch_result = BatchTransactionOut(committed=True, results=results)
+        await self._commit(
+            affected_user_ids=affected_user_ids,
+            committed_transactions=inserted_transactions,
+            result=batch_result,
+        )
 
-    def _get_transaction_by_order_id(self, order_id: int, type_: TransactionType) -> tables.Transaction:
-        transactions = self.db_session.query(tables.Transaction).all()
-        transaction = [transaction for transaction in transactions if transaction.order_id == order_id
-                       and transaction.type == type_][0]
+        return batch_result
+
+    async def _commit(
+        self,
+        *,
+        affected_user_ids: Iterable[int],
+        committed_transactions: Iterable[tables.Transaction | sa.engine.Row],
+        result: tables.Transaction | BatchTransactionOut,
+    ) -> None:
+        """
+        Commits the transaction along with its result stored under the request's idempotency key (if there is one)
+        and invalidates cached balances of the users whose accounts were affected by it
+        (their balances are then read from the primary until replicas catch up).
+        Committed transactions are counted in metrics.
+        """
+        await store_response_within_transaction(self.db_session, result)
+        await self.db_session.commit()
+        balance_cache.invalidate(affected_user_ids)
+        replica_router.mark_written(affected_user_ids)
+
+        for transaction in committed_transactions:
+            record_committed_transaction(transaction.type, transaction.amount)
+
+    @staticmethod
+    def _calculate_order_total_amount(orders: sa.Table) -> sa.sql.ColumnElement:
+        """
+        Returns order's total amount expression: either the one frozen when the order was submitted or the one
+        calculated by an aggregate subquery (which is evaluated only if there is no frozen total amount).
+        """
+        calculated_total_amount = (
+            sa.select(sa.func.coalesce(sa.func.sum(tables.OrderItem.quantity * _get_order_item_price()), 0))
+            .join(tables.Service, tables.Service.id == tables.OrderItem.service_id)
+            .where(tables.OrderItem.order_id == orders.c.id)
+            .scalar_subquery()
+        )
+
+        return sa.func.coalesce(orders.c.total_amount, calculated_total_amount)
+
+    async def _get_transaction_by_order_id(self, order_id: int, type_: TransactionType) -> tables.Transaction:
+        transaction = await self.db_session.scalar(
+            sa.select(tables.Transaction)
+            .where(
+                sa.and_(
+                    tables.Transaction.order_id == order_id,
+                    tables.Transaction.type == type_,
+                )
+            )
+            .limit(1)
+        )
 
         if not transaction:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
@@ -238,51 +456,222 @@ class TransactionsService:
 
         return transaction
 
-    @staticmethod
-    def _transfer_funds(
+    async def _transfer_funds(
+        self,
         sender_account: tables.UserAccount | None,
         recipient_account: tables.UserAccount | tables.CompanyAccount,
         transfer_amount: Decimal,
     ) -> None:
         """
-        Utility method used to transfer funds in all transactions except for deposits.
+        Utility method used to transfer funds in all transactions.
         Do not confuse it with transfer_funds_between_user_accounts().
+        Balances are changed by guarded single-statement updates, so concurrent transactions on the same account
+        can't overwrite each other's changes. Accounts are always updated (and therefore locked) in the same order
+        to avoid deadlocks between concurrent transactions.
+        Company account is credited via one of its shards, if configured so.
         """
+        balance_changes = [(recipient_account, transfer_amount)]
         if sender_account:  # there's no sender account in deposit transaction
-            sender_account.balance -= transfer_amount
-            if sender_account.balance < 0:
-                raise ValueError(ExceptionDescription.ACCOUNT_BALANCE_CANNOT_BE_NEGATIVE.value)
-        recipient_account.balance += transfer_amount  # TODO: place logging here???
+            balance_changes.append((sender_account, -transfer_amount))
+
+        for account, amount in sorted(balance_changes, key=lambda change: (change[0].__tablename__, change[0].id)):
+            if isinstance(account, tables.CompanyAccount) and settings.COMPANY_ACCOUNT_BALANCE_SHARDS:
+                await self._credit_company_account_shard(account, amount)
+            else:
+                await self._change_account_balance(account, amount)  # TODO: place logging here???
+
+    async def _change_account_balance(
+        self,
+        account: tables.UserAccount | tables.CompanyAccount,
+        amount: Decimal,
+    ) -> Decimal:
+        """
+        Adds amount (which is negative for debits) to the account balance in a single
+        'UPDATE ... SET balance = balance + :amount WHERE id = :id AND balance >= -:amount RETURNING balance' statement.
+        Returns the new balance.
+        """
+        table = type(account).__table__
+        statement = (
+            sa.update(table)
+            .where(table.c.id == account.id)
+            .values(balance=table.c.balance + amount)
+            .returning(table.c.balance)
+        )
+        if amount < 0:
+            statement = statement.where(table.c.balance >= -amount)
+
+        new_balance = (await self.db_session.execute(statement)).scalar_one_or_none()
+        if new_balance is None:
+            raise ValueError(ExceptionDescription.ACCOUNT_BALANCE_CANNOT_BE_NEGATIVE.value)
+
+        set_committed_value(account, "balance", new_balance)
+        return new_balance
+
+    async def _credit_company_account_shard(self, company_account: tables.CompanyAccount, amount: Decimal) -> None:
+        """
+        Adds amount to the balance of a random shard of the company account (the shard is created on its first credit).
+        Only the shard is locked till the end of the transaction, so up to COMPANY_ACCOUNT_BALANCE_SHARDS payments
+        can be made concurrently.
+        """
+        company_account_shards = tables.CompanyAccountShard.__table__
+        shard_upsert = insert(company_account_shards).values(
+            company_account_id=company_account.id,
+            shard=random.randrange(settings.COMPANY_ACCOUNT_BALANCE_SHARDS),
+            balance=amount,
+        )
+        await self.db_session.execute(
+            shard_upsert.on_conflict_do_update(
+                index_elements=[company_account_shards.c.company_account_id, company_account_shards.c.shard],
+                set_={"balance": company_account_shards.c.balance + shard_upsert.excluded.balance},
+            )
+        )
+
+    async def _add_order_revenue_to_monthly_rollup(self, order_id: int, payment_date: datetime) -> None:
+        """
+        Adds revenue from each service in the paid order to the services' revenue of the payment month
+        (within the payment transaction). Services' prices frozen along with order's total amount are used,
+        so the revenue matches the amount actually paid.
+        """
+        order_items = tables.OrderItem.__table__
+        services = tables.Service.__table__
+        service_revenue_monthly = tables.ServiceRevenueMonthly.__table__
+
+        order_services_revenue = (
+            sa.select(
+                sa.literal(payment_date.date().replace(day=1), sa.Date),
+                order_items.c.service_id,
+                sa.func.sum(order_items.c.quantity * _get_order_item_price()),
+            )
+            .join(services, services.c.id == order_items.c.service_id)
+            .where(order_items.c.order_id == order_id)
+            .group_by(order_items.c.service_id)
+        )
+        rollup_upsert = insert(service_revenue_monthly).from_select(
+            ["period", "service_id", "revenue"], order_services_revenue
+        )
+        await self.db_session.execute(
+            rollup_upsert.on_conflict_do_update(
+                index_elements=[service_revenue_monthly.c.period, service_revenue_monthly.c.service_id],
+                set_={"revenue": service_revenue_monthly.c.revenue + rollup_upsert.excluded.revenue},
+            )
+        )
 
-    def _get_or_create_recipient_account_by_user_id(
+    async def _get_or_create_recipient_account_by_user_id(
         self,
         user_id: int,
     ) -> tables.UserAccount:
         """
         In case of deposit/money transfer transactions, if a recipient user doesn't have an account yet,
         both regular and reserve accounts will be automatically created with zero balance.
+        User's existence is only checked if the account is not found.
         """
-        self.information_service._raise_error_if_user_does_not_exist(user_id)
-
-        regular_account = (
-            self.db_session.query(tables.UserAccount)
-            .filter(
+        regular_account = await self.db_session.scalar(
+            sa.select(tables.UserAccount)
+            .where(
                 sa.and_(
                     tables.UserAccount.user_id == user_id,
                     tables.UserAccount.type == AccountType.REGULAR,
                 )
             )
-            .first()
+            .limit(1)
         )
 
         if not regular_account:
+            await self.information_service._raise_error_if_user_does_not_exist(user_id)
+
             regular_account = tables.UserAccount(user_id=user_id, type=AccountType.REGULAR)
             reserve_account = tables.UserAccount(user_id=user_id, type=AccountType.RESERVE)
             self.db_session.add_all([regular_account, reserve_account])
-            self.db_session.commit()
+            # no commit here - accounts are created within the same transaction as the deposit/transfer itself
+            await self.db_session.flush()
 
         return regular_account
 
+    async def _get_or_create_regular_accounts_for_batch(
+        self,
+        batch_data: BatchTransactionIn,
+        existing_user_ids: set[int],
+    ) -> dict[int, tables.UserAccount | sa.engine.Row]:
+        """
+        Returns regular accounts of the batch participants (mapped by user id) locked for update.
+        Accounts are locked in the order of their ids (just like in _transfer_funds()) to avoid deadlocks.
+        Recipients without accounts get both regular and reserve accounts created with zero balance
+        (by a single multi-row insert, rather than by an insert per account on flush).
+        """
+        regular_accounts = {
+            account.user_id: account
+            for account in await self.db_session.scalars(
+                sa.select(tables.UserAccount)
+                .where(
+                    sa.and_(
+                        tables.UserAccount.user_id.in_(existing_user_ids),
+                        tables.UserAccount.type == AccountType.REGULAR,
+                    )
+                )
+                .order_by(tables.UserAccount.id)
+                .with_for_update()
+            )
+        }
+
+        recipients_without_accounts = (
+            {transaction_data.to_user_id for transaction_data in batch_data.transactions} & existing_user_ids
+        ) - set(regular_accounts)
+        if recipients_without_accounts:
+            user_accounts = tables.UserAccount.__table__
+            new_accounts_values = [
+                {"user_id": user_id, "type": account_type, "balance": Decimal(0)}
+                for user_id in sorted(recipients_without_accounts)
+                for account_type in (AccountType.REGULAR, AccountType.RESERVE)
+            ]
+            for new_accounts_values_chunk in _split_into_insert_chunks(new_accounts_values):
+                new_accounts = await self.db_session.execute(
+                    sa.insert(user_accounts)
+                    .values(new_accounts_values_chunk)
+                    .returning(
+                        user_accounts.c.id, user_accounts.c.user_id, user_accounts.c.type, user_accounts.c.balance
+                    )
+                )
+                regular_accounts.update(
+                    {account.user_id: account for account in new_accounts if account.type == AccountType.REGULAR}
+                )
+
+        return regular_accounts
+
+    @staticmethod
+    def _apply_batch_transaction_to_balances(
+        transaction_data: DepositTransactionIn | FundsTransferTransactionIn,
+        existing_user_ids: set[int],
+        balances: dict[int, Decimal],
+    ) -> None:
+        """
+        Applies the transaction to the (locked) regular accounts' balances of the batch participants.
+        Performs the same checks (in the same order) as single deposit/funds transfer transactions do.
+        """
+        if transaction_data.type == TransactionType.FUNDS_TRANSFER:
+            if transaction_data.from_user_id not in existing_user_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=ExceptionDescription.USER_DOES_NOT_EXIST.value,
+                )
+            if transaction_data.from_user_id not in balances:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=ExceptionDescription.ACCOUNT_DOES_NOT_EXIST.value,
+                )
+
+        if transaction_data.to_user_id not in existing_user_ids:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=ExceptionDescription.USER_DOES_NOT_EXIST.value,
+            )
+
+        if transaction_data.type == TransactionType.FUNDS_TRANSFER:
+            if balances[transaction_data.from_user_id] < transaction_data.amount:
+                raise ValueError(ExceptionDescription.ACCOUNT_BALANCE_CANNOT_BE_NEGATIVE.value)
+            balances[transaction_data.from_user_id] -= transaction_data.amount
+
+        balances[transaction_data.to_user_id] += transaction_data.amount
+
     def _prepare_transaction_db_record(
         self,
         transaction_data: BaseTransactionIn,
@@ -293,75 +682,169 @@ class TransactionsService:
         order_id: int | None = None,
     ) -> tables.Transaction:
         transaction = tables.Transaction(
-            **transaction_data.dict(exclude={"type", "amount"}),
+            **self._prepare_transaction_db_values(
+                transaction_data, type_, amount, from_user_id, to_user_id, order_id
+            )
+        )
+        transaction.ledger_entries = [
+            tables.LedgerEntry(**ledger_entry_values)
+            for ledger_entry_values in self._prepare_ledger_entries_db_values(
+                None, transaction.date, amount, from_user_id, to_user_id
+            )
+        ]
+
+        return transaction
+
+    def _prepare_transaction_db_values(
+        self,
+        transaction_data: BaseTransactionIn,
+        type_: TransactionType,
+        amount: Decimal,
+        from_user_id: int | None = None,
+        to_user_id: int | None = None,
+        order_id: int | None = None,
+    ) -> dict:
+        """
+        Column values of the transaction's record (also used for bulk inserts).
+        In case of order-based transactions 'from_user_id' is the user who made the order - it's used for the
+        description only, the record's 'from_user_id' is the sender of a funds transfer.
+        """
+        transaction_values = transaction_data.dict(exclude={"type", "amount"})
+        # records inserted in bulk all have the same columns
+        transaction_values.setdefault("from_user_id", None)
+        date = datetime.utcnow()
+
+        return dict(
+            **transaction_values,
             type=type_,
             amount=amount,
-            description=self._prepare_transaction_description(type_, amount, from_user_id, to_user_id, order_id)
+            date=date,
+            description=self._prepare_transaction_description(type_, amount, date, from_user_id, to_user_id, order_id),
         )
 
-        return transaction
+    @staticmethod
+    def _prepare_ledger_entries_db_values(
+        transaction_id: int | None,
+        date: datetime,
+        amount: Decimal,
+        from_user_id: int | None = None,
+        to_user_id: int | None = None,
+    ) -> list[dict]:
+        """
+        Column values of the ledger entries of each user participating in the transaction
+        (for transactions between user's own accounts only 'from_user_id' is specified).
+        """
+        return [
+            dict(user_id=user_id, transaction_id=transaction_id, date=date, amount=amount)
+            for user_id in (from_user_id, to_user_id)
+            if user_id is not None
+        ]
 
     @staticmethod
     def _prepare_transaction_description(
         transaction_type: TransactionType,
         amount: Decimal,
+        date: datetime,
         from_user_id: int | None = None,
         to_user_id: int | None = None,
         order_id: int | None = None,
-    ) -> TransactionDescription:
-        description_template = TransactionDescription[f"{transaction_type.name}"].value
-        date = datetime.utcnow()
-
-        if transaction_type == TransactionType.DEPOSIT:
-            transaction_description = description_template.format(amount=amount, to_user_id=to_user_id, date=date)
-        elif transaction_type == TransactionType.FUNDS_TRANSFER:
-            transaction_description = description_template.format(
-                amount=amount, from_user_id=from_user_id, to_user_id=to_user_id, date=date
-            )
-        elif transaction_type in [
-            TransactionType.RESERVE,
-            TransactionType.RESERVE_REFUND,
-            TransactionType.PAYMENT_TO_COMPANY,
-        ]:
-            transaction_description = description_template.format(
-                amount=amount,
-                user_id=from_user_id,
-                order_id=order_id,
-                date=date,
-            )
+    ) -> str | None:
+        """
+        Descriptions of deposits and funds transfers are not stored in compact mode - they are rendered from the other
+        columns of the transaction's record when it's read (see tables.Transaction.description).
+        """
+        if settings.COMPACT_TRANSACTION_DESCRIPTIONS and transaction_type in COMPACT_DESCRIPTION_TRANSACTION_TYPES:
+            return None
 
-        return transaction_description
+        return render_transaction_description(transaction_type, amount, date, from_user_id, to_user_id, order_id)
 
-    def _raise_error_if_order_does_not_exist_or_has_irrelevant_status(
-        self, order_id: int, correct_status: OrderStatus
-    ) -> None:
+    async def _transition_order_status(
+        self,
+        order_id: int,
+        *,
+        expected_status: OrderStatus,
+        new_status: OrderStatus,
+        calculate_total_amount: bool = False,
+    ) -> sa.engine.Row:
         """
-        Helps to avoid situations when order doesn't exist or has irrelevant status with regard to the transaction
-        to be performed.
+        Moves the order from the expected status to the new one by a single compare-and-set update, which also locks
+        the order until the end of the transaction - so concurrent transactions on the same order (e.g. two reserves)
+        can't both pass the status check.
         E.g.:
          for 'reserve' transaction to happen, order must be in 'not submitted' state;
          for 'reserve refund' or 'payment to company' transaction to happen, order must be in 'in progress' state.
+        Returns order's user id (and order's total amount, if requested).
+        This method should belong to another microservice - orders microservice.
+        Placed here for demonstration/convenience purposes.
         """
-        order = self.db_session.query(tables.Order).filter(tables.Order.id == order_id).first()
-        if not order:
-            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                                detail=ExceptionDescription.ORDER_DOES_NOT_EXIST.value)
+        orders = tables.Order.__table__
+        new_values = {"status": new_status}
+        returned_columns = [orders.c.user_id]
+        if calculate_total_amount and settings.FREEZE_ORDERS_TOTAL_AMOUNT:
+            # items' prices are frozen by the same statement (data-modifying CTE) and add up to the total amount;
+            # the CTE is executed regardless of the outer update, so it checks the order's status on its own
+            order_items = tables.OrderItem.__table__
+            services = tables.Service.__table__
+            frozen_order_items = (
+                sa.update(order_items)
+                .where(
+                    sa.and_(
+                        order_items.c.order_id == order_id,
+                        order_items.c.service_id == services.c.id,
+                        sa.exists().where(sa.and_(orders.c.id == order_id, orders.c.status == expected_status)),
+                    )
+                )
+                .values(price=services.c.price)
+                .returning((order_items.c.quantity * order_items.c.price).label("amount"))
+                .cte("frozen_order_items")
+            )
+            new_values["total_amount"] = (
+                sa.select(sa.func.coalesce(sa.func.sum(frozen_order_items.c.amount), 0)).scalar_subquery()
+            )
+            returned_columns.append(orders.c.total_amount)
+        elif calculate_total_amount:
+            returned_columns.append(self._calculate_order_total_amount(orders).label("total_amount"))
+
+        # no commit here - commits happen in the methods of the TransactionsService
+        # (account balance operations, transactions' saves and order status updates all need to happen within the same
+        # transaction)
+        order = (
+            await self.db_session.execute(
+                sa.update(orders)
+                .where(
+                    sa.and_(
+                        orders.c.id == order_id,
+                        orders.c.status == expected_status,
+                    )
+                )
+                .values(new_values)
+                .returning(*returned_columns)
+            )
+        ).one_or_none()
+
+        if order is None:
+            # the order is only read to find out why it can't be transitioned
+            order_status = await self.db_session.scalar(
+                sa.select(orders.c.status).where(orders.c.id == order_id)
+            )
+            if not order_status:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                    detail=ExceptionDescription.ORDER_DOES_NOT_EXIST.value)
 
-        if order.status != correct_status:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail=ExceptionDescription.INCORRECT_ORDER_STATUS.value
-                                .format(order_status=order.status))
+                                .format(order_status=order_status))
 
+        return order
+
+
+def _split_into_insert_chunks(rows_values: list[dict]) -> Iterator[list[dict]]:
+    """Rows of a multi-row insert split into chunks, so that each statement stays under the bind parameters' limit"""
+    chunk_size = max(MAX_STATEMENT_BIND_PARAMETERS // len(rows_values[0]), 1)
+    for chunk_start in range(0, len(rows_values), chunk_size):
+        yield rows_values[chunk_start:chunk_start + chunk_size]
 
-def _update_order_status(*, order_id: int, new_status: OrderStatus, db_session: Session) -> None:
-    """
-    This method should belong to another microservice - orders microservice.
-    Placed here for demonstration/convenience purposes.
-    """
-    order = db_session.query(tables.Order).filter(tables.Order.id == order_id).first()
-    order.status = new_status
 
-    db_session.add(order)
-    # no commit here - commits happen in the methods of the TransactionsService
-    # (account balance operations, transactions' saves and order status updates all need to happen within the same
-    # transaction)
+def _get_order_item_price() -> sa.sql.ColumnElement:
+    """Service's price frozen in the order item (when the order was submitted) or its current price"""
+    return sa.func.coalesce(tables.OrderItem.price, tables.Service.price)
@@ -0,0 +1,53 @@
+"""create ledger entries table
+
+Revision ID: 1a6f0c3e9b52
+Revises: e5d3b8a04c17
+Create Date: 2026-10-18 13:08:15.337902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6f0c3e9b52'
+down_revision = 'e5d3b8a04c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('ledger_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('amount', sa.DECIMAL(), nullable=True),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'transaction_id')
+    )
+
+    # entries for the existing transactions: senders/recipients of deposits and funds transfers and
+    # users who made the orders for reserve/reserve refund/payment to company transactions
+    op.execute(
+        """
+        INSERT INTO ledger_entries (user_id, transaction_id, date, amount)
+        SELECT from_user_id, id, date, amount FROM transactions WHERE from_user_id IS NOT NULL
+        UNION
+        SELECT to_user_id, id, date, amount FROM transactions WHERE to_user_id IS NOT NULL
+        UNION
+        SELECT orders.user_id, transactions.id, transactions.date, transactions.amount
+        FROM transactions JOIN orders ON orders.id = transactions.order_id
+        """
+    )
+
+    op.create_index('ix_ledger_entries_user_id_date_transaction_id', 'ledger_entries',
+                    ['user_id', 'date', 'transaction_id'], unique=False)
+    op.create_index('ix_ledger_entries_user_id_amount_transaction_id', 'ledger_entries',
+                    ['user_id', 'amount', 'transaction_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ledger_entries_user_id_amount_transaction_id', table_name='ledger_entries')
+    op.drop_index('ix_ledger_entries_user_id_date_transaction_id', table_name='ledger_entries')
+    op.drop_table('ledger_entries')
@@ -0,0 +1,45 @@
+"""compact transactions descriptions
+
+Revision ID: 4e8a2c6d0b19
+Revises: 9d4b7e1c2a86
+Create Date: 2026-10-18 15:48:21.730915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8a2c6d0b19'
+down_revision = '9d4b7e1c2a86'
+branch_labels = None
+depends_on = None
+
+
+# the same templates as TransactionDescription ones (in PostgreSQL format() notation), used to restore descriptions
+# (of the transactions which are compacted - see tables.COMPACT_DESCRIPTION_TRANSACTION_TYPES)
+DESCRIPTION_TEMPLATES = {
+    'DEPOSIT': (
+        "'Money in the amount of %sUSD was deposited to user %s from external services on %s.', "
+        "amount, to_user_id, date"
+    ),
+    'FUNDS_TRANSFER': (
+        "'Money in the amount of %sUSD was transferred from user %s to user %s on %s.', "
+        "amount, from_user_id, to_user_id, date"
+    ),
+}
+
+
+def upgrade() -> None:
+    # new transactions' descriptions aren't stored (when COMPACT_TRANSACTION_DESCRIPTIONS is set), the stored ones
+    # are kept - they're cleared by commands/compact_transaction_descriptions.py
+    op.alter_column('transactions', 'description', existing_type=sa.String(length=255), nullable=True)
+
+
+def downgrade() -> None:
+    for transaction_type, description_template in DESCRIPTION_TEMPLATES.items():
+        op.execute(
+            f"UPDATE transactions SET description = format({description_template}) "
+            f"WHERE type = '{transaction_type}' AND description IS NULL"
+        )
+    op.alter_column('transactions', 'description', existing_type=sa.String(length=255), nullable=False)
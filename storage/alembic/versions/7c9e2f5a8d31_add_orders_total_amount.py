@@ -0,0 +1,34 @@
+"""add orders total amount
+
+Revision ID: 7c9e2f5a8d31
+Revises: 1a6f0c3e9b52
+Create Date: 2026-10-18 13:47:52.604471
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c9e2f5a8d31'
+down_revision = '1a6f0c3e9b52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('orders', sa.Column('total_amount', sa.DECIMAL(), nullable=True))
+
+    # orders submitted so far - total amount is the amount that was reserved
+    # (not submitted orders get their total amount when they are submitted)
+    op.execute(
+        """
+        UPDATE orders SET total_amount = transactions.amount
+        FROM transactions
+        WHERE transactions.order_id = orders.id AND transactions.type = 'RESERVE'
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('orders', 'total_amount')
@@ -0,0 +1,23 @@
+"""add transactions order_id type index
+
+Revision ID: 8b2e4d6f1a93
+Revises: 3f1c9a2b7d40
+Create Date: 2026-10-18 11:03:54.218733
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a93'
+down_revision = '3f1c9a2b7d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_order_id_type', 'transactions', ['order_id', 'type'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_order_id_type', table_name='transactions')
@@ -0,0 +1,37 @@
+"""create company account shards table
+
+Revision ID: 9d4b7e1c2a86
+Revises: 7c9e2f5a8d31
+Create Date: 2026-10-18 15:02:37.418260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b7e1c2a86'
+down_revision = '7c9e2f5a8d31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('company_account_shards',
+    sa.Column('company_account_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.DECIMAL(), nullable=False),
+    sa.ForeignKeyConstraint(['company_account_id'], ['company_accounts.id'], ),
+    sa.PrimaryKeyConstraint('company_account_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    # shards' balances are moved back to the company accounts, so that no payments are lost
+    op.execute(
+        "UPDATE company_accounts SET balance = company_accounts.balance + shards.balance "
+        "FROM (SELECT company_account_id, SUM(balance) AS balance FROM company_account_shards "
+        "GROUP BY company_account_id) AS shards "
+        "WHERE company_accounts.id = shards.company_account_id"
+    )
+    op.drop_table('company_account_shards')
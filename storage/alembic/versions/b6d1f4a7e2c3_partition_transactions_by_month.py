@@ -0,0 +1,132 @@
+"""partition transactions by month
+
+Revision ID: b6d1f4a7e2c3
+Revises: 4e8a2c6d0b19
+Create Date: 2026-10-18 16:52:07.418263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1f4a7e2c3'
+down_revision = '4e8a2c6d0b19'
+branch_labels = None
+depends_on = None
+
+
+# partitions of the following months are created by commands/partitions.py afterwards
+PARTITIONS_MONTHS_AHEAD = 3
+
+TRANSACTIONS_COLUMNS = (
+    'id, amount, description, date, order_id, from_user_id, to_user_id, to_company_account, type'
+)
+TRANSACTIONS_INDEXES = {
+    'ix_transactions_order_id': ['order_id'],
+    'ix_transactions_order_id_type': ['order_id', 'type'],
+    'ix_transactions_date_id': ['date', 'id'],
+}
+
+
+def _transactions_columns() -> list[sa.Column]:
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('transactions_id_seq'::regclass)"),
+                  nullable=False),
+        sa.Column('amount', sa.DECIMAL(), nullable=True),
+        sa.Column('description', sa.String(length=255), nullable=True),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('from_user_id', sa.Integer(), nullable=True),
+        sa.Column('to_user_id', sa.Integer(), nullable=True),
+        sa.Column('to_company_account', sa.Integer(), nullable=True),
+        sa.Column('type', postgresql.ENUM(name='transaction_type', create_type=False), nullable=False),
+        sa.ForeignKeyConstraint(['from_user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+        sa.ForeignKeyConstraint(['to_company_account'], ['company_accounts.id'], ),
+        sa.ForeignKeyConstraint(['to_user_id'], ['users.id'], ),
+    ]
+
+
+def _replace_transactions_table(new_table_name: str) -> None:
+    """Renames the current table (along with its primary key) so that the new one can take its names"""
+    op.rename_table('transactions', new_table_name)
+    op.execute(f"ALTER INDEX transactions_pkey RENAME TO {new_table_name}_pkey")
+    for index_name in TRANSACTIONS_INDEXES:
+        op.drop_index(index_name, table_name=new_table_name)
+
+
+def _move_transactions_from(old_table_name: str) -> None:
+    op.execute(f"INSERT INTO transactions ({TRANSACTIONS_COLUMNS}) SELECT {TRANSACTIONS_COLUMNS} FROM {old_table_name}")
+    # the sequence would be dropped along with the old table otherwise
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id")
+    op.drop_table(old_table_name)
+
+    # indexes are built after the rows are copied (faster than updating them row by row)
+    for index_name, columns in TRANSACTIONS_INDEXES.items():
+        op.create_index(index_name, 'transactions', columns, unique=False)
+    op.execute("ANALYZE transactions")
+
+
+def upgrade() -> None:
+    # date becomes a part of the primary key (the partition key), so it can't be empty anymore
+    transactions_without_date = op.get_bind().scalar(sa.text("SELECT count(*) FROM transactions WHERE date IS NULL"))
+    if transactions_without_date:
+        raise RuntimeError(
+            f"{transactions_without_date} transactions have no date - set their dates "
+            f"(e.g. to the dates of their ledger entries) and rerun the migration"
+        )
+
+    # ledger entries don't reference transactions by a foreign key anymore - otherwise partitions of old months
+    # couldn't be detached (and archived) on their own
+    op.drop_constraint('ledger_entries_transaction_id_fkey', 'ledger_entries', type_='foreignkey')
+    _replace_transactions_table('transactions_unpartitioned')
+
+    op.create_table('transactions',
+    *_transactions_columns(),
+    sa.PrimaryKeyConstraint('id', 'date'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    # transactions of the months without partitions land here (instead of failing)
+    op.execute("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT")
+    # a partition for each month since the first transaction up to the months ahead
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', coalesce(
+                        (SELECT min(date) FROM transactions_unpartitioned), timezone('utc', now())
+                    )),
+                    date_trunc('month', timezone('utc', now())) + interval '{PARTITIONS_MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF transactions FOR VALUES FROM (%L) TO (%L)',
+                    'transactions_' || to_char(month, '"y"YYYY"m"MM'), month, (month + interval '1 month')::date
+                );
+            END LOOP;
+        END $$;
+        """
+    )
+
+    _move_transactions_from('transactions_unpartitioned')
+
+
+def downgrade() -> None:
+    _replace_transactions_table('transactions_partitioned')
+
+    op.create_table('transactions',
+    *_transactions_columns(),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    _move_transactions_from('transactions_partitioned')  # partitions are dropped along with the table
+    op.alter_column('transactions', 'date', existing_type=sa.DateTime(), nullable=True)
+    op.create_foreign_key('ledger_entries_transaction_id_fkey', 'ledger_entries', 'transactions',
+                          ['transaction_id'], ['id'])
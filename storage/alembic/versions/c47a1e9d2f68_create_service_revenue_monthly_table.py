@@ -0,0 +1,31 @@
+"""create service revenue monthly table
+
+Revision ID: c47a1e9d2f68
+Revises: 8b2e4d6f1a93
+Create Date: 2026-10-18 11:41:09.570214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1e9d2f68'
+down_revision = '8b2e4d6f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # to be filled with existing payments' history by 'python -m commands.backfill_service_revenue'
+    op.create_table('service_revenue_monthly',
+    sa.Column('period', sa.Date(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.DECIMAL(), nullable=False),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+    sa.PrimaryKeyConstraint('period', 'service_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('service_revenue_monthly')
@@ -0,0 +1,25 @@
+"""add order items price
+
+Revision ID: d2a7c5e1f384
+Revises: b6d1f4a7e2c3
+Create Date: 2026-10-18 17:24:51.093817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e1f384'
+down_revision = 'b6d1f4a7e2c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # items of the orders submitted so far keep no price (their services' current prices are used for them)
+    op.add_column('order_items', sa.Column('price', sa.DECIMAL(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('order_items', 'price')
@@ -0,0 +1,23 @@
+"""add transactions keyset pagination indexes
+
+Revision ID: e5d3b8a04c17
+Revises: c47a1e9d2f68
+Create Date: 2026-10-18 12:26:47.811350
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5d3b8a04c17'
+down_revision = 'c47a1e9d2f68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_date_id', 'transactions', ['date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_date_id', table_name='transactions')
@@ -1,8 +1,15 @@
+import itertools
+import time
+from collections import OrderedDict
+from typing import Iterable
+
 import sqlalchemy as sa
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from settings import settings
 
@@ -10,11 +17,140 @@ from settings import settings
 # TODO: logging
 
 
-engine: sa.engine.Engine = sa.create_engine(settings.DATABASE_URL, echo=True, json_serializer=jsonable_encoder)
+engine: sa.engine.Engine = sa.create_engine(
+    settings.DATABASE_URL, echo=settings.DATABASE_ECHO, json_serializer=jsonable_encoder
+)
 
 Session: sessionmaker = sessionmaker(bind=engine)
 
 
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool which also keeps track of how long requests wait for connections"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        wait_started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa.exc.TimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            wait_seconds = time.perf_counter() - wait_started_at
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def get_stats(self) -> dict[str, int | float]:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkouts": self.checkouts,
+            "checkout_timeouts": self.checkout_timeouts,
+            "avg_wait_seconds": self.total_wait_seconds / self.checkouts if self.checkouts else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+
+def _create_async_engine(database_url: str) -> AsyncEngine:
+    """The database accessed via asyncpg driver (each engine has its own connection pool)"""
+    return create_async_engine(
+        sa.engine.make_url(database_url).set(drivername="postgresql+asyncpg"),
+        echo=settings.DATABASE_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+    )
+
+
+# the same database accessed via asyncpg driver - used by API routes and services
+async_engine: AsyncEngine = _create_async_engine(settings.DATABASE_URL)
+
+# read replicas (hot standbys of the primary) - used by read sessions only
+replica_engines: list[AsyncEngine] = [
+    _create_async_engine(replica_database_url) for replica_database_url in settings.DATABASE_REPLICA_URLS
+]
+
+# objects are not expired on commit since lazy loading of expired attributes is not possible with AsyncSession
+# (e.g. transaction records are returned to the client after the commit)
+AsyncSessionLocal: sessionmaker = sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# read sessions run read-only transactions (asyncpg starts them with BEGIN READ ONLY - no extra round trips),
+# so that a write can't slip into a read session by mistake
+ReadOnlyAsyncSessionLocal: sessionmaker = sessionmaker(
+    bind=async_engine.execution_options(postgresql_readonly=True), class_=AsyncSession, expire_on_commit=False
+)
+ReplicaAsyncSessionsLocal: list[sessionmaker] = [
+    sessionmaker(
+        bind=replica_engine.execution_options(postgresql_readonly=True), class_=AsyncSession, expire_on_commit=False
+    )
+    for replica_engine in replica_engines
+]
+
+
+class ReplicaRouter:
+    """
+    Chooses the database read sessions are opened with: replicas are taken in turn, but replicas lag behind
+    the primary, so reads concerning the users who have written recently go to the primary (read-your-writes).
+    Users are read from the primary for read_your_writes_seconds after their commits - the time replicas
+    are expected to catch up in. Writes are tracked by each worker process on its own (just like balance cache
+    invalidations), so the period should also cover requests of the same client served by other processes.
+    """
+
+    def __init__(
+        self,
+        primary_sessionmaker: sessionmaker,
+        replica_sessionmakers: list[sessionmaker],
+        read_your_writes_seconds: float,
+    ) -> None:
+        self.primary_sessionmaker = primary_sessionmaker
+        self.replica_sessionmakers = replica_sessionmakers
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._next_replica_sessionmaker = itertools.cycle(replica_sessionmakers)
+        # time of the last commit of each user (in the order of commits, so the expired ones are at the beginning)
+        self._written_at: OrderedDict[int, float] = OrderedDict()
+
+    def mark_written(self, user_ids: Iterable[int]) -> None:
+        """Called after each commit of the writes affecting the users"""
+        if not self.replica_sessionmakers:
+            return
+
+        written_at = time.monotonic()
+        for user_id in user_ids:
+            self._written_at[user_id] = written_at
+            self._written_at.move_to_end(user_id)
+
+    def get_sessionmaker(self, user_ids: Iterable[int] = ()) -> sessionmaker:
+        if not self.replica_sessionmakers:
+            return self.primary_sessionmaker
+
+        expired_at = time.monotonic() - self.read_your_writes_seconds
+        while self._written_at and next(iter(self._written_at.values())) < expired_at:
+            self._written_at.popitem(last=False)
+
+        if any(user_id in self._written_at for user_id in user_ids):
+            return self.primary_sessionmaker
+
+        return next(self._next_replica_sessionmaker)
+
+
+replica_router = ReplicaRouter(
+    ReadOnlyAsyncSessionLocal, ReplicaAsyncSessionsLocal, settings.REPLICA_READ_YOUR_WRITES_SECONDS
+)
+
+
 # Dependency to be injected
 def get_db_session() -> Session:
     with Session() as session:
@@ -26,3 +162,29 @@ def get_db_session() -> Session:
             raise http_err  # TODO: logging here?
         finally:
             session.close()
+
+
+# Dependency to be injected (async routes)
+async def get_async_db_session() -> AsyncSession:
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+def _get_requested_user_ids(request: Request) -> list[int]:
+    """Users the request reads the data of (as passed to the routes: 'user_id' path or 'user_ids' query parameter)"""
+    requested_user_ids = request.query_params.getlist("user_ids")
+    if "user_id" in request.path_params:
+        requested_user_ids.append(request.path_params["user_id"])
+
+    return [int(user_id) for user_id in requested_user_ids if str(user_id).isdigit()]
+
+
+# Dependency to be injected (async routes which only read)
+async def get_async_read_session(request: Request) -> AsyncSession:
+    """
+    Opens a read-only session on one of the replicas (or on the primary if there are no replicas
+    or the requested users have written recently - see ReplicaRouter).
+    """
+    read_sessionmaker = replica_router.get_sessionmaker(_get_requested_user_ids(request))
+    async with read_sessionmaker() as session:
+        yield session
@@ -0,0 +1,80 @@
+import json
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+from logging_config import LoggingConfig
+from settings import settings
+from storage.database import async_engine, engine, replica_engines
+
+
+slow_queries_logger = logging.getLogger(LoggingConfig().SLOW_QUERIES_LOGGER_NAME)
+
+
+@dataclass
+class QueryStats:
+    """SQL statements executed while handling a single request"""
+
+    request: str = ""
+    count: int = 0
+    total_seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: str | None = None
+
+    def add(self, statement: str, duration_seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += duration_seconds
+        if duration_seconds > self.slowest_seconds:
+            self.slowest_seconds = duration_seconds
+            self.slowest_statement = statement
+
+    def to_server_timing_header(self) -> str:
+        return (
+            f'db;dur={self.total_seconds * 1000:.2f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest_seconds * 1000:.2f}"
+        )
+
+
+# set by the middleware for each request (see main.py): statements executed outside requests aren't collected
+request_query_stats: ContextVar[QueryStats | None] = ContextVar("request_query_stats", default=None)
+
+
+def _start_query_timer(conn: sa.engine.Connection, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _stop_query_timer(conn: sa.engine.Connection, cursor, statement, parameters, context, executemany) -> None:
+    duration_seconds = time.perf_counter() - conn.info["query_started_at"].pop()
+
+    query_stats = request_query_stats.get()
+    if query_stats is not None:
+        query_stats.add(statement, duration_seconds)
+
+    if duration_seconds > settings.SLOW_QUERY_THRESHOLD_SECONDS:
+        slow_queries_logger.warning(
+            json.dumps(
+                {
+                    "duration_ms": round(duration_seconds * 1000, 2),
+                    "request": query_stats.request if query_stats else None,
+                    "executemany": executemany,
+                    "statement": statement,  # parameters are not logged - they may contain users' data
+                }
+            )
+        )
+
+
+def _discard_query_timer(exception_context: sa.engine.ExceptionContext) -> None:
+    # failed statements don't reach after_cursor_execute
+    if exception_context.connection is not None and exception_context.connection.info.get("query_started_at"):
+        exception_context.connection.info["query_started_at"].pop()
+
+
+instrumented_engines = [engine, async_engine.sync_engine, *(replica.sync_engine for replica in replica_engines)]
+for instrumented_engine in instrumented_engines:
+    event.listen(instrumented_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(instrumented_engine, "after_cursor_execute", _stop_query_timer)
+    event.listen(instrumented_engine, "handle_error", _discard_query_timer)
@@ -1,9 +1,11 @@
 import datetime
+from decimal import Decimal
 from enum import Enum
 
 import sqlalchemy as sa
+from sqlalchemy import event
 from sqlalchemy.dialects.postgresql import ENUM as pgEnum
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import configure_mappers, declarative_base, relationship
 from sqlalchemy.types import DECIMAL
 
 from storage.database import engine
@@ -64,6 +66,27 @@ class CompanyAccount(Base):
         )
 
 
+class CompanyAccountShard(Base):
+    """
+    Part of company account balance - payments are credited to one of the shards (picked at random) rather than
+    to the company account itself, so that concurrent payments don't queue up on a single row lock.
+    Company account balance is its own balance plus balances of all its shards; shards are periodically compacted
+    into the company account (see commands/compact_company_account_balance.py).
+    """
+
+    __tablename__ = "company_account_shards"
+
+    company_account_id = sa.Column(sa.Integer, sa.ForeignKey("company_accounts.id"), primary_key=True)
+    shard = sa.Column(sa.Integer, primary_key=True)
+    balance = sa.Column(DECIMAL, nullable=False, default=0)
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} company_account_id={self.company_account_id} shard={self.shard} "
+            f"balance={self.balance}>"
+        )
+
+
 class OrderStatus(str, Enum):
     NOT_SUBMITTED = "not submitted"
     IN_PROGRESS = "in progress"  # money can be transferred from regular account to reserve account (of the same user)
@@ -76,6 +99,8 @@ class Order(Base):
 
     id = sa.Column(sa.Integer, primary_key=True)
     status = sa.Column(pgEnum(OrderStatus), default=OrderStatus.NOT_SUBMITTED)
+    # price snapshot - frozen when the order is submitted (i.e. when the funds are reserved)
+    total_amount = sa.Column(DECIMAL, nullable=True)
     user_id = sa.Column(
         sa.Integer, sa.ForeignKey("users.id"), index=True
     )
@@ -94,6 +119,8 @@ class OrderItem(Base):
 
     id = sa.Column(sa.Integer, primary_key=True)
     quantity = sa.Column(sa.Integer, default=1)
+    # price snapshot - frozen along with order's total amount (service's current price is used until then)
+    price = sa.Column(DECIMAL, nullable=True)
     service_id = sa.Column(sa.Integer, sa.ForeignKey("services.id"), index=True)
     order_id = sa.Column(sa.Integer, sa.ForeignKey("orders.id"), index=True)
 
@@ -136,14 +163,67 @@ class TransactionType(str, Enum):
     PAYMENT_TO_COMPANY = "payment to company"  # reserve account -> company account
 
 
+class TransactionDescription(str, Enum):
+    DEPOSIT = "Money in the amount of {amount}USD was deposited to user {to_user_id} from external services on {date}."
+    FUNDS_TRANSFER = (
+        "Money in the amount of {amount}USD was transferred from user {from_user_id} to user {to_user_id} on {date}."
+    )
+    RESERVE = (
+        "Money in the amount of {amount}USD was reserved on user {user_id} reserve account as per the order {order_id} "
+        "on {date}."
+    )
+    RESERVE_REFUND = (
+        "Money in the amount of {amount}USD was refunded to user {user_id} account from his/her reserve account as "
+        "per the order {order_id} on {date}."
+    )
+    PAYMENT_TO_COMPANY = (
+        "Money in the amount of {amount}USD was paid by user {user_id} to the company account as per the "
+        "order {order_id} on {date}."
+    )
+
+
+def render_transaction_description(
+    type_: TransactionType,
+    amount: Decimal,
+    date: datetime.datetime,
+    from_user_id: int | None = None,
+    to_user_id: int | None = None,
+    order_id: int | None = None,
+) -> str:
+    """
+    Description template is picked by the transaction type. In case of order-based transactions (reserve, reserve
+    refund, payment to company), 'from_user_id' is the user who made the order.
+    """
+    return TransactionDescription[type_.name].value.format(
+        amount=amount,
+        from_user_id=from_user_id,
+        to_user_id=to_user_id,
+        user_id=from_user_id,
+        order_id=order_id,
+        date=date,
+    )
+
+
+# transactions whose descriptions can be rendered from their own records (and so aren't stored in compact mode) -
+# descriptions of order-based transactions mention the user who made the order, which isn't a part of the record
+COMPACT_DESCRIPTION_TRANSACTION_TYPES = frozenset({TransactionType.DEPOSIT, TransactionType.FUNDS_TRANSFER})
+
+
 class Transaction(Base):
+    """
+    Transactions are partitioned by range of dates (a partition per month, see commands/partitions.py), so the date
+    is a part of the primary key - transactions are still identified by id alone.
+    """
+
     __tablename__ = "transactions"
 
-    id = sa.Column(sa.Integer, primary_key=True)
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
     amount = sa.Column(DECIMAL)
     type = sa.Column(pgEnum(TransactionType), nullable=False)
-    description = sa.Column(sa.String(255), nullable=False)
-    date = sa.Column(sa.DateTime, default=datetime.datetime.utcnow)
+    # empty for compact transactions' records (deposits and funds transfers only, see
+    # COMPACT_DESCRIPTION_TRANSACTION_TYPES) - description is rendered from the other columns when it's read
+    stored_description = sa.Column("description", sa.String(255), nullable=True)
+    date = sa.Column(sa.DateTime, primary_key=True, default=datetime.datetime.utcnow)  # partition key
     order_id = sa.Column(
         sa.Integer,
         sa.ForeignKey("orders.id"),
@@ -160,6 +240,30 @@ class Transaction(Base):
         nullable=True,
     )
 
+    ledger_entries = relationship(
+        "LedgerEntry", primaryjoin="Transaction.id == foreign(LedgerEntry.transaction_id)", cascade="all, delete"
+    )
+
+    __table_args__ = (
+        sa.Index("ix_transactions_order_id_type", "order_id", "type"),
+        sa.Index("ix_transactions_date_id", "date", "id"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+    @property
+    def description(self) -> str:
+        if self.stored_description is not None:
+            return self.stored_description
+
+        return render_transaction_description(
+            self.type, self.amount, self.date, self.from_user_id, self.to_user_id, self.order_id
+        )
+
+    @description.setter
+    def description(self, description: str | None) -> None:
+        self.stored_description = description
+
     def __repr__(self):
         return (
             f"<{self.__class__.__name__} amount={self.amount} type={self.type} description={self.description} "
@@ -168,4 +272,76 @@ class Transaction(Base):
         )
 
 
+class LedgerEntry(Base):
+    """
+    Represents a transaction on user's accounts - there is an entry for each user participating in the transaction
+    (both sender and recipient of funds transfer), so that user's transactions' history can be read with a single
+    index range scan.
+    """
+
+    __tablename__ = "ledger_entries"
+
+    user_id = sa.Column(sa.Integer, sa.ForeignKey("users.id"), primary_key=True)
+    # no foreign key - partitions of old months' transactions can be detached (and archived) on their own
+    transaction_id = sa.Column(sa.Integer, primary_key=True)
+    # copies of transaction's fields (history is sorted by them)
+    date = sa.Column(sa.DateTime, nullable=False)
+    amount = sa.Column(DECIMAL)
+
+    __table_args__ = (
+        sa.Index("ix_ledger_entries_user_id_date_transaction_id", "user_id", "date", "transaction_id"),
+        sa.Index("ix_ledger_entries_user_id_amount_transaction_id", "user_id", "amount", "transaction_id"),
+    )
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} user_id={self.user_id} transaction_id={self.transaction_id} "
+            f"date={self.date} amount={self.amount}>"
+        )
+
+
+class ServiceRevenueMonthly(Base):
+    """
+    Revenue from each service per month - rollup updated along with each payment to company
+    (used by monthly accounting reports).
+    """
+
+    __tablename__ = "service_revenue_monthly"
+
+    period = sa.Column(sa.Date, primary_key=True)  # first day of the month
+    service_id = sa.Column(sa.Integer, sa.ForeignKey("services.id"), primary_key=True)
+    revenue = sa.Column(DECIMAL, nullable=False, default=0)
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} period={self.period} service_id={self.service_id} revenue={self.revenue}>"
+        )
+
+
+class IdempotencyKey(Base):
+    """Responses of the transactions performed with 'Idempotency-Key' header (to be replayed on retries)"""
+
+    __tablename__ = "idempotency_keys"
+
+    key = sa.Column(sa.String(255), primary_key=True)
+    request_hash = sa.Column(sa.String(64), nullable=False)
+    response = sa.Column(sa.Text, nullable=True)  # empty while the request is being processed
+    created_at = sa.Column(sa.DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} key={self.key} created_at={self.created_at}>"
+
+
+# a partitioned table created by create_all() has no partitions at all - transactions land in the default partition
+# until monthly partitions are created (see commands/partitions.py, which moves them to their partitions)
+event.listen(
+    Transaction.__table__,
+    "after_create",
+    sa.DDL("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT"),
+)
+
+# backref attributes (e.g. Transaction.order, OrderItem.service) are set up here so that they can be used in
+# eager loading options
+configure_mappers()
+
 Base.metadata.create_all(engine)  # TODO: to substitute with migrations
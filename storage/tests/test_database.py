@@ -0,0 +1,40 @@
+import time
+
+from storage.database import ReplicaRouter
+
+
+PRIMARY, FIRST_REPLICA, SECOND_REPLICA = "primary", "first replica", "second replica"
+
+
+def test_replica_router_takes_replicas_in_turn():
+    replica_router = ReplicaRouter(PRIMARY, [FIRST_REPLICA, SECOND_REPLICA], read_your_writes_seconds=10)
+
+    assert [replica_router.get_sessionmaker([1]) for _ in range(3)] == [FIRST_REPLICA, SECOND_REPLICA, FIRST_REPLICA]
+
+
+def test_replica_router_reads_recent_writes_from_primary():
+    replica_router = ReplicaRouter(PRIMARY, [FIRST_REPLICA], read_your_writes_seconds=10)
+
+    replica_router.mark_written([1, 2])
+
+    assert replica_router.get_sessionmaker([1]) == PRIMARY
+    assert replica_router.get_sessionmaker([3, 2]) == PRIMARY
+    assert replica_router.get_sessionmaker([3]) == FIRST_REPLICA
+    assert replica_router.get_sessionmaker() == FIRST_REPLICA
+
+
+def test_replica_router_reads_from_replicas_once_they_catch_up():
+    replica_router = ReplicaRouter(PRIMARY, [FIRST_REPLICA], read_your_writes_seconds=0.01)
+    replica_router.mark_written([1])
+
+    time.sleep(0.02)
+
+    assert replica_router.get_sessionmaker([1]) == FIRST_REPLICA
+
+
+def test_replica_router_without_replicas_reads_from_primary():
+    replica_router = ReplicaRouter(PRIMARY, [], read_your_writes_seconds=10)
+
+    replica_router.mark_written([1])
+
+    assert replica_router.get_sessionmaker([1]) == replica_router.get_sessionmaker([2]) == PRIMARY
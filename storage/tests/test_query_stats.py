@@ -0,0 +1,68 @@
+import json
+import logging
+
+import pytest
+import sqlalchemy as sa
+
+from settings import settings
+from storage.database import Session
+from storage.query_stats import QueryStats, request_query_stats, slow_queries_logger
+
+
+@pytest.fixture
+def query_stats() -> QueryStats:
+    # statements of the engine's first connection (dialect initialization) are not the ones tests count
+    with Session() as session:
+        session.execute(sa.text("SELECT 1"))
+
+    query_stats = QueryStats(request="GET /test")
+    request_query_stats_token = request_query_stats.set(query_stats)
+    yield query_stats
+    request_query_stats.reset(request_query_stats_token)
+
+
+def test_query_stats_keep_slowest_statement():
+    query_stats = QueryStats()
+
+    query_stats.add("SELECT 1", 0.002)
+    query_stats.add("SELECT 2", 0.005)
+    query_stats.add("SELECT 3", 0.001)
+
+    assert query_stats.count == 3
+    assert query_stats.total_seconds == pytest.approx(0.008)
+    assert (query_stats.slowest_statement, query_stats.slowest_seconds) == ("SELECT 2", 0.005)
+    assert query_stats.to_server_timing_header() == 'db;dur=8.00;desc="3 queries", db-slowest;dur=5.00'
+
+
+def test_statements_are_collected_within_request(query_stats):
+    with Session() as session:
+        session.execute(sa.text("SELECT 1"))
+        session.execute(sa.text("SELECT 2"))
+
+    assert query_stats.count == 2
+    assert query_stats.slowest_statement in ("SELECT 1", "SELECT 2")
+
+
+def test_failed_statements_are_not_collected(query_stats):
+    with Session() as session:
+        with pytest.raises(sa.exc.ProgrammingError):
+            session.execute(sa.text("SELECT * FROM no_such_table"))
+        session.rollback()
+        session.execute(sa.text("SELECT 1"))
+
+    assert (query_stats.count, query_stats.slowest_statement) == (1, "SELECT 1")
+
+
+def test_slow_statements_are_logged(query_stats, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_SECONDS", 0.0)
+    # slow queries logger doesn't propagate its records to the root logger (caplog's handler is attached to)
+    monkeypatch.setattr(slow_queries_logger, "handlers", [caplog.handler])
+    monkeypatch.setattr(slow_queries_logger, "level", logging.WARNING)
+
+    with Session() as session:
+        session.execute(sa.text("SELECT pg_sleep(0.01)"))
+
+    slow_queries = [json.loads(record.getMessage()) for record in caplog.records]
+    assert slow_queries[-1]["statement"] == "SELECT pg_sleep(0.01)"
+    assert slow_queries[-1]["request"] == "GET /test"
+    assert slow_queries[-1]["duration_ms"] >= 10